@@ -0,0 +1,69 @@
+"""
+Synthetic HTML in the shapes the MangaHere scraper parses
+
+Real pages carry a lot of markup around the few elements the scraper needs (navigation, ads, comments, scripts),
+so every document is padded with similar boilerplate to keep parsing costs realistic.
+"""
+
+BOILERPLATE_BLOCKS = 150
+
+
+def _boilerplate(blocks=BOILERPLATE_BLOCKS):
+    block = ('<div class="ad_box"><ul class="nav">{links}</ul><p class="comment">Lorem ipsum dolor sit amet, '
+             'consectetur adipiscing elit <a href="/user/{n}">user{n}</a> <span class="time">{n} hours ago</span>'
+             '</p><script type="text/javascript">var slot{n} = {{"id": {n}, "size": [300, 250]}};</script></div>')
+    links = ''.join('<li><a href="/directory/{n}/">Genre {n}</a></li>'.format(n=n) for n in range(10))
+    return ''.join(block.format(links=links, n=n) for n in range(blocks))
+
+
+def _document(body, title='MangaHere'):
+    return ('<!DOCTYPE html><html><head><title>{title}</title><meta charset="utf-8">'
+            '<link rel="stylesheet" href="/media/css/style.css"></head><body>'
+            '<div class="header">{header}</div>{body}<div class="footer">{footer}</div></body></html>'
+            .format(title=title, header=_boilerplate(10), body=body, footer=_boilerplate()))
+
+
+def search_page(base_url, title='Test Series', chapter_count=100, results=10):
+    """
+    A search results page, listing the requested series first
+    :rtype : str
+    """
+    entries = []
+    for index in range(results):
+        name = title if index == 0 else '{title} Side Story {index}'.format(title=title, index=index)
+        slug = name.lower().replace(' ', '_')
+        entries.append('<dl><dt><a class="name_one" href="{base}/manga/{slug}/">{name}</a>'
+                       '<a class="name_two" href="{base}/manga/{slug}/">Ch.{count}</a></dt>'
+                       '<dd>Alternative Name:{name} Alt; {name} Other</dd></dl>'
+                       .format(base=base_url, slug=slug, name=name, count=chapter_count))
+    return _document('<div class="result_search">{entries}</div>'.format(entries=''.join(entries)))
+
+
+def toc_page(base_url, slug='test_series', chapter_count=100):
+    """
+    A series table of contents, newest chapter first
+    :rtype : str
+    """
+    items = ''.join('<li><span class="left"><a class="color_0077" href="{base}/manga/{slug}/c{n:03d}/">'
+                    'Test Series {n}</a><span class="mr6"></span> Chapter title {n}</span>'
+                    '<span class="right">Jan {day}, 2015</span></li>'
+                    .format(base=base_url, slug=slug, n=n, day=n % 28 + 1)
+                    for n in range(chapter_count, 0, -1))
+    return _document('<div class="manga_detail">{detail}</div><div class="detail_list"><ul>{items}</ul></div>'
+                     .format(detail=_boilerplate(20), items=items))
+
+
+def chapter_page(base_url, slug='test_series', chapter=1, page=1, page_count=40):
+    """
+    A chapter reader page, with the page selector and the page image
+    :rtype : str
+    """
+    options = ''.join('<option value="{base}/manga/{slug}/c{chapter:03d}/{n}.html"{selected}>{n}</option>'
+                      .format(base=base_url, slug=slug, chapter=chapter, n=n,
+                              selected=' selected="selected"' if n == page else '')
+                      for n in range(1, page_count + 1))
+    return _document('<div class="go_page clearfix"><span class="left">Page</span><span class="right">'
+                     '<select class="wid60">{options}</select></span></div>'
+                     '<section class="read_img" id="viewer"><a href="#"><img id="image" '
+                     'src="{base}/store/{slug}/c{chapter:03d}/{page}.jpg" width="800"></a></section>'
+                     .format(options=options, base=base_url, slug=slug, chapter=chapter, page=page))
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the MangaHere HTML parsing paths
+
+Times each parse step (search results, table of contents, page selector, page image) for every installed parser
+backend, with full-tree and restricted (subtree only) parsing.
+
+Usage: python benchmarks/parse_bench.py [--fixtures DIR] [--repeat N]
+
+DIR may hold saved pages named search.html, toc.html, chapter.html and page.html; synthetic fixtures are used for
+any that are missing.
+"""
+import os
+import sys
+import argparse
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fixtures
+from mangadl.scrapers import parsing
+from mangadl.scrapers.sites.mangahere import MangaHere
+
+BASE_URL = 'http://localhost'
+
+
+def load_fixtures(directory=None):
+    """
+    Load saved HTML fixtures, generating any that are missing
+    :rtype : dict of (str, bytes)
+    """
+    documents = {
+        'search': fixtures.search_page(BASE_URL),
+        'toc': fixtures.toc_page(BASE_URL, chapter_count=500),
+        'chapter': fixtures.chapter_page(BASE_URL),
+        'page': fixtures.chapter_page(BASE_URL, page=2),
+    }
+    documents = {name: html.encode('utf-8') for name, html in documents.items()}
+
+    if directory:
+        for name in documents:
+            path = os.path.join(directory, name + '.html')
+            if os.path.isfile(path):
+                with open(path, 'rb') as file:
+                    documents[name] = file.read()
+    return documents
+
+
+def steps(documents):
+    """
+    Return the parse steps to time, each as a (name, document, callable) tuple
+    """
+    series = MangaHere.SeriesMeta(BASE_URL + '/manga/test_series/', 'Test Series')
+    chapter = MangaHere.ChapterMeta(BASE_URL + '/manga/test_series/c001/', 'Test', '1', series)
+    page = MangaHere.PageMeta(BASE_URL + '/manga/test_series/c001/2.html', '2', chapter)
+
+    def parse_toc(content):
+        series._chapters.clear()
+        series._parse_chapters(content)
+
+    def parse_pages(content):
+        chapter._pages.clear()
+        chapter._parse_pages(content)
+
+    return [
+        ('search', documents['search'], MangaHere._parse_search),
+        ('toc', documents['toc'], parse_toc),
+        ('chapter', documents['chapter'], parse_pages),
+        ('page', documents['page'], page._parse_image),
+    ]
+
+
+def main():
+    arguments = argparse.ArgumentParser(description='MangaHere parsing micro-benchmark')
+    arguments.add_argument('--fixtures', help='Directory of saved HTML pages')
+    arguments.add_argument('--repeat', type=int, default=20, help='Parses per measurement')
+    options = arguments.parse_args()
+
+    documents = load_fixtures(options.fixtures)
+    print('{step:<8} {size:>9} {parser:<12} {mode:<10} {ms:>9}'.format(
+        step='step', size='bytes', parser='parser', mode='mode', ms='ms/parse'))
+
+    for parser_name in parsing.available_parsers():
+        for restricted in (False, True):
+            parsing.configure(parser_name, restricted)
+            for name, content, parse in steps(documents):
+                seconds = min(timeit.repeat(lambda: parse(content), number=options.repeat, repeat=3))
+                print('{step:<8} {size:>9} {parser:<12} {mode:<10} {ms:>9.2f}'.format(
+                    step=name, size=len(content), parser=parser_name,
+                    mode='restricted' if restricted else 'full', ms=seconds / options.repeat * 1000))
+
+
+if __name__ == '__main__':
+    main()
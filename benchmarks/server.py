@@ -0,0 +1,288 @@
+"""
+Local stand-in for the MangaHere site
+
+Serves synthetic search, table of contents, chapter and page HTML (see fixtures.py) along with JPEG page images, with
+configurable latency, bandwidth and error injection, so MangaDL can be exercised end to end without the live site.
+
+Usage: python benchmarks/server.py [--port PORT] [--latency SECONDS] [--bandwidth BYTES] [--error-rate RATE]
+"""
+import io
+import re
+import hashlib
+import time
+import random
+import argparse
+import threading
+from functools import lru_cache
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from PIL import Image
+
+import fixtures
+
+# Bytes written per bandwidth throttling step
+WRITE_CHUNK_SIZE = 16 * 1024
+
+TOC_PATH = re.compile(r'^/manga/(?P<slug>\w+)/$')
+CHAPTER_PATH = re.compile(r'^/manga/(?P<slug>\w+)/c(?P<chapter>\d+)/(?:(?P<page>\d+)\.html)?$')
+IMAGE_PATH = re.compile(r'^/store/(?P<slug>\w+)/c(?P<chapter>\d+)/(?P<page>\d+)\.jpg$')
+RANGE_HEADER = re.compile(r'^bytes=(?P<start>\d+)-$')
+
+
+def jpeg_payload(width=800, height=1200, quality=85, seed=0):
+    """
+    Generate a page sized JPEG image
+    The image is blurred noise, which compresses to about the size of a real scanned page
+    :rtype : bytes
+    """
+    rng = random.Random(seed)
+    noise = bytes(rng.getrandbits(8) for _ in range((width // 8) * (height // 8)))
+    image = Image.frombytes('L', (width // 8, height // 8), noise).resize((width, height), Image.BILINEAR)
+    output = io.BytesIO()
+    image.convert('RGB').save(output, 'JPEG', quality=quality)
+    return output.getvalue()
+
+
+class StandInServer:
+    """
+    Threaded HTTP server posing as MangaHere
+    """
+    def __init__(self, host='127.0.0.1', port=0, chapter_count=10, page_count=20, latency=0.0, bandwidth=0,
+                 error_rate=0.0, image=None, seed=0, backoff_rate=0.0, retry_after=1):
+        """
+        Initialize a new Stand-in Server instance
+        :param chapter_count: Number of chapters every series has
+        :type  chapter_count: int
+
+        :param page_count: Number of pages every chapter has
+        :type  page_count: int
+
+        :param latency: Seconds to wait before answering each request
+        :type  latency: float
+
+        :param bandwidth: Bytes per second each connection is limited to, or 0 for no limit
+        :type  bandwidth: int
+
+        :param error_rate: Fraction of image transfers to cut off partway through
+        :type  error_rate: float
+
+        :param image: The JPEG served for every page, generated if not given
+        :type  image: bytes or None
+
+        :param backoff_rate: Fraction of requests to answer with 429 Too Many Requests
+        :type  backoff_rate: float
+
+        :param retry_after: Retry-After seconds sent along with the 429 responses
+        :type  retry_after: int
+        """
+        self.chapter_count = chapter_count
+        self.page_count = page_count
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.backoff_rate = backoff_rate
+        self.retry_after = retry_after
+        self.image = image or jpeg_payload(seed=seed)
+        self.image_etag = '"{digest}"'.format(digest=hashlib.sha1(self.image).hexdigest())
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'bytes': 0, 'errors': 0, 'backoffs': 0}
+
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        """
+        Base URL of the server
+        :rtype : str
+        """
+        host, port = self._server.server_address[:2]
+        return 'http://{host}:{port}'.format(host=host, port=port)
+
+    @property
+    def search_url(self):
+        """
+        URL to point the MangaHere scraper's searches at
+        :rtype : str
+        """
+        return self.url + '/search.php'
+
+    def start(self):
+        """
+        Serve requests in a background thread
+        :rtype : StandInServer
+        """
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """
+        Serve requests in the current thread until interrupted
+        """
+        try:
+            self._server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._server.server_close()
+
+    def stop(self):
+        """
+        Shut the server down
+        """
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _count(self, sent=0, error=False, backoff=False):
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats['bytes'] += sent
+            self.stats['errors'] += int(error)
+            self.stats['backoffs'] += int(backoff)
+
+    def _chance(self, rate):
+        if not rate:
+            return False
+        with self._lock:
+            return self._random.random() < rate
+
+    @lru_cache(maxsize=256)
+    def _document(self, kind, *args):
+        if kind == 'search':
+            return fixtures.search_page(self.url, args[0], self.chapter_count).encode('utf-8')
+        if kind == 'toc':
+            return fixtures.toc_page(self.url, args[0], self.chapter_count).encode('utf-8')
+        slug, chapter, page = args
+        return fixtures.chapter_page(self.url, slug, chapter, page, self.page_count).encode('utf-8')
+
+    def _route(self, path):
+        """
+        Return the document for an HTML request path
+        :rtype : bytes or None
+        """
+        url = urlparse(path)
+        if url.path == '/search.php':
+            return self._document('search', parse_qs(url.query).get('name', ['Test Series'])[0])
+
+        match = TOC_PATH.match(url.path)
+        if match:
+            return self._document('toc', match.group('slug'))
+
+        match = CHAPTER_PATH.match(url.path)
+        if match and int(match.group('chapter')) <= self.chapter_count:
+            page = int(match.group('page') or 1)
+            if page <= self.page_count:
+                return self._document('chapter', match.group('slug'), int(match.group('chapter')), page)
+        return None
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                if server.latency:
+                    time.sleep(server.latency)
+
+                if server._chance(server.backoff_rate):
+                    self.send_response(429)
+                    self.send_header('Retry-After', str(server.retry_after))
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return server._count(backoff=True)
+
+                if IMAGE_PATH.match(self.path):
+                    return self._send_image()
+
+                body = server._route(self.path)
+                if body is None:
+                    self.send_error(404)
+                    return server._count()
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                server._count(self._write(body))
+
+            def _send_image(self):
+                body = server.image
+                start = 0
+                etag = server.image_etag
+                match = RANGE_HEADER.match(self.headers.get('Range', ''))
+                if_range = self.headers.get('If-Range')
+                if match and (if_range is None or if_range == etag):
+                    start = int(match.group('start'))
+                    if start >= len(body):
+                        self.send_response(416)
+                        self.send_header('Content-Range', 'bytes */{size}'.format(size=len(body)))
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return server._count()
+                    self.send_response(206)
+                    self.send_header('Content-Range', 'bytes {start}-{end}/{size}'.format(
+                        start=start, end=len(body) - 1, size=len(body)))
+                else:
+                    self.send_response(200)
+                self.send_header('Content-Type', 'image/jpeg')
+                self.send_header('Accept-Ranges', 'bytes')
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', str(len(body) - start))
+                self.end_headers()
+
+                # Cut the transfer off halfway through, as a dropped connection would
+                if server._chance(server.error_rate):
+                    sent = self._write(body[start:start + (len(body) - start) // 2])
+                    self.close_connection = True
+                    return server._count(sent, error=True)
+                server._count(self._write(body[start:]))
+
+            def _write(self, body):
+                if not server.bandwidth:
+                    self.wfile.write(body)
+                    return len(body)
+
+                for offset in range(0, len(body), WRITE_CHUNK_SIZE):
+                    chunk = body[offset:offset + WRITE_CHUNK_SIZE]
+                    self.wfile.write(chunk)
+                    self.wfile.flush()
+                    time.sleep(len(chunk) / server.bandwidth)
+                return len(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    arguments = argparse.ArgumentParser(description='Local MangaHere stand-in server')
+    arguments.add_argument('--host', default='127.0.0.1')
+    arguments.add_argument('--port', type=int, default=8080)
+    arguments.add_argument('--chapters', type=int, default=10, help='Chapters per series')
+    arguments.add_argument('--pages', type=int, default=20, help='Pages per chapter')
+    arguments.add_argument('--latency', type=float, default=0.0, help='Seconds before each response')
+    arguments.add_argument('--bandwidth', type=int, default=0, help='Bytes per second per connection (0 = unlimited)')
+    arguments.add_argument('--error-rate', type=float, default=0.0, help='Fraction of image transfers to cut off')
+    arguments.add_argument('--backoff-rate', type=float, default=0.0, help='Fraction of requests to answer with 429')
+    options = arguments.parse_args()
+
+    server = StandInServer(options.host, options.port, options.chapters, options.pages, options.latency,
+                           options.bandwidth, options.error_rate, backoff_rate=options.backoff_rate)
+    print('Serving on {url} (search URL: {search_url})'.format(url=server.url, search_url=server.search_url))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
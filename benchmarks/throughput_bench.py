@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+End-to-end throughput benchmark against a local MangaHere stand-in
+
+Starts the stand-in server (server.py), points the MangaHere scraper at it and drives Manga.search,
+Manga.download_chapter and CLI.create_pdf against a throwaway library, reporting pages/s, bytes/s, p50 / p99 page
+latency and peak RSS. Nothing touches the live site or the real user configuration.
+
+Usage: python benchmarks/throughput_bench.py [--chapters N] [--pages N] [--latency SECONDS] [--bandwidth BYTES]
+                                             [--error-rate RATE] [--workers N] [--engine threads|async] [--json]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import resource
+import argparse
+import tempfile
+import threading
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import StandInServer
+
+
+def percentile(values, percent):
+    """
+    Return the nearest-rank percentile of a list of values
+    :rtype : float
+    """
+    if not values:
+        return 0.0
+    values = sorted(values)
+    rank = max(1, int(round(percent / 100 * len(values))))
+    return values[min(rank, len(values)) - 1]
+
+
+def peak_rss():
+    """
+    Return the peak resident set size of this process and of its (PDF worker) children, in bytes
+    :rtype : tuple of (int, int)
+    """
+    # ru_maxrss is reported in kilobytes on Linux, but in bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale)
+
+
+@contextmanager
+def quiet(enabled=True):
+    """
+    Silence the progress bars and console output of the code being measured
+    """
+    if not enabled:
+        yield
+        return
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = os.dup(1), os.dup(2)
+    with open(os.devnull, 'w') as devnull:
+        os.dup2(devnull.fileno(), 1)
+        os.dup2(devnull.fileno(), 2)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(saved[0], 1)
+        os.dup2(saved[1], 2)
+        os.close(saved[0])
+        os.close(saved[1])
+
+
+def configure(root, options):
+    """
+    Point MangaDL's configuration, cache and data directories at a throwaway location and write a configuration
+    """
+    os.environ['XDG_CONFIG_HOME'] = os.path.join(root, 'config')
+    os.environ['XDG_CACHE_HOME'] = os.path.join(root, 'cache')
+    os.environ['XDG_DATA_HOME'] = os.path.join(root, 'data')
+
+    from mangadl.config import Config
+    manga_dir = os.path.join(root, 'Manga')
+    os.makedirs(manga_dir)
+    Config().app_config_create({
+        'Paths': {'manga_dir': manga_dir, 'series_dir': '{series}', 'chapter_dir': '[Chapter {chapter}] - {title}',
+                  'page_filename': 'page-{page}.{ext}'},
+        'Common': {'sites': 'MangaHere', 'synonyms': True, 'throttle': 0, 'workers': options.workers,
+                   'prefetch': options.workers * 2, 'host_limit': options.host_limit, 'timeout': 30,
+                   'search_timeout': 15,
+                   'pdf_jobs': options.pdf_jobs, 'dedupe': str(options.dedupe), 'storage': options.storage,
+                   'parser': '', 'engine': options.engine, 'async_concurrency': options.async_concurrency,
+                   'debug': False},
+        'Cache': {'size': 100, 'toc_ttl': 600, 'chapter_ttl': 2592000, 'image_ttl': 86400},
+        'Metrics': {'json_path': '', 'textfile_path': ''},
+        'Scheduler': {'jobs': 4, 'site_jobs': 2},
+        'RateLimit': {'min_rate': 0.2, 'max_rate': options.max_rate, 'burst': 4},
+    })
+
+
+class TransferTimer:
+    """
+    Records the latency and size of every page image transfer attempt
+    """
+    def __init__(self, download):
+        self._download = download
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.bytes = 0
+
+    def __call__(self, url, path, *args, **kwargs):
+        start = time.perf_counter()
+        written = 0
+        try:
+            written = self._download(url, path, *args, **kwargs)
+            return written
+        finally:
+            self._record(start, written)
+
+    def wrap_async(self, download):
+        """
+        Time the transfers of the async engine's download coroutine as well
+        """
+        async def timed(engine, url, path, *args, **kwargs):
+            start = time.perf_counter()
+            written = 0
+            try:
+                written = await download(engine, url, path, *args, **kwargs)
+                return written
+            finally:
+                self._record(start, written)
+        return timed
+
+    def _record(self, start, written):
+        # Failed attempts count too, they're part of the latency tail
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.latencies.append(elapsed)
+            self.bytes += written
+
+
+def run(options):
+    """
+    Run the benchmark and return its results
+    :rtype : dict
+    """
+    root = tempfile.mkdtemp(prefix='mangadl-bench-')
+    try:
+        configure(root, options)
+
+        from mangadl import transport, metrics
+        from mangadl.cli import CLI
+        from mangadl.manga import Manga, SeriesMeta
+        from mangadl.scrapers.sites.mangahere import MangaHere
+
+        server = StandInServer(chapter_count=options.chapters, page_count=options.pages, latency=options.latency,
+                               bandwidth=options.bandwidth, error_rate=options.error_rate,
+                               backoff_rate=options.backoff_rate)
+        MangaHere.SEARCH_URL = server.search_url
+        timer = TransferTimer(transport.download)
+        if options.engine == 'async':
+            # Without aiohttp the engine hands its downloads to transport.download, which mustn't be timed twice
+            from mangadl.scrapers import AsyncEngine
+            AsyncEngine.download = timer.wrap_async(AsyncEngine.download)
+        else:
+            transport.download = timer
+
+        results = {'chapters': options.chapters, 'pages': options.chapters * options.pages}
+        with server, quiet(not options.verbose):
+            manga = Manga()
+
+            start = time.perf_counter()
+            series = manga.search('Benchmark Series')
+            chapters = list(series.chapters.values())
+            results['search_seconds'] = time.perf_counter() - start
+
+            manga.create_series(series)
+            local = SeriesMeta(series.title)
+
+            start = time.perf_counter()
+            for chapter in chapters:
+                manga.download_chapter(chapter, local)
+            results['download_seconds'] = time.perf_counter() - start
+
+            # Answers to the series selection, chapter / series and reverse order prompts
+            answers = iter(['1', 'chapter', 'N'])
+            import mangadl.cli
+            mangadl.cli.prompt.query = lambda *args, **kwargs: next(answers)
+
+            start = time.perf_counter()
+            CLI().create_pdf()
+            results['pdf_seconds'] = time.perf_counter() - start
+
+        results['pages_per_second'] = results['pages'] / results['download_seconds']
+        results['bytes'] = timer.bytes
+        results['bytes_per_second'] = timer.bytes / results['download_seconds']
+        results['page_latency_p50'] = percentile(timer.latencies, 50)
+        results['page_latency_p99'] = percentile(timer.latencies, 99)
+        results['server_requests'] = server.stats['requests']
+        results['injected_errors'] = server.stats['errors']
+        results['injected_backoffs'] = server.stats['backoffs']
+        results['peak_rss'], results['peak_rss_children'] = peak_rss()
+        results['metrics'] = metrics.summary()
+        return results
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def report(results):
+    """
+    Print the results in a human readable form
+    """
+    mib = 1024 * 1024
+    print('Chapters / pages     {chapters} / {pages}'.format(**results))
+    print('Search               {:.3f} s'.format(results['search_seconds']))
+    print('Download             {:.3f} s'.format(results['download_seconds']))
+    print('  pages/s            {:.1f}'.format(results['pages_per_second']))
+    print('  bytes/s            {:.2f} MiB/s ({:.1f} MiB total)'.format(results['bytes_per_second'] / mib,
+                                                                        results['bytes'] / mib))
+    print('  page latency p50   {:.1f} ms'.format(results['page_latency_p50'] * 1000))
+    print('  page latency p99   {:.1f} ms'.format(results['page_latency_p99'] * 1000))
+    print('  requests / errors  {server_requests} / {injected_errors} (429s: {injected_backoffs})'.format(**results))
+    print('PDF creation         {:.3f} s'.format(results['pdf_seconds']))
+    print('Peak RSS             {:.1f} MiB (PDF workers {:.1f} MiB)'.format(results['peak_rss'] / mib,
+                                                                             results['peak_rss_children'] / mib))
+
+
+def main():
+    arguments = argparse.ArgumentParser(description='MangaDL end-to-end throughput benchmark')
+    arguments.add_argument('--chapters', type=int, default=5, help='Chapters in the series')
+    arguments.add_argument('--pages', type=int, default=20, help='Pages per chapter')
+    arguments.add_argument('--latency', type=float, default=0.02, help='Seconds before each response')
+    arguments.add_argument('--bandwidth', type=int, default=0, help='Bytes per second per connection (0 = unlimited)')
+    arguments.add_argument('--error-rate', type=float, default=0.0, help='Fraction of image transfers to cut off')
+    arguments.add_argument('--backoff-rate', type=float, default=0.0, help='Fraction of requests to answer with 429')
+    arguments.add_argument('--workers', type=int, default=4, help='Common.workers')
+    arguments.add_argument('--host-limit', type=int, default=4, help='Common.host_limit')
+    arguments.add_argument('--pdf-jobs', type=int, default=os.cpu_count() or 1, help='Common.pdf_jobs')
+    arguments.add_argument('--storage', choices=('files', 'packed'), default='files', help='Common.storage')
+    arguments.add_argument('--dedupe', action='store_true', help='Enable Common.dedupe')
+    arguments.add_argument('--engine', choices=('threads', 'async'), default='threads', help='Common.engine')
+    arguments.add_argument('--async-concurrency', type=int, default=100, help='Common.async_concurrency')
+    arguments.add_argument('--max-rate', type=float, default=1000, help='RateLimit.max_rate (requests/s per host)')
+    arguments.add_argument('--json', action='store_true', help='Print the results as JSON')
+    arguments.add_argument('--verbose', action='store_true', help='Show MangaDL\'s own output while running')
+    options = arguments.parse_args()
+
+    results = run(options)
+    if options.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+    else:
+        report(results)
+
+
+if __name__ == '__main__':
+    main()
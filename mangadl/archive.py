@@ -0,0 +1,284 @@
+import io
+import os
+import mmap
+import shutil
+import struct
+import logging
+import zipfile
+import threading
+from collections import OrderedDict
+
+# Name of the per-chapter archive used by the packed storage mode
+PACKED_FILENAME = 'pages.cbz'
+
+# Size and layout of a ZIP local file header
+LOCAL_HEADER = struct.Struct('<4sHHHHHIIIHH')
+
+# Number of archive readers (and memory maps) kept open at once
+MAX_OPEN_READERS = 8
+
+_write_locks = {}
+_write_locks_lock = threading.Lock()
+
+# Open archive readers, keyed by path, least recently used first
+_readers = OrderedDict()
+_readers_lock = threading.Lock()
+
+
+def is_packed(path):
+    """
+    Check whether a page path refers to a page inside a packed chapter archive
+    Packed pages are addressed as <chapter directory>/pages.cbz/<page filename>
+    :param path: Filesystem path to the page
+    :type  path: str
+
+    :rtype : bool
+    """
+    return os.path.basename(os.path.dirname(path)) == PACKED_FILENAME
+
+
+def open_page(path):
+    """
+    Open a page image for reading, whether it's a loose file or packed in a chapter archive
+    :param path: Filesystem path to the page
+    :type  path: str
+
+    :rtype : file
+    """
+    if is_packed(path):
+        archive_path, name = os.path.split(path)
+        return io.BytesIO(ArchiveReader.open(archive_path).read(name))
+    return open(path, 'rb')
+
+
+def create_cbz(page_paths, cbz_path):
+    """
+    Write a stored (uncompressed) CBZ archive, streaming the page images in without re-encoding them
+    :param page_paths: Filesystem paths to the page images, in order
+    :type  page_paths: iterable of str
+
+    :param cbz_path: Filesystem path to write the archive to
+    :type  cbz_path: str
+
+    :return: The number of pages written
+    :rtype : int
+    """
+    temp_path = cbz_path + '.part'
+    count = 0
+    try:
+        with zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_STORED) as archive:
+            for count, page_path in enumerate(page_paths, 1):
+                # Prefix the pages with their position, so readers sorting by name keep the requested order
+                name = '{index:05d}-{name}'.format(index=count, name=os.path.basename(page_path))
+                with open_page(page_path) as page_file, archive.open(name, 'w') as member:
+                    shutil.copyfileobj(page_file, member)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    os.replace(temp_path, cbz_path)
+    return count
+
+
+class PackedChapter:
+    """
+    Writer for the per-chapter page archive used by the packed storage mode
+
+    Downloaded pages are kept as loose files until they're packed, and the archive is only ever replaced as a whole,
+    so an interrupted run leaves a readable archive plus the loose pages it hadn't packed yet
+    """
+    def __init__(self, chapter_path):
+        """
+        Initialize a new Packed Chapter instance
+        :param chapter_path: Filesystem path to the chapter directory
+        :type  chapter_path: str
+        """
+        self.log = logging.getLogger('manga-dl.archive')
+        self.path = os.path.join(chapter_path, PACKED_FILENAME)
+        with _write_locks_lock:
+            self._lock = _write_locks.setdefault(self.path, threading.Lock())
+
+    def names(self):
+        """
+        Return the names of the pages in the archive
+        :raises: zipfile.BadZipFile if the archive is damaged
+        :rtype : set of str
+        """
+        if not os.path.isfile(self.path):
+            return set()
+        return set(ArchiveReader.open(self.path).names())
+
+    def page_path(self, name):
+        """
+        Return the path a packed page is addressed by
+        :param name: The page filename
+        :type  name: str
+
+        :rtype : str
+        """
+        return os.path.join(self.path, name)
+
+    def discard(self):
+        """
+        Move a damaged archive out of the way, so the chapter can be downloaded again
+        :return: The path the archive was moved to
+        :rtype : str
+        """
+        corrupt_path = self.path + '.corrupt'
+        with self._lock:
+            ArchiveReader.release(self.path)
+            os.replace(self.path, corrupt_path)
+        self.log.warning('Moved the damaged page archive {path} aside'.format(path=corrupt_path))
+        return corrupt_path
+
+    def pack(self, page_paths):
+        """
+        Move downloaded page images into the archive
+        The archive is rebuilt in a temporary file and then swapped into place, pages already in the archive under
+        the same name are replaced
+        :param page_paths: Filesystem paths to the downloaded page images, stored under their filenames
+        :type  page_paths: list of str
+
+        :return: The number of pages packed
+        :rtype : int
+        """
+        if not page_paths:
+            return 0
+
+        names = {os.path.basename(page_path): page_path for page_path in page_paths}
+        temp_path = self.path + '.part'
+        with self._lock:
+            try:
+                with zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_STORED) as archive:
+                    if os.path.isfile(self.path):
+                        reader = ArchiveReader.open(self.path)
+                        for name in reader.names():
+                            if name not in names:
+                                archive.writestr(reader.info(name), reader.read(name))
+                    for name, page_path in names.items():
+                        archive.write(page_path, name)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+
+            # An open memory map of the old archive would keep it alive, and on Windows stop it being replaced
+            ArchiveReader.release(self.path)
+            os.replace(temp_path, self.path)
+
+        # Only drop the loose pages once the archive holding them is in place
+        for page_path in names.values():
+            os.remove(page_path)
+        return len(names)
+
+
+class ArchiveReader:
+    """
+    Memory mapped, random access reader for stored page archives
+    """
+    def __init__(self, path):
+        """
+        Initialize a new Archive Reader instance
+        :param path: Filesystem path to the archive
+        :type  path: str
+        """
+        self.path = path
+        with open(path, 'rb') as file:
+            try:
+                self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files can't be mapped
+                raise zipfile.BadZipFile('{path} is empty'.format(path=path))
+        try:
+            with zipfile.ZipFile(self._map) as archive:
+                self._entries = {info.filename: info for info in archive.infolist()}
+        except BaseException:
+            self._map.close()
+            raise
+
+    @staticmethod
+    def open(path):
+        """
+        Return a (cached) reader for the current version of an archive
+        :param path: Filesystem path to the archive
+        :type  path: str
+
+        :rtype : ArchiveReader
+
+        :raises: zipfile.BadZipFile if the archive is empty or damaged
+        """
+        mtime = os.stat(path).st_mtime_ns
+        with _readers_lock:
+            cached = _readers.get(path)
+            if cached and cached[0] == mtime:
+                _readers.move_to_end(path)
+                return cached[1]
+
+            reader = ArchiveReader(path)
+            if cached:
+                cached[1].close()
+            _readers[path] = (mtime, reader)
+            while len(_readers) > MAX_OPEN_READERS:
+                _readers.popitem(last=False)[1][1].close()
+            return reader
+
+    @staticmethod
+    def release(path):
+        """
+        Close the cached reader of an archive, before the archive is replaced or moved
+        :param path: Filesystem path to the archive
+        :type  path: str
+        """
+        with _readers_lock:
+            cached = _readers.pop(path, None)
+        if cached:
+            cached[1].close()
+
+    def close(self):
+        """
+        Unmap the archive
+        """
+        self._map.close()
+
+    def names(self):
+        """
+        Return the names of the entries in the archive
+        :rtype : list of str
+        """
+        return list(self._entries)
+
+    def info(self, name):
+        """
+        Return the ZIP header of an entry
+        :type  name: str
+        :rtype : zipfile.ZipInfo
+        """
+        return self._entries[name]
+
+    def size(self, name):
+        """
+        Return the size of an entry
+        :type  name: str
+        :rtype : int
+        """
+        return self._entries[name].file_size
+
+    def read(self, name):
+        """
+        Read an entry straight out of the memory map
+        :param name: The entry name
+        :type  name: str
+
+        :rtype : bytes
+        """
+        info = self._entries[name]
+        if info.compress_type != zipfile.ZIP_STORED:
+            with zipfile.ZipFile(self._map) as archive:
+                return archive.read(info)
+
+        header = LOCAL_HEADER.unpack_from(self._map, info.header_offset)
+        name_length, extra_length = header[9], header[10]
+        start = info.header_offset + LOCAL_HEADER.size + name_length + extra_length
+        return self._map[start:start + info.file_size]
+
@@ -0,0 +1,372 @@
+import sys
+import json
+import logging
+import argparse
+from os import path, makedirs, cpu_count
+from clint.textui import puts, colored
+from mangadl import metrics
+from mangadl.config import Config
+from mangadl.pdf import create_pdfs
+from mangadl.scheduler import UpdateScheduler
+from mangadl.manga import Manga, SeriesMeta, NoSearchResultsError, ImageResourceUnavailableError, \
+    MangaAlreadyExistsError
+
+# Exit codes
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_NOT_CONFIGURED = 3
+EXIT_NOT_FOUND = 4
+
+
+class BatchCLI:
+    """
+    Non-interactive command line interface, for scripted and unattended runs
+    Never prompts; results are reported through the exit code and, optionally, as JSON on stdout
+    """
+    def __init__(self):
+        """
+        Initialize a new Batch CLI instance
+        """
+        self.log = logging.getLogger('manga-dl.batch')
+        self.config = Config()
+        self.manga = None
+        self.options = None
+
+    @staticmethod
+    def parser():
+        """
+        Build the argument parser
+        :rtype : argparse.ArgumentParser
+        """
+        parser = argparse.ArgumentParser(prog='manga-dl', description='MangaDL, run without arguments for the '
+                                                                      'interactive interface')
+        commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+        commands.required = True
+
+        # Options every command takes
+        common = argparse.ArgumentParser(add_help=False)
+        common.add_argument('--json', action='store_true', help='print the results as JSON on stdout')
+        common.add_argument('-q', '--quiet', action='store_true', help='only report errors')
+
+        download = commands.add_parser('download', parents=[common], help='download a new series')
+        download.add_argument('title', help='title of the series to search for')
+        download.add_argument('--chapters', metavar='RANGE', type=chapter_range,
+                              help='chapters to download, e.g. "100-", "1-10" or "1,3,5-7"')
+        download.add_argument('--force', action='store_true', help='overwrite pages that already exist')
+
+        update = commands.add_parser('update', parents=[common],
+                                     help='download new chapters and missing pages of saved series')
+        update.add_argument('series', nargs='*', help='titles of the saved series to update')
+        update.add_argument('--all', action='store_true', help='update every saved series')
+        update.add_argument('--chapters', metavar='RANGE', type=chapter_range, help='only update these chapters')
+        update.add_argument('--jobs', type=int, help='number of chapters to update at once, across all series '
+                                                     '(default: Scheduler.jobs)')
+
+        pdf = commands.add_parser('pdf', parents=[common], help='create PDFs of saved series')
+        pdf.add_argument('series', nargs='*', help='titles of the saved series')
+        pdf.add_argument('--all', action='store_true', help='create PDFs for every saved series')
+        pdf.add_argument('--mode', choices=('chapter', 'series'), default='chapter',
+                         help='one PDF per chapter, or one for the entire series')
+        pdf.add_argument('--reverse', action='store_true', help='add the pages in reverse order')
+        pdf.add_argument('--jobs', type=int, help='number of PDFs to build at once')
+
+        commands.add_parser('list', parents=[common], help='list saved series')
+        return parser
+
+    def run(self, argv):
+        """
+        Run a command
+        :param argv: Command line arguments, without the program name
+        :type  argv: list of str
+
+        :return: The exit code
+        :rtype : int
+        """
+        try:
+            self.options = self.parser().parse_args(argv)
+        except SystemExit as e:
+            return e.code
+
+        if not self.config.app_config_exists():
+            self._error('MangaDL has not been set up yet, run manga-dl without arguments first')
+            return EXIT_NOT_CONFIGURED
+
+        if self.options.command in ('update', 'pdf') and not (self.options.series or self.options.all):
+            self._error('Name the series to {command}, or pass --all'.format(command=self.options.command))
+            return EXIT_USAGE
+
+        self.config = self.config.app_config()
+        self.manga = Manga(quiet=True)
+
+        results = {'command': self.options.command}
+        try:
+            code = getattr(self, self.options.command)(results)
+        finally:
+            try:
+                metrics.export(self.config)
+            except OSError as e:
+                self.log.warning('Unable to export metrics', exc_info=e)
+
+        results['exit_code'] = code
+        if self.options.json:
+            results['metrics'] = metrics.summary()
+            print(json.dumps(results, indent=2))
+        return code
+
+    # Output
+    def _info(self, message):
+        if not (self.options.quiet or self.options.json):
+            puts(message)
+
+    def _error(self, message):
+        puts(colored.red(message), stream=sys.stderr.write)
+
+    # Commands
+    def download(self, results):
+        """
+        Download a new series
+        :return: The exit code
+        :rtype : int
+        """
+        # Pick up an interrupted download of the series if there is one, rather than searching for it again
+        resumed = self.manga.resume_title(self.options.title)
+        if resumed:
+            local_series, series = resumed
+            self._info('Resuming the interrupted download of {title}'.format(title=series.title))
+        else:
+            try:
+                series = self.manga.search(self.options.title)
+            except NoSearchResultsError:
+                self._error('No search results returned for {query}'.format(query=self.options.title))
+                results['series'] = [{'title': self.options.title, 'status': 'not_found', 'chapters': []}]
+                return EXIT_NOT_FOUND
+
+            try:
+                self.manga.create_series(series)
+                local_series = SeriesMeta(series.title)
+            except MangaAlreadyExistsError:
+                self.log.info('Series already exists, resuming it')
+                local_series = SeriesMeta(series.title)
+                self.manga.save_source(series, local_series)
+            series = self.manga.track(series, local_series)
+
+        result = self._sync(series, local_series, overwriting=self.options.force)
+        results['series'] = [result]
+        return EXIT_OK if result['status'] == 'ok' else EXIT_FAILED
+
+    def update(self, results):
+        """
+        Update saved series, several at once if requested
+        :return: The exit code
+        :rtype : int
+        """
+        local_series, missing = self._select_series()
+        results['series'] = [{'title': title, 'status': 'not_found', 'chapters': []} for title in missing]
+
+        chapter_filter = None
+        if self.options.chapters:
+            chapter_filter = lambda chapter: in_range(chapter, self.options.chapters)
+        scheduler = UpdateScheduler.from_config(self.manga, self.config, jobs=self.options.jobs,
+                                                chapter_filter=chapter_filter)
+        series_results = scheduler.run(local_series, self._chapter_finished)
+
+        for result in series_results:
+            if result['status'] == 'not_found':
+                self._error('No search results returned for {query} (the title may have been licensed or otherwise '
+                            'removed)'.format(query=result['title']))
+            elif result['status'] == 'unavailable':
+                self._error('{title}: no image resources appear to be available'.format(title=result['title']))
+            elif result.get('error'):
+                self._error('{title}: {error}'.format(title=result['title'], error=result['error']))
+        results['series'] += series_results
+
+        if missing:
+            return EXIT_NOT_FOUND
+        return EXIT_OK if all(result['status'] == 'ok' for result in results['series']) else EXIT_FAILED
+
+    def _chapter_finished(self, local_series, chapter_result):
+        """
+        Report on a chapter the update scheduler has finished with
+        """
+        if chapter_result['status'] == 'error':
+            self._error('{title} chapter {chapter}: {error}'.format(
+                title=local_series.title, chapter=chapter_result['chapter'], error=chapter_result['error']))
+        elif chapter_result['pages']:
+            self._info('{title} chapter {chapter}: {pages} pages downloaded'.format(
+                title=local_series.title, chapter=chapter_result['chapter'], pages=chapter_result['pages']))
+
+    def _sync(self, remote_series, local_series, overwriting):
+        """
+        Download the selected chapters of a series
+        :param remote_series: The series on the scraped site
+        :type  remote_series: MangaScraper.SeriesMeta
+
+        :param local_series: The saved series
+        :type  local_series: SeriesMeta
+
+        :param overwriting: Overwrite pages that already exist
+        :type  overwriting: bool
+
+        :rtype : dict
+        """
+        result = {'title': local_series.title, 'status': 'ok', 'chapters': []}
+        for chapter in list(remote_series.chapters.values()):
+            if self.options.chapters and not in_range(chapter.chapter, self.options.chapters):
+                continue
+
+            chapter_result = {'chapter': chapter.chapter, 'title': chapter.title, 'status': 'ok', 'pages': 0}
+            result['chapters'].append(chapter_result)
+            try:
+                chapter_result['pages'] = self.manga.download_chapter(chapter, local_series, overwriting)
+            except ImageResourceUnavailableError:
+                # The series was most likely licensed and removed, the remaining chapters won't fare any better
+                self._error('{title}: no image resources appear to be available'.format(title=local_series.title))
+                chapter_result['status'] = result['status'] = 'unavailable'
+                break
+            except AttributeError as e:
+                self.log.warning('An exception was raised downloading this chapter', exc_info=e)
+                chapter_result['status'] = 'skipped'
+            except Exception as e:
+                self.log.error('Uncaught exception thrown', exc_info=e)
+                self._error('{title} chapter {chapter}: {error}'.format(
+                    title=local_series.title, chapter=chapter.chapter, error=e))
+                chapter_result['status'] = result['status'] = 'error'
+                chapter_result['error'] = str(e)
+                continue
+
+            if chapter_result['pages']:
+                self._info('{title} chapter {chapter}: {pages} pages downloaded'.format(
+                    title=local_series.title, chapter=chapter.chapter, pages=chapter_result['pages']))
+
+        # Every chapter made it, so there's nothing left to resume. Otherwise the job is kept for the next run
+        if all(chapter_result['status'] == 'ok' for chapter_result in result['chapters']) and result['status'] == 'ok':
+            self.manga.finish(local_series)
+        return result
+
+    def pdf(self, results):
+        """
+        Create PDFs of saved series
+        :return: The exit code
+        :rtype : int
+        """
+        local_series, missing = self._select_series()
+        results['series'] = [{'title': title, 'status': 'not_found', 'pdfs': []} for title in missing]
+        jobs = self.options.jobs or self.config.getint('Common', 'pdf_jobs', fallback=cpu_count() or 1)
+
+        for manga in local_series:
+            result = {'title': manga.title, 'status': 'ok', 'pdfs': []}
+            results['series'].append(result)
+            makedirs(path.join(manga.path, 'PDF'), 0o755, True)
+
+            pdf_jobs = []
+            if self.options.mode == 'series':
+                page_paths = [page_path for chapter in list(manga.chapters.values())
+                              for page_path in chapter.pages.paths()]
+                pdf_jobs.append((None, page_paths, path.join(manga.path, 'PDF', manga.title + '.pdf')))
+            else:
+                for chapter in list(manga.chapters.values()):
+                    pdf_filename = 'Chapter {chapter}: {title}'.format(chapter=chapter.chapter, title=chapter.title)
+                    pdf_jobs.append((chapter, chapter.pages.paths(),
+                                     path.join(manga.path, 'PDF', pdf_filename + '.pdf')))
+            if self.options.reverse:
+                for chapter, page_paths, pdf_path in pdf_jobs:
+                    page_paths.reverse()
+
+            outcomes = create_pdfs([(page_paths, pdf_path) for chapter, page_paths, pdf_path in pdf_jobs], jobs)
+            for index, error in outcomes:
+                chapter, page_paths, pdf_path = pdf_jobs[index]
+                pdf_result = {'chapter': chapter.chapter if chapter else None, 'path': pdf_path, 'status': 'ok'}
+                result['pdfs'].append(pdf_result)
+                if error:
+                    self.log.error('Unable to create a PDF', exc_info=error)
+                    self._error('{title}: unable to create {path}: {error}'.format(
+                        title=manga.title, path=pdf_path, error=error))
+                    pdf_result['status'] = result['status'] = 'error'
+                    pdf_result['error'] = str(error)
+                    continue
+                self._info('PDF saved to {path}'.format(path=pdf_path))
+
+        if missing:
+            return EXIT_NOT_FOUND
+        return EXIT_OK if all(result['status'] == 'ok' for result in results['series']) else EXIT_FAILED
+
+    def list(self, results):
+        """
+        List saved series
+        :return: The exit code
+        :rtype : int
+        """
+        results['series'] = []
+        for manga in self.manga.all():
+            chapter_count = len(manga.chapters)
+            page_count = manga.page_count
+            results['series'].append({'title': manga.title, 'path': manga.path, 'chapters': chapter_count,
+                                      'pages': page_count})
+            self._info('{title} (Chapters: {chapters}, Pages: {pages})'.format(
+                title=manga.title, chapters=chapter_count, pages=page_count))
+        return EXIT_OK
+
+    def _select_series(self):
+        """
+        Resolve the series named on the command line (or all of them, with --all)
+        :return: The matching saved series, and the titles that didn't match anything
+        :rtype : tuple of (list of SeriesMeta, list of str)
+        """
+        saved = self.manga.all()
+        if self.options.all:
+            return saved, []
+
+        by_title = {manga.title.lower(): manga for manga in saved}
+        selected = []
+        missing = []
+        for title in self.options.series:
+            if title.lower() in by_title:
+                selected.append(by_title[title.lower()])
+            else:
+                self._error('No saved series named {title}'.format(title=title))
+                missing.append(title)
+        return selected, missing
+
+
+def chapter_range(spec):
+    """
+    Parse a chapter range specification, such as "100-", "-20", "1-10" or "1,3,5-7"
+    :param spec: The range specification
+    :type  spec: str
+
+    :return: Inclusive (low, high) bounds, either of which may be None for an open end
+    :rtype : list of (float or None, float or None)
+
+    :raises: argparse.ArgumentTypeError
+    """
+    ranges = []
+    try:
+        for part in spec.split(','):
+            part = part.strip()
+            if '-' in part:
+                low, high = part.split('-', 1)
+                ranges.append((float(low) if low else None, float(high) if high else None))
+            else:
+                ranges.append((float(part), float(part)))
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid chapter range: {spec}'.format(spec=spec))
+    return ranges
+
+
+def in_range(chapter, ranges):
+    """
+    Check whether a chapter number falls within any of the given ranges
+    :param chapter: The chapter number
+    :type  chapter: str
+
+    :param ranges: Ranges as returned by chapter_range
+    :type  ranges: list of (float or None, float or None)
+
+    :rtype : bool
+    """
+    try:
+        number = float(chapter)
+    except ValueError:
+        return False
+    return any((low is None or number >= low) and (high is None or number <= high) for low, high in ranges)
@@ -0,0 +1,268 @@
+import os
+import json
+import logging
+import hashlib
+import threading
+from time import time
+from collections import OrderedDict
+from mangadl import metrics
+
+
+class HttpCache:
+    """
+    Persistent, size bounded HTTP response cache with conditional revalidation
+    """
+    def __init__(self, path, max_size, session):
+        """
+        Initialize a new HTTP Cache instance
+        :param path: Directory to store cached responses in
+        :type  path: str
+
+        :param max_size: Maximum total size of the cached responses in bytes
+        :type  max_size: int
+
+        :param session: The HTTP session used to make requests
+        :type  session: requests.Session
+        """
+        self.log = logging.getLogger('manga-dl.http-cache')
+        self.path = path
+        self.max_size = max_size
+        self.session = session
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> body size, least recently used first
+        self._size = 0
+
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path, 0o750)
+        self._scan()
+
+    def _scan(self):
+        """
+        Rebuild the LRU order from the entries already on disk
+        """
+        entries = []
+        for filename in os.listdir(self.path):
+            if not filename.endswith('.json'):
+                continue
+            key = filename[:-len('.json')]
+            try:
+                accessed = os.path.getmtime(self._meta_path(key))
+                size = os.path.getsize(self._body_path(key))
+            except OSError:
+                continue
+            entries.append((accessed, key, size))
+
+        for accessed, key, size in sorted(entries):
+            self._entries[key] = size
+            self._size += size
+
+    def _meta_path(self, key):
+        return os.path.join(self.path, key + '.json')
+
+    def _body_path(self, key):
+        return os.path.join(self.path, key + '.body')
+
+    @staticmethod
+    def _key(url):
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def _load(self, key):
+        """
+        Load the metadata of a cached entry
+        :param key: The cache key
+        :type  key: str
+
+        :return: The entry metadata, or None if it isn't cached
+        :rtype : dict or None
+        """
+        if key not in self._entries:
+            return None
+
+        try:
+            with open(self._meta_path(key)) as meta_file:
+                return json.load(meta_file)
+        except (OSError, ValueError):
+            self._discard(key)
+            return None
+
+    def _touch(self, key, meta=None):
+        """
+        Mark an entry as most recently used, optionally rewriting its metadata
+        :param key: The cache key
+        :type  key: str
+
+        :param meta: Updated entry metadata
+        :type  meta: dict or None
+        """
+        if meta is not None:
+            self._write(self._meta_path(key), json.dumps(meta).encode('utf-8'))
+        else:
+            os.utime(self._meta_path(key))
+        self._entries.move_to_end(key)
+
+    def _store(self, key, meta, content):
+        """
+        Save a response body and its metadata, evicting old entries as needed
+        """
+        self._discard(key)
+        self._write(self._body_path(key), content)
+        self._write(self._meta_path(key), json.dumps(meta).encode('utf-8'))
+        self._entries[key] = len(content)
+        self._size += len(content)
+
+        while self._size > self.max_size and len(self._entries) > 1:
+            oldest = next(iter(self._entries))
+            self.log.debug('Evicting cached response: {key}'.format(key=oldest))
+            self._discard(oldest)
+
+    def _discard(self, key):
+        """
+        Remove an entry from the cache
+        :param key: The cache key
+        :type  key: str
+        """
+        self._size -= self._entries.pop(key, 0)
+        for path in (self._meta_path(key), self._body_path(key)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _write(path, data):
+        """
+        Atomically write a file
+        """
+        temp_path = '{path}.{pid}.{thread}.tmp'.format(path=path, pid=os.getpid(), thread=threading.get_ident())
+        with open(temp_path, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, path)
+
+    def get(self, url, ttl, **kwargs):
+        """
+        Retrieve a resource, answering from the cache while it is fresh and revalidating it once it's stale
+        :param url: The URL to request
+        :type  url: str
+
+        :param ttl: Number of seconds a cached response is used without revalidating it
+        :type  ttl: int
+
+        :rtype : requests.Response or CachedResponse
+        """
+        cached, conditional_headers = self.lookup(url, ttl)
+        if cached:
+            return cached
+
+        headers = dict(kwargs.pop('headers', None) or {})
+        headers.update(conditional_headers)
+        response = self.session.get(url, headers=headers, **kwargs)
+
+        if response.status_code == 304:
+            return self.revalidated(url) or response
+        if response.status_code == 200:
+            self.store(url, response.headers, response.content)
+        return response
+
+    def lookup(self, url, ttl):
+        """
+        Look up a cached resource
+        Requests made outside of get() (such as those of the async engine) go through lookup(), revalidated() and
+        store() themselves
+        :param url: The URL of the resource
+        :type  url: str
+
+        :param ttl: Number of seconds a cached response is used without revalidating it
+        :type  ttl: int
+
+        :return: The cached response if it is still fresh, otherwise None along with the headers that ask the server
+                 whether a stale copy is still current
+        :rtype : tuple of (CachedResponse or None, dict)
+        """
+        key = self._key(url)
+        with self._lock:
+            meta = self._load(key)
+            if not meta:
+                return None, {}
+
+            # Serve fresh responses straight from the cache
+            if time() - meta['stored'] < ttl:
+                self.log.debug('Cache hit: {url}'.format(url=url))
+                metrics.CACHE_REQUESTS.inc(result='hit')
+                self._touch(key)
+                return self._response(key, meta), {}
+
+        # Otherwise ask the server whether our copy is still current
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        return None, headers
+
+    def revalidated(self, url):
+        """
+        Mark a stale cached resource as current again, once the server answered its revalidation with a 304
+        :param url: The URL of the resource
+        :type  url: str
+
+        :return: The cached response, or None if it was evicted in the meantime
+        :rtype : CachedResponse or None
+        """
+        key = self._key(url)
+        with self._lock:
+            meta = self._load(key)
+            if not meta:
+                return None
+
+            self.log.debug('Cached response revalidated: {url}'.format(url=url))
+            metrics.CACHE_REQUESTS.inc(result='revalidated')
+            meta['stored'] = time()
+            self._touch(key, meta)
+            return self._response(key, meta)
+
+    def store(self, url, headers, content):
+        """
+        Cache a successful response
+        :param url: The URL of the resource
+        :type  url: str
+
+        :param headers: The response headers
+        :type  headers: collections.abc.Mapping
+
+        :param content: The response body
+        :type  content: bytes
+        """
+        meta = {'url': url, 'stored': time(), 'etag': headers.get('ETag'),
+                'last_modified': headers.get('Last-Modified')}
+        with self._lock:
+            metrics.CACHE_REQUESTS.inc(result='miss')
+            self._store(self._key(url), meta, content)
+
+    def _response(self, key, meta):
+        """
+        Build a response from a cached entry
+        :rtype : CachedResponse
+        """
+        with open(self._body_path(key), 'rb') as body_file:
+            return CachedResponse(meta['url'], body_file.read())
+
+
+class CachedResponse:
+    """
+    A response served from the HTTP cache
+    """
+    status_code = 200
+    from_cache = True
+
+    def __init__(self, url, content):
+        """
+        Initialize a new Cached Response instance
+        :param url: The URL of the cached resource
+        :type  url: str
+
+        :param content: The cached response body
+        :type  content: bytes
+        """
+        self.url = url
+        self.content = content
@@ -1,10 +1,15 @@
 import sys
 import logging
-from os import path, makedirs, execl
+from os import path, makedirs, execl, cpu_count
+from configparser import ConfigParser
 from clint.textui import puts, prompt, colored
-import img2pdf
 from mangadl.scrapers import ScraperManager
+from mangadl import metrics
 from mangadl.config import Config
+from mangadl.pdf import create_pdf, create_pdfs
+from mangadl.store import BlobStore
+from mangadl.archive import create_cbz, is_packed
+from mangadl.scheduler import UpdateScheduler
 from mangadl.manga import Manga, SeriesMeta, NoSearchResultsError, ImageResourceUnavailableError, MangaAlreadyExistsError
 
 
@@ -14,7 +19,8 @@ class CLI:
     YES_RESPONSES = ['y', 'yes', 'true']
     NO_RESPONSES = ['n', 'no', 'false']
 
-    PROMPT_ACTIONS = {'1': 'download', '2': 'update', '3': 'create_pdf', '4': 'list', 's': 'setup', 'e': 'exit'}
+    PROMPT_ACTIONS = {'1': 'download', '2': 'update', '3': 'create_pdf', '4': 'list', '5': 'dedupe',
+                      '6': 'create_cbz', 's': 'setup', 'e': 'exit'}
 
     def __init__(self):
         """
@@ -47,14 +53,17 @@ class CLI:
 
         return manga_list
 
-    def _manga_prompt(self, query='Which Manga title would you like to use?'):
+    def _manga_prompt(self, query='Which Manga title would you like to use?', allow_all=False):
         """
         Prompt the user to select a saved Manga entry
         :param query: The prompt query message
         :type  query: str
 
-        :return: The metadata instance of the selected Manga
-        :rtype : SeriesMeta
+        :param allow_all: Let the user answer "a" to select every saved Manga
+        :type  allow_all: bool
+
+        :return: The metadata instance of the selected Manga, or None if all of them were selected
+        :rtype : SeriesMeta or None
 
         :raises: NoMangaSavesError
         """
@@ -63,7 +72,10 @@ class CLI:
         # Prompt the user for the Manga title to update
         while True:
             try:
-                update_key = int(prompt.query(query))
+                response = prompt.query(query).strip().lower()
+                if allow_all and response == 'a':
+                    return None
+                update_key = int(response)
                 local_manga = manga_list[update_key - 1]
             except (ValueError, IndexError):
                 self.log.info('User provided invalid update input')
@@ -101,6 +113,8 @@ class CLI:
         puts('2. Update existing series')
         puts('3. Create PDF\'s from existing series')
         puts('4. List all tracked series\'')
+        puts('5. Deduplicate identical pages')
+        puts('6. Create CBZ\'s from existing series')
         puts('--------------------------------')
         puts('s. Re-run setup')
         puts('e. Exit\n')
@@ -114,7 +128,20 @@ class CLI:
 
         action = self.PROMPT_ACTIONS[action]
         action_method = getattr(self, action)
-        action_method()
+        try:
+            action_method()
+        finally:
+            self.export_metrics()
+
+    def export_metrics(self):
+        """
+        Write the metrics recorded so far to the configured JSON summary / Prometheus textfile
+        """
+        if isinstance(self.config, ConfigParser):
+            try:
+                metrics.export(self.config)
+            except OSError as e:
+                self.log.warning('Unable to export metrics', exc_info=e)
 
     def download(self):
         """
@@ -123,32 +150,42 @@ class CLI:
         title = prompt.query('What is the title of the Manga series?').strip()
         puts()
 
-        # Fetch all available chapters
-        try:
-            series = self.manga.search(title)
-        except NoSearchResultsError:
-            puts('No search results returned for {query}'.format(query=colored.blue(title, bold=True)))
-            if prompt.query('Exit?', 'Y').lower().strip() in self.YES_RESPONSES:
-                self.exit()
-            return
+        # Pick up an interrupted download of the series if there is one, rather than searching for it again
+        resumed = self.manga.resume_title(title)
+        if resumed:
+            manga, series = resumed
+            puts('Resuming the interrupted download of {title}'.format(title=colored.blue(series.title, bold=True)))
+        else:
+            # Fetch all available chapters
+            try:
+                series = self.manga.search(title)
+            except NoSearchResultsError:
+                puts('No search results returned for {query}'.format(query=colored.blue(title, bold=True)))
+                if prompt.query('Exit?', 'Y').lower().strip() in self.YES_RESPONSES:
+                    self.exit()
+                return
 
-        # Create the series
-        try:
-            self.manga.create_series(series)
-        except MangaAlreadyExistsError:
-            # Series already exists, prompt the user for confirmation to continue
-            puts('This Manga has already been downloaded')
-            continue_prompt = prompt.query('Do you still wish to continue and overwrite the series?', 'N')
-            if continue_prompt.lower().strip() not in self.YES_RESPONSES:
-                self.exit()
+            # Create the series
+            try:
+                self.manga.create_series(series)
+            except MangaAlreadyExistsError:
+                # Series already exists, prompt the user for confirmation to continue
+                puts('This Manga has already been downloaded')
+                continue_prompt = prompt.query('Do you still wish to continue and overwrite the series?', 'N')
+                if continue_prompt.lower().strip() not in self.YES_RESPONSES:
+                    self.exit()
+                self.manga.save_source(series, SeriesMeta(series.title))
+
+            manga = SeriesMeta(series.title)
+            series = self.manga.track(series, manga)
 
         # Print out the number of chapters to be downloaded
         chapter_count = len(series.chapters)
         puts('{count} chapters added to queue'.format(count=chapter_count))
 
         # Loop through our chapters and download_chapter them
+        failed = False
         for chapter_no, chapter in list(series.chapters.items()):
-            manga = SeriesMeta(series.title)
             try:
                 self.manga.download_chapter(chapter, manga)
             except ImageResourceUnavailableError:
@@ -160,31 +197,41 @@ class CLI:
             except AttributeError as e:
                 self.log.warn('An exception was raised downloading this chapter', exc_info=e)
                 puts('Chapter does not appear to have any readable pages, skipping')
+                failed = True
                 continue
             except Exception as e:
                 self.log.error('Uncaught exception thrown', exc_info=e)
+                failed = True
                 response = prompt.query('An unknown error occurred trying to download this chapter. Continue?', 'Y')
                 if response.lower().strip() in self.YES_RESPONSES:
                     continue
                 puts('Exiting')
                 break
+        else:
+            # Every chapter made it, so there's nothing left to resume. Otherwise the job is kept for the next run
+            if not failed:
+                self.manga.finish(manga)
 
     def update(self):
         """
         Update an existing Manga title
         """
         try:
-            local_manga = self._manga_prompt('Which Manga title would you like to update?')
+            local_manga = self._manga_prompt('Which Manga title would you like to update? (a for all)', True)
         except NoMangaSavesError:
             return
 
-        # Run a search query on the selected title
+        if local_manga is None:
+            return self._update_all()
+
+        # Load the series from where it was downloaded, searching for it if need be
         try:
-            remote_series = self.manga.search(local_manga.title)
+            remote_series = self.manga.resolve(local_manga)
         except NoSearchResultsError:
             return puts('No search results returned for {query} (the title may have been licensed or otherwise removed)'
                         .format(query=colored.blue(local_manga.title, bold=True)))
 
+        failed = False
         for remote_chapter in list(remote_series.chapters.values()):
             try:
                 self.manga.update(remote_chapter, local_manga)
@@ -197,14 +244,51 @@ class CLI:
             except AttributeError as e:
                 self.log.warn('An exception was raised downloading this chapter', exc_info=e)
                 puts('Chapter does not appear to have any readable pages, skipping')
+                failed = True
                 continue
             except Exception as e:
                 self.log.error('Uncaught exception thrown', exc_info=e)
+                failed = True
                 response = prompt.query('An unknown error occurred trying to download this chapter. Continue?', 'Y')
                 if response.lower().strip() in self.YES_RESPONSES:
                     continue
                 puts('Exiting')
                 break
+        else:
+            # Every chapter made it, so there's nothing left to resume. Otherwise the job is kept for the next run
+            if not failed:
+                self.manga.finish(local_manga)
+
+    def _update_all(self):
+        """
+        Update every saved Manga title at once
+        """
+        series_list = self.manga.all()
+        scheduler = UpdateScheduler.from_config(self.manga, self.config)
+        puts(colored.yellow('\nUpdating {count} series, {jobs} chapters at a time'.format(
+            count=len(series_list), jobs=scheduler.jobs)))
+
+        def chapter_finished(local_manga, chapter):
+            if chapter['status'] == 'error':
+                puts('{title} chapter {chapter}: an error occurred, skipping'.format(
+                    title=local_manga.title, chapter=chapter['chapter']))
+            elif chapter['pages']:
+                puts('{title} chapter {chapter}: {pages} pages downloaded'.format(
+                    title=local_manga.title, chapter=chapter['chapter'], pages=chapter['pages']))
+
+        # Progress bars from several chapters at once would only garble each other
+        self.manga.quiet = True
+        try:
+            results = scheduler.run(series_list, chapter_finished)
+        finally:
+            self.manga.quiet = False
+
+        for result in results:
+            if result['status'] == 'not_found':
+                puts('No search results returned for {query} (the title may have been licensed or otherwise removed)'
+                     .format(query=colored.blue(result['title'], bold=True)))
+            elif result['status'] == 'unavailable':
+                puts('{title}: no image resources for the pages appear to be available'.format(title=result['title']))
 
     def create_pdf(self):
         """
@@ -241,7 +325,7 @@ class CLI:
         if pdf_type == 'series':
             self.log.info('Retrieving a list of paths to all pages in all chapters')
             for chapter in list(manga.chapters.values()):
-                page_paths += [page.path for page in list(chapter.pages.values())]
+                page_paths += chapter.pages.paths()
             if reverse:
                 page_paths.reverse()
             page_count = len(page_paths)
@@ -254,33 +338,60 @@ class CLI:
             pdf_header = colored.yellow(pdf_header)
             puts(pdf_header.format(series=manga.title, chapter_count=chapter_count, page_count=page_count))
 
-            pdf = img2pdf.convert(page_paths)
             pdf_path = path.join(manga.path, 'PDF', manga.title + '.pdf')
-            pdf_file = open(pdf_path, 'wb')
-            pdf_file.write(pdf)
-            pdf_file.close()
+            makedirs(path.join(manga.path, 'PDF'), 0o755, True)
+            create_pdf(page_paths, pdf_path)
 
             puts('PDF created and saved successfully to {path}'.format(path=pdf_path))
             return
 
-        # Create individual PDFs for each chapter
+        # Queue up individual PDFs for each chapter
+        makedirs(path.join(manga.path, 'PDF'), 0o755, True)
+        pdf_jobs = []
         for chapter in list(manga.chapters.values()):
-            pdf_header = '\nCreating a PDF for Chapter {chapter}: {title}'
-            pdf_header = colored.yellow(pdf_header)
-            puts(pdf_header.format(chapter=chapter.chapter, title=chapter.title))
-
-            page_paths = [page.path for page in list(chapter.pages.values())]
+            page_paths = chapter.pages.paths()
             if reverse:
                 page_paths.reverse()
-            pdf = img2pdf.convert(page_paths)
             pdf_filename = 'Chapter {chapter}: {title}'.format(chapter=chapter.chapter, title=chapter.title)
             pdf_path = path.join(manga.path, 'PDF', pdf_filename + '.pdf')
-            makedirs(path.join(manga.path, 'PDF'), 0o755, True)
-            pdf_file = open(pdf_path, 'wb')
-            pdf_file.write(pdf)
-            pdf_file.close()
+            pdf_jobs.append((chapter, page_paths, pdf_path))
+
+        # Build them across a process pool, reporting each chapter as it finishes
+        jobs = self.config.getint('Common', 'pdf_jobs', fallback=cpu_count() or 1)
+        pdf_header = colored.yellow('\nCreating {count} chapter PDFs using {jobs} processes')
+        puts(pdf_header.format(count=len(pdf_jobs), jobs=jobs))
+
+        results = create_pdfs([(page_paths, pdf_path) for chapter, page_paths, pdf_path in pdf_jobs], jobs)
+        for finished, (index, error) in enumerate(results, 1):
+            chapter, page_paths, pdf_path = pdf_jobs[index]
+            progress = '[{finished}/{count}] Chapter {chapter}: {title}'.format(
+                finished=finished, count=len(pdf_jobs), chapter=chapter.chapter, title=chapter.title)
+            if error:
+                self.log.error('Unable to create a PDF for chapter {chapter}'.format(chapter=chapter.chapter),
+                               exc_info=error)
+                puts('{progress} - PDF could not be created'.format(progress=progress))
+                continue
+            puts('{progress} - PDF saved to {path}'.format(progress=progress, path=pdf_path))
 
-            puts('PDF created and saved successfully to {path}'.format(path=pdf_path))
+    def create_cbz(self):
+        """
+        Create CBZ archives for each chapter of a Manga series
+        """
+        try:
+            self.log.debug('Prompting the user for a Manga to create CBZ archives from')
+            manga = self._manga_prompt()
+        except NoMangaSavesError:
+            self.log.info('No Manga\'s available to create CBZ archives from')
+            return
+
+        makedirs(path.join(manga.path, 'CBZ'), 0o755, True)
+        for chapter in list(manga.chapters.values()):
+            page_paths = chapter.pages.paths()
+            cbz_filename = 'Chapter {chapter}: {title}'.format(chapter=chapter.chapter, title=chapter.title)
+            cbz_path = path.join(manga.path, 'CBZ', cbz_filename + '.cbz')
+            create_cbz(page_paths, cbz_path)
+
+            puts('CBZ created and saved successfully to {path}'.format(path=cbz_path))
 
     def list(self):
         """
@@ -302,7 +413,7 @@ class CLI:
             # Manga metadata
             manga_subheader = 'Chapters: {chapter_count}, Total pages: {page_count}'
             chapter_count = len(manga.chapters)
-            page_count = sum([len(chapter.pages) for chapter in list(manga.chapters.values())])
+            page_count = manga.page_count
             manga_subheader = manga_subheader.format(chapter_count=chapter_count, page_count=page_count)
             puts(manga_subheader)
 
@@ -315,6 +426,30 @@ class CLI:
         puts(colored.yellow('\nTotals:'))
         puts(total_counts.format(series=total_series_count, chapters=total_chapter_count, pages=total_page_count))
 
+    def dedupe(self):
+        """
+        Convert every page in the library to a link into the content addressed page store
+        """
+        store = BlobStore.open(self.config.get('Paths', 'manga_dir'))
+        manga_list = self.manga.all()
+
+        total_duplicates = 0
+        total_freed = 0
+        for manga in manga_list:
+            # Pages packed into chapter archives can't be linked individually
+            page_paths = [page_path for chapter in list(manga.chapters.values())
+                          for page_path in chapter.pages.paths() if not is_packed(page_path)]
+            duplicates, freed = store.dedupe(page_paths)
+            puts('{title}: {duplicates} duplicate pages'.format(title=manga.title, duplicates=duplicates))
+
+            total_duplicates += duplicates
+            total_freed += freed
+
+        removed = store.prune()
+        puts(colored.yellow('\nTotals:'))
+        puts('Duplicate pages: {duplicates}, Space freed: {freed:.1f} MB, Unused blobs removed: {removed}'
+             .format(duplicates=total_duplicates, freed=total_freed / 1024 / 1024, removed=removed))
+
     def setup(self, header=True):
         """
         Run setup tasks for MangaDL
@@ -374,6 +509,16 @@ class CLI:
         synonyms_enabled = prompt.query('Would you like to enable this functionality?', 'Y')
         synonyms_enabled = True if synonyms_enabled.lower().strip() in self.YES_RESPONSES else False
 
+        # Deduplication
+        puts('\nMangaDL can store identical pages (credits, banners, filler) only once and link them into each chapter')
+        dedupe_enabled = prompt.query('Would you like to enable this functionality?', 'N')
+        dedupe_enabled = True if dedupe_enabled.lower().strip() in self.YES_RESPONSES else False
+
+        # Storage mode
+        puts('\nMangaDL can pack the pages of each chapter into a single archive instead of keeping loose files')
+        storage = prompt.query('Would you like to enable this functionality?', 'N')
+        storage = 'packed' if storage.lower().strip() in self.YES_RESPONSES else 'files'
+
         # Paths
         series_dir = '{series}'
         chapter_dir = '[Chapter {chapter}] - {title}'
@@ -383,12 +528,12 @@ class CLI:
         debug_mode = prompt.query('\nWould you like to enable debug mode?', 'N')
         debug_mode = True if debug_mode.lower().strip() in self.YES_RESPONSES else False
 
-        # Define the configuration values
+        # Define the configuration values, everything else is written with its default
         config = {'Paths': {'manga_dir': manga_dir, 'series_dir': series_dir, 'chapter_dir': chapter_dir,
                             'page_filename': page_filename},
 
                   'Common': {'sites': ','.join(enabled_sites), 'synonyms': str(synonyms_enabled), 'debug': debug_mode,
-                             'throttle': 1}}
+                             'dedupe': str(dedupe_enabled), 'storage': storage}}
 
         Config().app_config_create(config)
         execl(sys.executable, *([sys.executable] + sys.argv))
@@ -1,7 +1,13 @@
+import os
+import threading
 from os import path, makedirs
 from configparser import ConfigParser, ExtendedInterpolation
 from appdirs import AppDirs
 
+# Parsed configuration files shared by the whole process, keyed by path
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
 
 class Config:
     """
@@ -9,9 +15,29 @@ class Config:
     """
     CONFIGS = (
         ('Paths', ('manga_dir', 'chapter_dir', 'series_dir', 'page_filename')),
-        ('Common', ('sites', 'synonyms', 'throttle', 'debug'))
+        ('Common', ('sites', 'synonyms', 'throttle', 'workers', 'prefetch', 'host_limit', 'timeout',
+                    'search_timeout', 'pdf_jobs', 'dedupe', 'storage', 'parser', 'engine', 'async_concurrency',
+                    'debug')),
+        ('Cache', ('size', 'toc_ttl', 'chapter_ttl', 'image_ttl')),
+        ('Metrics', ('json_path', 'textfile_path')),
+        ('Scheduler', ('jobs', 'site_jobs')),
+        ('RateLimit', ('min_rate', 'max_rate', 'burst'))
     )
 
+    # Values for settings that aren't given when the configuration is created, or that are missing or left empty in
+    # an existing configuration file
+    DEFAULTS = {
+        'Common': {'synonyms': 'True', 'throttle': 1, 'workers': 4, 'prefetch': 8, 'host_limit': 2, 'timeout': 30,
+                   'search_timeout': 15, 'pdf_jobs': os.cpu_count() or 1, 'dedupe': 'False', 'storage': 'files',
+                   'engine': 'threads', 'async_concurrency': 100, 'debug': 'False'},
+        'Cache': {'size': 100, 'toc_ttl': 600, 'chapter_ttl': 2592000, 'image_ttl': 86400},
+        'Scheduler': {'jobs': 4, 'site_jobs': 2},
+        'RateLimit': {'min_rate': 0.2, 'max_rate': 10, 'burst': 4}
+    }
+
+    APP_CONFIG_FILE = 'manga-dl.cfg'
+    SERIES_CONFIG_FILE = '.' + APP_CONFIG_FILE
+
     def __init__(self):
         """
         Initialize a new Config instance
@@ -24,16 +50,39 @@ class Config:
 
         # Set the path information
         self.app_config_dir = self.dirs.user_config_dir
-        self.app_config_file = "manga-dl.cfg"
+        self.app_config_file = self.APP_CONFIG_FILE
         self.app_config_path = path.join(self.app_config_dir, self.app_config_file)
 
     def app_config(self):
         """
         Return the application configuration
-        :rtype : ConfigParser
+        The configuration is a read-only snapshot shared by the whole process, and is only parsed again once the file
+        changes
+        :rtype : ConfigSnapshot
         """
-        self._app_config.read(self.app_config_path)
-        return self._app_config
+        return snapshot(self.app_config_path, ExtendedInterpolation, self.DEFAULTS)
+
+    @classmethod
+    def series_config_path(cls, series_path):
+        """
+        Return the path to the configuration file of a saved series
+        :param series_path: Filesystem path to the series
+        :type  series_path: str
+
+        :rtype : str
+        """
+        return path.join(series_path, cls.SERIES_CONFIG_FILE)
+
+    @classmethod
+    def series_config(cls, series_path):
+        """
+        Return the configuration of a saved series, as a shared read-only snapshot
+        :param series_path: Filesystem path to the series
+        :type  series_path: str
+
+        :rtype : ConfigSnapshot
+        """
+        return snapshot(cls.series_config_path(series_path))
 
     def app_config_exists(self):
         """
@@ -69,13 +118,101 @@ class Config:
             # Create config section
             self._app_config.add_section(section)
 
-            # Assign config settings
+            # Assign config settings, falling back to their defaults
+            defaults = self.DEFAULTS.get(section, {})
             for setting in settings:
-                self._app_config.set(section, setting, '')
+                self._app_config.set(section, setting, str(defaults.get(setting, '')))
 
         # Save all passed settings
         self._app_config.read_dict(config_dict)
 
         # Write and flush the default configuration
         self._app_config.write(self._app_cfgfile)
-        self._app_cfgfile.flush()
\ No newline at end of file
+        self._app_cfgfile.flush()
+        forget(self.app_config_path)
+        return self._app_config
+
+
+class ConfigSnapshot(ConfigParser):
+    """
+    Read-only, parsed configuration file
+    """
+    def __init__(self, config_path, interpolation=None, defaults=None):
+        """
+        Initialize a new Config Snapshot instance
+        :param config_path: Filesystem path to the configuration file, missing files load as empty
+        :type  config_path: str
+
+        :param interpolation: The interpolation class to use, or None for raw values
+        :type  interpolation: type or None
+
+        :param defaults: Values used for settings that are missing or left empty, keyed by section
+        :type  defaults: dict of (str, dict) or None
+        """
+        super().__init__(interpolation=interpolation() if interpolation else None)
+        ConfigParser.read(self, config_path)
+        self.interpolation_class = interpolation
+        self.defaults_map = defaults
+
+        # Files written before a setting had a default hold an empty value for it, which getint() and friends choke on
+        for section, values in (defaults or {}).items():
+            if not self.has_section(section):
+                ConfigParser.add_section(self, section)
+            for setting, value in values.items():
+                if not ConfigParser.get(self, section, setting, raw=True, fallback=''):
+                    ConfigParser.set(self, section, setting, str(value))
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('Configuration snapshots are read-only')
+
+    set = add_section = remove_section = remove_option = _read_only
+    read = read_file = read_string = read_dict = _read_only
+
+
+def _file_key(config_path):
+    """
+    Return what identifies the current version of a file on disk, or None if it doesn't exist
+    :rtype : tuple or None
+    """
+    try:
+        stat = os.stat(config_path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def snapshot(config_path, interpolation=None, defaults=None):
+    """
+    Return a shared snapshot of a configuration file, parsing it again only once it changes on disk
+    :param config_path: Filesystem path to the configuration file
+    :type  config_path: str
+
+    :param interpolation: The interpolation class to use, or None for raw values
+    :type  interpolation: type or None
+
+    :param defaults: Values used for settings that are missing or left empty, keyed by section
+    :type  defaults: dict of (str, dict) or None
+
+    :rtype : ConfigSnapshot
+    """
+    file_key = _file_key(config_path)
+    with _snapshots_lock:
+        cached = _snapshots.get(config_path)
+    if cached and cached[0] == file_key and cached[1].interpolation_class is interpolation \
+            and cached[1].defaults_map is defaults:
+        return cached[1]
+
+    config = ConfigSnapshot(config_path, interpolation, defaults)
+    with _snapshots_lock:
+        _snapshots[config_path] = (file_key, config)
+    return config
+
+
+def forget(config_path):
+    """
+    Drop the cached snapshot of a configuration file, after writing to it
+    :param config_path: Filesystem path to the configuration file
+    :type  config_path: str
+    """
+    with _snapshots_lock:
+        _snapshots.pop(config_path, None)
@@ -0,0 +1,303 @@
+import os
+import sqlite3
+import logging
+import threading
+from time import time
+from mangadl.config import Config
+from mangadl.scrapers import MangaScraper
+
+
+class JobQueue:
+    """
+    Durable record of the downloads in progress, so that interrupted runs can pick up where they left off
+
+    Each series being downloaded or updated gets a job holding its table of contents, the page list of every chapter
+    that was started and the resolved page images, along with which chapters and pages have been completed. A resumed
+    run rebuilds the remote series from the job instead of searching and scraping again, and skips everything that was
+    already completed. Jobs are removed once a run completes all of their chapters.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS series (
+            id         INTEGER PRIMARY KEY,
+            path       TEXT NOT NULL UNIQUE,
+            site       TEXT NOT NULL,
+            url        TEXT NOT NULL,
+            title      TEXT NOT NULL,
+            alt_titles TEXT NOT NULL,
+            created    REAL NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS chapters (
+            id        INTEGER PRIMARY KEY,
+            series_id INTEGER NOT NULL REFERENCES series (id) ON DELETE CASCADE,
+            position  INTEGER NOT NULL,
+            chapter   TEXT NOT NULL,
+            title     TEXT NOT NULL,
+            url       TEXT NOT NULL,
+            done      INTEGER NOT NULL DEFAULT 0,
+            UNIQUE (series_id, chapter)
+        );
+
+        CREATE TABLE IF NOT EXISTS pages (
+            id         INTEGER PRIMARY KEY,
+            chapter_id INTEGER NOT NULL REFERENCES chapters (id) ON DELETE CASCADE,
+            position   INTEGER NOT NULL,
+            page       TEXT NOT NULL,
+            url        TEXT NOT NULL,
+            image_url  TEXT,
+            done       INTEGER NOT NULL DEFAULT 0,
+            UNIQUE (chapter_id, page)
+        );
+    """
+
+    # Seconds to wait on another process holding the database lock
+    LOCK_TIMEOUT = 30
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, db_path):
+        """
+        Initialize a new Job Queue instance
+        :param db_path: Filesystem path to the job database
+        :type  db_path: str
+        """
+        self.log = logging.getLogger('manga-dl.jobs')
+        self.db_path = db_path
+
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(db_path, timeout=self.LOCK_TIMEOUT, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+
+        # Every change is committed in its own transaction, the write-ahead log keeps them atomic across crashes and
+        # lets other processes read while we write
+        self._db.execute('PRAGMA journal_mode = WAL')
+        self._db.execute('PRAGMA synchronous = NORMAL')
+        self._db.execute('PRAGMA foreign_keys = ON')
+        self._db.executescript(self.SCHEMA)
+
+    @classmethod
+    def open(cls):
+        """
+        Return the shared job queue, creating it on first use
+        :rtype : JobQueue
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                data_dir = Config().dirs.user_data_dir
+                if not os.path.isdir(data_dir):
+                    os.makedirs(data_dir, 0o750)
+                cls._instance = cls(os.path.join(data_dir, 'jobs.db'))
+            return cls._instance
+
+    def _chapter_id(self, series_path, chapter):
+        row = self._db.execute('SELECT chapters.id FROM chapters JOIN series ON series.id = chapters.series_id '
+                               'WHERE series.path = ? AND chapters.chapter = ?', (series_path, chapter)).fetchone()
+        return row['id'] if row else None
+
+    # Series
+    def track(self, series_path, series):
+        """
+        Start a job for a series, recording its table of contents
+        :param series_path: Filesystem path to the local series
+        :type  series_path: str
+
+        :param series: The remote series, its chapters are loaded if they haven't been already
+        :type  series: MangaScraper.SeriesMeta
+        """
+        chapters = list(series.chapters.values())
+        alt_titles = series.alt_titles
+        if isinstance(alt_titles, str):
+            alt_titles = [alt_titles]
+        elif not isinstance(alt_titles, (list, tuple)):
+            alt_titles = []
+
+        # Upserted rather than replaced, so another process tracking the same series keeps the progress it has made
+        with self._lock, self._db:
+            self._db.execute('INSERT INTO series (path, site, url, title, alt_titles, created) '
+                             'VALUES (?, ?, ?, ?, ?, ?) '
+                             'ON CONFLICT (path) DO UPDATE SET site = excluded.site, url = excluded.url, '
+                             'title = excluded.title, alt_titles = excluded.alt_titles',
+                             (series_path, series.site or '', series.url, series.title, '; '.join(alt_titles), time()))
+            series_id = self._db.execute('SELECT id FROM series WHERE path = ?', (series_path,)).fetchone()['id']
+            self._db.executemany('INSERT INTO chapters (series_id, position, chapter, title, url) '
+                                 'VALUES (?, ?, ?, ?, ?) '
+                                 'ON CONFLICT (series_id, chapter) DO UPDATE SET position = excluded.position, '
+                                 'title = excluded.title, url = excluded.url',
+                                 [(series_id, position, chapter.chapter, chapter.title, chapter.url)
+                                  for position, chapter in enumerate(chapters)])
+        self.log.info('Tracking {count} chapters of {title}'.format(count=len(chapters), title=series.title))
+
+    def restore(self, series_path, scrapers):
+        """
+        Rebuild the remote series of an interrupted job, without making any requests
+        :param series_path: Filesystem path to the local series
+        :type  series_path: str
+
+        :param scrapers: The available site scrapers, keyed by site name
+        :type  scrapers: collections.abc.Mapping
+
+        :return: The remote series, or None if there's no job for it (or its site is no longer available)
+        :rtype : MangaScraper.SeriesMeta or None
+        """
+        with self._lock:
+            row = self._db.execute('SELECT * FROM series WHERE path = ?', (series_path,)).fetchone()
+            if not row:
+                return None
+            chapter_rows = self._db.execute('SELECT * FROM chapters WHERE series_id = ? ORDER BY position',
+                                            (row['id'],)).fetchall()
+            page_rows = self._db.execute('SELECT pages.* FROM pages JOIN chapters ON chapters.id = pages.chapter_id '
+                                         'WHERE chapters.series_id = ? ORDER BY pages.position',
+                                         (row['id'],)).fetchall()
+
+        site_class = scrapers.get(row['site'])
+        if not site_class:
+            self.log.warning('The {site} scraper is no longer available, unable to resume'.format(site=row['site']))
+            return None
+
+        alt_titles = [title.strip() for title in row['alt_titles'].split(';') if title.strip()]
+        series = site_class.SeriesMeta(row['url'], row['title'], alt_titles)
+        series.site = row['site']
+
+        chapter_pages = {}
+        for page_row in page_rows:
+            chapter_pages.setdefault(page_row['chapter_id'], []).append(page_row)
+
+        chapters = []
+        for chapter_row in chapter_rows:
+            chapter = site_class.ChapterMeta(chapter_row['url'], chapter_row['title'], chapter_row['chapter'], series)
+            pages = []
+            for page_row in chapter_pages.get(chapter_row['id'], []):
+                page = site_class.PageMeta(page_row['url'], page_row['page'], chapter)
+                if page_row['image_url']:
+                    page.restore_image(MangaScraper.ImageMeta(page_row['image_url'], page))
+                pages.append(page)
+            if pages:
+                chapter.restore_pages(pages)
+            chapters.append(chapter)
+        series.restore_chapters(chapters)
+
+        self.log.info('Resuming {title} from {count} tracked chapters'.format(title=series.title,
+                                                                              count=len(chapters)))
+        return series
+
+    def finish(self, series_path):
+        """
+        Remove the job of a series, once a run has completed all of its chapters
+        :param series_path: Filesystem path to the local series
+        :type  series_path: str
+        """
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM series WHERE path = ?', (series_path,))
+
+    # Chapters
+    def chapter_done(self, series_path, chapter):
+        """
+        Check whether a chapter of a tracked series has been completed
+        :param series_path: Filesystem path to the local series
+        :type  series_path: str
+
+        :param chapter: The chapter number
+        :type  chapter: str
+
+        :rtype : bool
+        """
+        with self._lock:
+            row = self._db.execute('SELECT chapters.done FROM chapters JOIN series ON series.id = chapters.series_id '
+                                   'WHERE series.path = ? AND chapters.chapter = ?', (series_path, chapter)).fetchone()
+        return bool(row and row['done'])
+
+    def complete_chapter(self, series_path, chapter):
+        """
+        Mark a chapter of a tracked series as completed
+        :param series_path: Filesystem path to the local series
+        :type  series_path: str
+
+        :param chapter: The chapter number
+        :type  chapter: str
+        """
+        with self._lock, self._db:
+            chapter_id = self._chapter_id(series_path, chapter)
+            if chapter_id is not None:
+                self._db.execute('UPDATE chapters SET done = 1 WHERE id = ?', (chapter_id,))
+
+    # Pages
+    def record_pages(self, series_path, chapter):
+        """
+        Record the page list of a chapter, unless it already has been
+        :param series_path: Filesystem path to the local series
+        :type  series_path: str
+
+        :param chapter: The remote chapter, with its pages loaded
+        :type  chapter: MangaScraper.ChapterMeta
+        """
+        with self._lock, self._db:
+            chapter_id = self._chapter_id(series_path, chapter.chapter)
+            if chapter_id is None:
+                return
+            self._db.executemany('INSERT OR IGNORE INTO pages (chapter_id, position, page, url) VALUES (?, ?, ?, ?)',
+                                 [(chapter_id, position, page.page, page.url)
+                                  for position, page in enumerate(chapter.pages.values())])
+
+    def done_pages(self, series_path, chapter):
+        """
+        Return the pages of a chapter that have already been completed
+        :param series_path: Filesystem path to the local series
+        :type  series_path: str
+
+        :param chapter: The chapter number
+        :type  chapter: str
+
+        :rtype : set of str
+        """
+        with self._lock:
+            chapter_id = self._chapter_id(series_path, chapter)
+            if chapter_id is None:
+                return set()
+            rows = self._db.execute('SELECT page FROM pages WHERE chapter_id = ? AND done = 1', (chapter_id,))
+            return {row['page'] for row in rows}
+
+    def record_image(self, series_path, page):
+        """
+        Record the resolved image of a page
+        :param series_path: Filesystem path to the local series
+        :type  series_path: str
+
+        :param page: The remote page, with its image resolved
+        :type  page: MangaScraper.PageMeta
+        """
+        with self._lock, self._db:
+            chapter_id = self._chapter_id(series_path, page.chapter.chapter)
+            if chapter_id is not None:
+                self._db.execute('UPDATE pages SET image_url = ? WHERE chapter_id = ? AND page = ?',
+                                 (page.image.url, chapter_id, page.page))
+
+    def clear_image(self, series_path, page):
+        """
+        Forget the recorded image of a page, so a resumed run resolves it again
+        :param series_path: Filesystem path to the local series
+        :type  series_path: str
+
+        :param page: The remote page
+        :type  page: MangaScraper.PageMeta
+        """
+        with self._lock, self._db:
+            chapter_id = self._chapter_id(series_path, page.chapter.chapter)
+            if chapter_id is not None:
+                self._db.execute('UPDATE pages SET image_url = NULL WHERE chapter_id = ? AND page = ?',
+                                 (chapter_id, page.page))
+
+    def complete_page(self, series_path, page):
+        """
+        Mark a page of a tracked chapter as completed
+        :param series_path: Filesystem path to the local series
+        :type  series_path: str
+
+        :param page: The remote page
+        :type  page: MangaScraper.PageMeta
+        """
+        with self._lock, self._db:
+            chapter_id = self._chapter_id(series_path, page.chapter.chapter)
+            if chapter_id is not None:
+                self._db.execute('UPDATE pages SET done = 1 WHERE chapter_id = ? AND page = ?',
+                                 (chapter_id, page.page))
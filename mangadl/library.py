@@ -0,0 +1,355 @@
+import os
+import re
+import sqlite3
+import logging
+import threading
+from time import time
+from zipfile import BadZipFile
+from mangadl.config import Config
+from mangadl.archive import PACKED_FILENAME, ArchiveReader
+
+
+class LibraryIndex:
+    """
+    Persistent SQLite index of the series, chapters and pages in the local Manga library
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS series (
+            id              INTEGER PRIMARY KEY,
+            name            TEXT NOT NULL,
+            title_key       TEXT NOT NULL,
+            path            TEXT NOT NULL UNIQUE,
+            mtime           INTEGER,
+            config_mtime    INTEGER,
+            chapter_pattern TEXT NOT NULL,
+            page_pattern    TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS series_title_key ON series (title_key);
+
+        CREATE TABLE IF NOT EXISTS chapters (
+            id        INTEGER PRIMARY KEY,
+            series_id INTEGER NOT NULL REFERENCES series (id) ON DELETE CASCADE,
+            name      TEXT NOT NULL,
+            chapter   TEXT NOT NULL,
+            title     TEXT NOT NULL,
+            path      TEXT NOT NULL UNIQUE,
+            mtime     INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS chapters_series_id ON chapters (series_id);
+
+        CREATE TABLE IF NOT EXISTS pages (
+            id         INTEGER PRIMARY KEY,
+            chapter_id INTEGER NOT NULL REFERENCES chapters (id) ON DELETE CASCADE,
+            name       TEXT NOT NULL,
+            page       TEXT NOT NULL,
+            path       TEXT NOT NULL UNIQUE,
+            size       INTEGER NOT NULL,
+            mtime      INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS pages_chapter_id ON pages (chapter_id);
+    """
+
+    # Directory mtimes this recent (in seconds) aren't trusted, as more changes may land within the same tick
+    MTIME_SETTLE = 2
+
+    # Seconds to wait on another process holding the database lock
+    LOCK_TIMEOUT = 30
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, manga_path, db_path):
+        """
+        Initialize a new Library Index instance
+        :param manga_path: The root directory of the Manga library
+        :type  manga_path: str
+
+        :param db_path: Filesystem path to the index database
+        :type  db_path: str
+        """
+        self.log = logging.getLogger('manga-dl.library')
+        self.manga_path = manga_path
+        self.db_path = db_path
+
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(db_path, timeout=self.LOCK_TIMEOUT, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+
+        # Parallel batch and update runs share the index, the write-ahead log lets them read while another one writes
+        self._db.execute('PRAGMA journal_mode = WAL')
+        self._db.execute('PRAGMA synchronous = NORMAL')
+        self._db.execute('PRAGMA foreign_keys = ON')
+        self._db.executescript(self.SCHEMA)
+
+    @classmethod
+    def open(cls, manga_path):
+        """
+        Return the shared index for a Manga library, creating it on first use
+        :param manga_path: The root directory of the Manga library
+        :type  manga_path: str
+
+        :rtype : LibraryIndex
+        """
+        with cls._instances_lock:
+            if manga_path not in cls._instances:
+                data_dir = Config().dirs.user_data_dir
+                if not os.path.isdir(data_dir):
+                    os.makedirs(data_dir, 0o750)
+                cls._instances[manga_path] = cls(manga_path, os.path.join(data_dir, 'library.db'))
+            return cls._instances[manga_path]
+
+    def _settled_mtime(self, stat):
+        """
+        Return a directory mtime that can safely be compared against later, or None if it's too recent to trust
+        :type  stat: os.stat_result
+        :rtype : int or None
+        """
+        if time() - stat.st_mtime < self.MTIME_SETTLE:
+            return None
+        return stat.st_mtime_ns
+
+    def _root_prefix(self):
+        """
+        Return the query parameters matching paths inside this library, as every library shares one database
+        :return: The length of the prefix and the prefix itself
+        :rtype : tuple of (int, str)
+        """
+        prefix = os.path.join(self.manga_path, '')
+        return len(prefix), prefix
+
+    # Queries
+    def series(self):
+        """
+        Return all indexed series
+        :rtype : list of sqlite3.Row
+        """
+        with self._lock:
+            return self._db.execute('SELECT * FROM series WHERE substr(path, 1, ?) = ?', self._root_prefix()).fetchall()
+
+    def find_series(self, title):
+        """
+        Find an indexed series by its (case insensitive) title
+        :param title: The title of the series
+        :type  title: str
+
+        :rtype : sqlite3.Row or None
+        """
+        with self._lock:
+            return self._db.execute('SELECT * FROM series WHERE title_key = ? AND substr(path, 1, ?) = ?',
+                                    (title.lower(),) + self._root_prefix()).fetchone()
+
+    def chapters(self, series_id):
+        """
+        Return all indexed chapters of a series, along with the number of pages in each
+        :param series_id: The index ID of the series
+        :type  series_id: int
+
+        :rtype : list of sqlite3.Row
+        """
+        with self._lock:
+            return self._db.execute('SELECT chapters.*, COUNT(pages.id) AS page_count FROM chapters '
+                                    'LEFT JOIN pages ON pages.chapter_id = chapters.id '
+                                    'WHERE chapters.series_id = ? GROUP BY chapters.id', (series_id,)).fetchall()
+
+    def pages(self, chapter_id):
+        """
+        Return all indexed pages of a chapter
+        :param chapter_id: The index ID of the chapter
+        :type  chapter_id: int
+
+        :rtype : list of sqlite3.Row
+        """
+        with self._lock:
+            return self._db.execute('SELECT name, page, path FROM pages WHERE chapter_id = ?',
+                                    (chapter_id,)).fetchall()
+
+    # Reconciliation
+    def reconcile(self):
+        """
+        Bring the index in line with the library in a single pass over its root directory,
+        only re-listing series and chapter directories that have changed
+        """
+        self.log.info('Reconciling the library index against {path}'.format(path=self.manga_path))
+        seen = set()
+        with os.scandir(self.manga_path) as entries:
+            for entry in entries:
+                if entry.is_dir() and self.reconcile_series(entry.path, entry):
+                    seen.add(entry.path)
+
+        with self._lock, self._db:
+            for row in self._db.execute('SELECT id, path FROM series WHERE substr(path, 1, ?) = ?',
+                                        self._root_prefix()).fetchall():
+                if row['path'] not in seen:
+                    self.log.info('Removing series no longer in the library: {path}'.format(path=row['path']))
+                    self._db.execute('DELETE FROM series WHERE id = ?', (row['id'],))
+
+    def reconcile_series(self, path, entry=None):
+        """
+        Bring the index of a single series in line with the filesystem
+        :param path: Filesystem path to the series
+        :type  path: str
+
+        :param entry: The already resolved directory entry of the series, if available
+        :type  entry: os.DirEntry or None
+
+        :return: True if the path is a saved series, otherwise False
+        :rtype : bool
+        """
+        config_path = Config.series_config_path(path)
+        try:
+            stat = entry.stat() if entry else os.stat(path)
+            config_mtime = os.stat(config_path).st_mtime_ns
+        except OSError:
+            with self._lock, self._db:
+                self._db.execute('DELETE FROM series WHERE path = ?', (path,))
+            return False
+
+        with self._lock, self._db:
+            row = self._db.execute('SELECT * FROM series WHERE path = ?', (path,)).fetchone()
+
+            # (Re-)read the series configuration when it's new or has changed
+            if not row or row['config_mtime'] != config_mtime:
+                series_config = Config.series_config(path)
+                chapter_pattern = series_config.get('Patterns', 'chapter_pattern', raw=True)
+                page_pattern = series_config.get('Patterns', 'page_pattern', raw=True)
+                name = os.path.basename(path)
+
+                if row:
+                    self._db.execute('UPDATE series SET config_mtime = ?, chapter_pattern = ?, page_pattern = ?, '
+                                     'mtime = NULL WHERE id = ?',
+                                     (config_mtime, chapter_pattern, page_pattern, row['id']))
+                    self._db.execute('DELETE FROM chapters WHERE series_id = ?', (row['id'],))
+                else:
+                    self._db.execute('INSERT INTO series (name, title_key, path, config_mtime, chapter_pattern, '
+                                     'page_pattern) VALUES (?, ?, ?, ?, ?, ?)',
+                                     (name, name.lower(), path, config_mtime, chapter_pattern, page_pattern))
+                row = self._db.execute('SELECT * FROM series WHERE path = ?', (path,)).fetchone()
+
+            # Re-list the chapters only when the series directory has changed
+            if row['mtime'] is None or row['mtime'] != stat.st_mtime_ns:
+                self._scan_chapters(row, stat)
+
+            # Chapter directories change when pages are added or removed, so check each of them
+            for chapter in self._db.execute('SELECT * FROM chapters WHERE series_id = ?', (row['id'],)).fetchall():
+                self._reconcile_chapter(row, chapter)
+
+        return True
+
+    def _scan_chapters(self, series, stat):
+        """
+        Re-list the chapter directories of a series
+        :type  series: sqlite3.Row
+        :type  stat: os.stat_result
+        """
+        self.log.debug('Scanning chapters: {path}'.format(path=series['path']))
+        chapter_pattern = re.compile(series['chapter_pattern'])
+        known = {row['path']: row['id'] for row in
+                 self._db.execute('SELECT id, path FROM chapters WHERE series_id = ?', (series['id'],))}
+
+        found = set()
+        for name in os.listdir(series['path']):
+            match = chapter_pattern.match(name)
+            if not match:
+                continue
+            path = os.path.join(series['path'], name)
+            found.add(path)
+            if path not in known:
+                self._db.execute('INSERT INTO chapters (series_id, name, chapter, title, path) VALUES (?, ?, ?, ?, ?)',
+                                 (series['id'], name, match.group('chapter'), match.group('title'), path))
+
+        for path, chapter_id in known.items():
+            if path not in found:
+                self._db.execute('DELETE FROM chapters WHERE id = ?', (chapter_id,))
+
+        self._db.execute('UPDATE series SET mtime = ? WHERE id = ?', (self._settled_mtime(stat), series['id']))
+
+    def _reconcile_chapter(self, series, chapter):
+        """
+        Re-list the pages of a chapter if its directory has changed
+        :type  series: sqlite3.Row
+        :type  chapter: sqlite3.Row
+        """
+        try:
+            stat = os.stat(chapter['path'])
+        except OSError:
+            self._db.execute('DELETE FROM chapters WHERE id = ?', (chapter['id'],))
+            return
+
+        if chapter['mtime'] is not None and chapter['mtime'] == stat.st_mtime_ns:
+            return
+
+        self.log.debug('Scanning pages: {path}'.format(path=chapter['path']))
+        page_pattern = re.compile(series['page_pattern'])
+        self._db.execute('DELETE FROM pages WHERE chapter_id = ?', (chapter['id'],))
+        with os.scandir(chapter['path']) as entries:
+            for entry in entries:
+                if entry.name == PACKED_FILENAME:
+                    self._index_packed_pages(chapter, page_pattern, entry)
+                    continue
+
+                match = page_pattern.match(entry.name)
+                if not match:
+                    continue
+                try:
+                    page_stat = entry.stat()
+                except OSError:
+                    continue
+                self._db.execute('INSERT INTO pages (chapter_id, name, page, path, size, mtime) '
+                                 'VALUES (?, ?, ?, ?, ?, ?)',
+                                 (chapter['id'], entry.name, match.group('page'), entry.path, page_stat.st_size,
+                                  page_stat.st_mtime_ns))
+
+        self._db.execute('UPDATE chapters SET mtime = ? WHERE id = ?', (self._settled_mtime(stat), chapter['id']))
+
+    def _index_packed_pages(self, chapter, page_pattern, entry):
+        """
+        Index the pages stored in a packed chapter archive
+        :type  chapter: sqlite3.Row
+        :type  page_pattern: re.__Pattern
+        :type  entry: os.DirEntry
+        """
+        try:
+            mtime = entry.stat().st_mtime_ns
+            reader = ArchiveReader.open(entry.path)
+        except (OSError, BadZipFile):
+            self.log.warning('Unable to read packed chapter: {path}'.format(path=entry.path))
+            return
+
+        for name in reader.names():
+            match = page_pattern.match(name)
+            if not match:
+                continue
+            self._db.execute('INSERT INTO pages (chapter_id, name, page, path, size, mtime) '
+                             'VALUES (?, ?, ?, ?, ?, ?)',
+                             (chapter['id'], name, match.group('page'), os.path.join(entry.path, name),
+                              reader.size(name), mtime))
+
+    def index_chapter(self, series_path, chapter_path):
+        """
+        Index a single chapter directory, typically right after its pages were downloaded
+        :param series_path: Filesystem path to the series
+        :type  series_path: str
+
+        :param chapter_path: Filesystem path to the chapter
+        :type  chapter_path: str
+        """
+        with self._lock, self._db:
+            series = self._db.execute('SELECT * FROM series WHERE path = ?', (series_path,)).fetchone()
+            if not series:
+                return
+
+            match = re.match(series['chapter_pattern'], os.path.basename(chapter_path))
+            if not match:
+                return
+
+            chapter = self._db.execute('SELECT * FROM chapters WHERE path = ?', (chapter_path,)).fetchone()
+            if not chapter:
+                self._db.execute('INSERT INTO chapters (series_id, name, chapter, title, path) VALUES (?, ?, ?, ?, ?)',
+                                 (series['id'], os.path.basename(chapter_path), match.group('chapter'),
+                                  match.group('title'), chapter_path))
+                chapter = self._db.execute('SELECT * FROM chapters WHERE path = ?', (chapter_path,)).fetchone()
+            else:
+                self._db.execute('UPDATE chapters SET mtime = NULL WHERE id = ?', (chapter['id'],))
+                chapter = self._db.execute('SELECT * FROM chapters WHERE id = ?', (chapter['id'],)).fetchone()
+
+            self._reconcile_chapter(series, chapter)
@@ -1,15 +1,27 @@
 import os
 import platform
-from time import sleep
+from sys import intern
+from time import sleep, monotonic
 import logging
 import re
+import threading
+from functools import lru_cache, partial
 from collections import OrderedDict
-from urllib import request
-from urllib.error import ContentTooShortError
+from collections.abc import Mapping
+from queue import Queue, Empty, Full
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as SearchTimeoutError
+from contextlib import contextmanager
+from urllib.parse import urlparse
 from configparser import ConfigParser
+from zipfile import BadZipFile
 from clint.textui import puts, colored
 from progressbar import ProgressBar, Percentage, Bar, SimpleProgress, AdaptiveETA
-from mangadl.config import Config
+from mangadl import metrics
+from mangadl.config import Config, forget
+from mangadl.library import LibraryIndex
+from mangadl.jobs import JobQueue
+from mangadl.store import BlobStore
+from mangadl.archive import PackedChapter
 from mangadl.scrapers import ScraperManager
 
 
@@ -17,14 +29,20 @@ class Manga:
     """
     Manga downloading and updating services
     """
-    def __init__(self):
+    def __init__(self, quiet=False):
         """
         Initialize a new Manga instance
+        :param quiet: Don't print chapter headers and progress bars to the console
+        :type  quiet: bool
         """
         self.config = Config().app_config()
+        self.quiet = quiet
         self.log = logging.getLogger('manga-dl.manga')
         self._site_scrapers = ScraperManager().scrapers
-        self.throttle = self.config.getint('Common', 'throttle', fallback=1)
+        self.workers = max(1, self.config.getint('Common', 'workers', fallback=1))
+        self.prefetch = max(1, self.config.getint('Common', 'prefetch', fallback=self.workers * 2))
+        self.host_limiter = HostLimiter(self.config.getint('Common', 'host_limit', fallback=2))
+        self.search_timeout = self.config.getfloat('Common', 'search_timeout', fallback=15)
         self.progress_widget = [Percentage(), ' ', Bar(), ' Page: ', SimpleProgress(), ' ', AdaptiveETA()]
 
         # Define the directory / filename templates
@@ -33,6 +51,25 @@ class Manga:
         self.chapter_dir_template = self.config.get('Paths', 'chapter_dir')
         self.page_filename_template = self.config.get('Paths', 'page_filename')
 
+        # Local library index
+        self.library = LibraryIndex.open(self.manga_dir_template)
+
+        # Downloads in progress, for resuming interrupted runs
+        self.jobs = JobQueue.open()
+
+        # Page download engine, either the "threads" pool pipeline or the "async" event loop engine, and the number of
+        # requests the async engine keeps in flight
+        self.engine = self.config.get('Common', 'engine', fallback='threads') or 'threads'
+        self.async_concurrency = max(1, self.config.getint('Common', 'async_concurrency', fallback=100))
+
+        # Page storage mode, either loose "files" or "packed" into one archive per chapter
+        self.storage = self.config.get('Common', 'storage', fallback='files') or 'files'
+
+        # Content addressed page store, if enabled
+        self.blob_store = None
+        if self.config.getboolean('Common', 'dedupe', fallback=False):
+            self.blob_store = BlobStore.open(self.manga_dir_template)
+
     @staticmethod
     def natural_sort(l):
         """
@@ -44,32 +81,255 @@ class Manga:
         :return: A naturally sorted list
         :rtype : list
         """
-        convert = lambda text: int(text) if text.isdigit() else text.lower()
-        alphanum_key = lambda key: [ convert(c) for c in re.split('([0-9]+)', key) ]
-        return sorted(l, key=alphanum_key)
+        return sorted(l, key=Manga.natural_sort_key)
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def natural_sort_key(key):
+        """
+        Return the natural sort key of a string, computed once per distinct string
+        :param key: The string to generate a sort key for
+        :type  key: str
+
+        :rtype : tuple
+        """
+        return tuple(int(text) if text.isdigit() else text.lower() for text in re.split('([0-9]+)', key))
+
+    @property
+    def site_names(self):
+        """
+        The names of the enabled sites, highest priority first, as configured in Common.sites
+        Every available site is used if none of the configured sites are available
+        :rtype : list of str
+        """
+        names = {name.lower(): name for name in self._site_scrapers}
+        enabled = [site.strip().lower() for site in self.config.get('Common', 'sites', fallback='').split(',')]
+        return [names[site] for site in enabled if site in names] or list(self._site_scrapers)
+
+    @property
+    def sites(self):
+        """
+        The enabled site scrapers, highest priority first, importing each one on first use
+        :rtype : list of (str, type)
+        """
+        sites = []
+        for name in self.site_names:
+            site_class = self._site_scrapers.get(name)
+            if site_class:
+                sites.append((name, site_class))
+        return sites
 
     def search(self, title):
         """
-        Search for a given Manga title
+        Search for a given Manga title on every enabled site at once
+        The result of the highest priority site wins, as soon as every site above it has come up empty. Each site gets
+        search_timeout seconds from when its own search started, which is also the timeout of its search request.
+        Searches still running once a result has won are abandoned rather than waited on: they run on daemon threads
+        that don't hold the process open, and their requests give up by the end of their timeout at the latest
         :param title: The name of the Manga series
         :type  title: str
 
-        :return: Ordered dictionary of mangopi metasite chapter instances
-        :rtype : MetaChapter
+        :return: The series on the winning site
+        :rtype : mangadl.scrapers.MangaScraper.SeriesMeta
+
+        :raises: NoSearchResultsError
+        """
+        self.log.info('Searching for series: {title}'.format(title=title))
+        sites = self.sites
+        if not sites:
+            self.log.warning('No site scrapers are available to search with')
+            raise NoSearchResultsError
+
+        started = {}
+        futures = OrderedDict()
+        for name, site_class in sites:
+            futures[name] = Future()
+            threading.Thread(target=self._search_site, args=(futures[name], started, name, site_class, title,
+                                                             self.search_timeout),
+                             name='search-{site}'.format(site=name), daemon=True).start()
+
+        error = None
+        answered = False
+        with metrics.STAGE_SECONDS.time(stage='search'):
+            for name, future in futures.items():
+                deadline = started.get(name, monotonic()) + self.search_timeout
+                try:
+                    series = future.result(max(0, deadline - monotonic()))
+                except NoSearchResultsError:
+                    self.log.info('No results on {site}'.format(site=name))
+                    answered = True
+                    continue
+                except SearchTimeoutError:
+                    self.log.warning('Search on {site} timed out'.format(site=name))
+                    continue
+                except Exception as e:
+                    self.log.warning('Search on {site} failed'.format(site=name), exc_info=e)
+                    error = error or e
+                    continue
+
+                # Remember which site the series was found on
+                self.log.info('Match found on {site}'.format(site=name))
+                series.site = name
+                return series
+
+        # Only report a failure as such if no site could give us an answer either way
+        if error and not answered:
+            raise error
+        raise NoSearchResultsError
+
+    @staticmethod
+    def _search_site(future, started, name, site_class, title, timeout):
+        """
+        Run a search on a single site, reporting the series found (or the error raised) through a future
+        :type  future: Future
+
+        :param started: Start times of the searches, keyed by site name
+        :type  started: dict
+
+        :param timeout: Seconds the search request may take
+        :type  timeout: float
         """
-        for name, site_class in list(self._site_scrapers.items()):
-            self.log.info('Assigning site: ' + name)
-            self.log.info('Searching for series: {title}'.format(title=title))
+        started[name] = monotonic()
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
             site = site_class()
+            site.search_timeout = timeout
+            site.series = title
+            future.set_result(site.series)
+        except BaseException as e:
+            future.set_exception(e)
+
+    def resolve(self, manga):
+        """
+        Return the remote series of a saved Manga, with its chapters loaded
+        The series is loaded straight from the site and URL it was saved from, and only searched for when it has no
+        known source or the source has gone missing
+        :param manga: The local Manga series
+        :type  manga: SeriesMeta
+
+        :rtype : mangadl.scrapers.MangaScraper.SeriesMeta
+
+        :raises: NoSearchResultsError
+        """
+        # Pick up an interrupted run where it left off
+        series = self.resume(manga)
+        if series:
+            return series
+
+        names = {name.lower(): name for name in self.site_names}
+        name = names.get((manga.site or '').lower())
+        site_class = self._site_scrapers.get(name) if name and manga.url else None
+        if site_class:
+            series = site_class.SeriesMeta(manga.url, manga.title, manga.alt_titles)
+            series.site = name
             try:
-                site.series = title
-            except NoSearchResultsError:
-                continue
-            break
-        else:
-            raise NoSearchResultsError
+                return self.track(series, manga)
+            except SeriesNotFoundError:
+                self.log.warning('{title} is no longer available at {url}, searching for it instead'
+                                 .format(title=manga.title, url=manga.url))
+
+        series = self.search(manga.title)
+        series.chapters
+        self.save_source(series, manga)
+        return self.track(series, manga)
+
+    def resume(self, manga):
+        """
+        Rebuild the remote series of an interrupted download or update, without contacting the site
+        :param manga: The local Manga series
+        :type  manga: SeriesMeta
+
+        :return: The remote series, or None if there's nothing to resume
+        :rtype : mangadl.scrapers.MangaScraper.SeriesMeta or None
+        """
+        return self.jobs.restore(manga.path, self._site_scrapers)
+
+    def resume_title(self, title):
+        """
+        Rebuild the remote series of an interrupted download, given the title of the saved series
+        :param title: The title of the Manga series
+        :type  title: str
+
+        :return: The local and remote series, or None if there's nothing to resume
+        :rtype : (SeriesMeta, mangadl.scrapers.MangaScraper.SeriesMeta) or None
+        """
+        try:
+            manga = SeriesMeta(title)
+        except MangaNotSavedError:
+            return None
+
+        series = self.resume(manga)
+        return (manga, series) if series else None
+
+    def track(self, series, manga):
+        """
+        Start keeping track of a download or update, so that it can be resumed if interrupted
+        If an interrupted run of the series is found, that is resumed instead
+        :param series: The remote series, its chapters are loaded if they haven't been already
+        :type  series: mangadl.scrapers.MangaScraper.SeriesMeta
+
+        :param manga: The local Manga series
+        :type  manga: SeriesMeta
+
+        :return: The remote series to download from
+        :rtype : mangadl.scrapers.MangaScraper.SeriesMeta
+        """
+        resumed = self.resume(manga)
+        if resumed:
+            return resumed
 
-        return site.series
+        self.jobs.track(manga.path, series)
+        return series
+
+    def finish(self, manga):
+        """
+        Stop keeping track of a download or update, once every chapter has been gone through
+        :param manga: The local Manga series
+        :type  manga: SeriesMeta
+        """
+        self.jobs.finish(manga.path)
+
+    @staticmethod
+    def _write_source(config, series):
+        """
+        Record where a series was downloaded from in its configuration
+        :param config: The series configuration
+        :type  config: ConfigParser
+
+        :param series: The meta instance of the Manga series
+        :type  series: mangadl.scrapers.MangaScraper.SeriesMeta
+        """
+        alt_titles = series.alt_titles
+        if isinstance(alt_titles, str):
+            alt_titles = [alt_titles]
+        elif not isinstance(alt_titles, (list, tuple)):
+            alt_titles = []
+
+        if not config.has_section('Source'):
+            config.add_section('Source')
+        config.set('Source', 'site', series.site or '')
+        config.set('Source', 'url', series.url)
+        config.set('Source', 'alt_titles', '; '.join(alt_titles))
+
+    def save_source(self, series, manga):
+        """
+        Record where an existing Manga series is now downloaded from
+        :param series: The meta instance of the remote Manga series
+        :type  series: mangadl.scrapers.MangaScraper.SeriesMeta
+
+        :param manga: The local Manga series
+        :type  manga: SeriesMeta
+        """
+        config_path = Config.series_config_path(manga.path)
+        config = ConfigParser(interpolation=None)
+        config.read(config_path)
+        self._write_source(config, series)
+
+        with open(config_path, 'w') as config_file:
+            config.write(config_file)
+        forget(config_path)
+        manga.load_source()
 
     def create_series(self, series):
         """
@@ -103,7 +363,7 @@ class Manga:
         page_pattern    = '^' + page_re_template.format(page=r'(?P<page>\d+(\.\d)?)', ext=r'\w{3,4}') + '$'
 
         # Set up the series configuration
-        config = ConfigParser()
+        config = ConfigParser(interpolation=None)
 
         config.add_section('Patterns')
         config.set('Patterns', 'series_pattern', series_pattern)
@@ -113,8 +373,11 @@ class Manga:
         config.add_section('Common')
         config.set('Common', 'version', '0.1.0')
 
+        # Remember where the series came from, so updates can go straight to it
+        self._write_source(config, series)
+
         # Write to and close the configuration file
-        config_path = os.path.join(series_path, '.' + Config().app_config_file)
+        config_path = Config.series_config_path(series_path)
 
         # This series has already been created and configured
         if os.path.isfile(config_path):
@@ -141,18 +404,29 @@ class Manga:
 
         :param overwriting: Overwrite existing pages
         :type  overwriting: bool
+
+        :return: The number of pages downloaded
+        :rtype : int
         """
+        # Chapters completed before a run was interrupted are skipped outright
+        if self.jobs.chapter_done(manga.path, chapter.chapter):
+            self.log.info('Skipping completed chapter: ({no}) {title}'.format(no=chapter.chapter, title=chapter.title))
+            return 0
+
         self.log.info('Downloading chapter {chapter}: {title}'.format(chapter=chapter.chapter, title=chapter.title))
 
         # Output the formatted Chapter title to the console
         chapter_header = '\nChapter {chapter}: {title}'.format(chapter=chapter.chapter, title=chapter.title)
         chapter_header = colored.yellow(chapter_header, bold=True)
-        puts(chapter_header)
+        if not self.quiet:
+            puts(chapter_header)
 
         # Assign the page counts
         pages = chapter.pages
         page_count = len(pages)
         self.log.info('{num} pages found'.format(num=page_count))
+        self.jobs.record_pages(manga.path, chapter)
+        done_pages = self.jobs.done_pages(manga.path, chapter.chapter)
 
         # Set up the Chapter directory
         self.log.debug('Formatting chapter directory path')
@@ -165,49 +439,428 @@ class Manga:
             os.makedirs(chapter_path, 0o755)
 
         # Set up the progress bar
-        progress_bar = ProgressBar(page_count, self.progress_widget)
+        progress_bar = NullProgressBar() if self.quiet else ProgressBar(page_count, self.progress_widget)
         progress_bar.start()
-
-        for index, page in enumerate(list(pages.values()), 1):
+        completed = 0
+
+        # In packed storage mode, pages are collected in a single per-chapter archive
+        packed = PackedChapter(chapter_path) if self.storage == 'packed' else None
+        try:
+            packed_names = packed.names() if packed else set()
+        except BadZipFile:
+            self.log.warning('The page archive of chapter {chapter} is damaged, downloading it again'
+                             .format(chapter=chapter.chapter))
+            packed.discard()
+            packed_names = set()
+
+        # Queue up every page that actually needs to be downloaded
+        queue = []
+        page_paths = []
+        for page in list(pages.values()):
             # Set the filename and path
             page_filename = self.page_filename_template.format(page=page.page, ext='jpg')
             self.log.debug('Page filename set: {filename}'.format(filename=page_filename))
             page_path = os.path.join(chapter_path, page_filename)
+            page_paths.append(page_path)
 
-            # If we're not overwriting and the file exists, skip it
-            if not overwriting and os.path.exists(page_path):
+            # Skip pages completed before the run was interrupted, and if we're not overwriting, pages that already
+            # exist (pages only appear once completely downloaded)
+            if page.page in done_pages or \
+                    (not overwriting and (page_filename in packed_names or os.path.exists(page_path))):
                 self.log.info('Skipping existing page ({page})'.format(page=page.page))
-                progress_bar.update(index)
+                metrics.PAGES.inc(result='skipped')
+                completed += 1
+                progress_bar.update(completed)
                 continue
 
-            # Download and save the page image
-            image = page.image
-            if not image:
-                self.log.warn('Page found but it has no image resource available')
-                raise ImageResourceUnavailableError
+            queue.append((page, page_path))
+
+        try:
+            if self.engine == 'async':
+                self._download_pages_async(queue, manga.path, progress_bar, completed)
+            else:
+                self._download_pages_threaded(queue, manga.path, progress_bar, completed)
+        finally:
+            # Pack whatever made it to disk, including pages left loose by an interrupted run
+            if packed:
+                with metrics.STAGE_SECONDS.time(stage='store'):
+                    packed.pack([page_path for page_path in page_paths if os.path.isfile(page_path)])
+
+            # Record whatever made it to disk in the library index
+            self.library.index_chapter(manga.path, chapter_path)
+        self.jobs.complete_chapter(manga.path, chapter.chapter)
+        if not self.quiet:
+            puts()
+        return len(queue)
+
+    def _download_pages_threaded(self, queue, series_path, progress_bar, completed):
+        """
+        Download the queued pages with the thread pool pipeline
+        Page images are resolved ahead of the downloads in one stage and downloaded in another, so that resolving
+        page N+k overlaps with transferring page N. Resolving is itself a request per page, so it gets a pool of its
+        own, as wide as the host allows
+        :param queue: (page, page_path) pairs to download
+        :type  queue: list of tuple
+
+        :param series_path: Filesystem path to the local series
+        :type  series_path: str
+
+        :param progress_bar: The chapter progress bar
+        :type  progress_bar: ProgressBar or NullProgressBar
+
+        :param completed: Number of pages of the chapter already completed
+        :type  completed: int
+        """
+        resolvers = max(1, min(self.workers, self.host_limiter.limit, len(queue)))
+        self.log.info('Downloading {num} pages with {workers} workers and {resolvers} resolvers'
+                      .format(num=len(queue), workers=self.workers, resolvers=resolvers))
+        pending = Queue()
+        for item in queue:
+            pending.put(item)
+        resolved = Queue(maxsize=self.prefetch)
+        finished = Queue()
+        stop = threading.Event()
+        resolving = ResolverCountdown(resolvers, partial(self._end_downloads, resolved, stop))
+        with ThreadPoolExecutor(max_workers=self.workers + resolvers) as executor:
+            for _ in range(resolvers):
+                executor.submit(self._resolve_pages, pending, resolved, finished, stop, series_path, resolving)
+            for _ in range(self.workers):
+                executor.submit(self._download_pages, resolved, finished, stop, series_path)
+
+            try:
+                for _ in range(len(queue)):
+                    page = finished.get()
+                    if isinstance(page, BaseException):
+                        raise page
+                    completed += 1
+                    self._complete_page(series_path, page)
+                    progress_bar.update(completed)
+            finally:
+                # Don't start any more pages once one of them has failed
+                stop.set()
+
+    def _download_pages_async(self, queue, series_path, progress_bar, completed):
+        """
+        Download the queued pages on the async engine
+        Every page is resolved and downloaded by a task of its own, with up to async_concurrency requests in flight
+        (and host_limit to any one host) on a single thread
+        :param queue: (page, page_path) pairs to download
+        :type  queue: list of tuple
+
+        :param series_path: Filesystem path to the local series
+        :type  series_path: str
 
-            failures = 0
-            retry_throttle = 2
-            while True:
+        :param progress_bar: The chapter progress bar
+        :type  progress_bar: ProgressBar or NullProgressBar
+
+        :param completed: Number of pages of the chapter already completed
+        :type  completed: int
+        """
+        from mangadl.scrapers import AsyncEngine
+        engine = AsyncEngine(self.async_concurrency, self.host_limiter.limit)
+        self.log.info('Downloading {num} pages with the async engine, {concurrency} requests at a time'
+                      .format(num=len(queue), concurrency=engine.concurrency))
+
+        async def download_pages():
+            nonlocal completed
+            pages = engine.as_completed(lambda item: self._download_page_async(engine, item[0], item[1], series_path),
+                                        queue)
+            async for page in pages:
+                completed += 1
+                self._complete_page(series_path, page)
+                progress_bar.update(completed)
+
+        engine.run(download_pages())
+
+    def _complete_page(self, series_path, page):
+        """
+        Record a downloaded page
+        :param series_path: Filesystem path to the local series
+        :type  series_path: str
+
+        :param page: The remote page
+        :type  page: MangaScraper.PageMeta
+        """
+        self.jobs.complete_page(series_path, page)
+        metrics.PAGES.inc(result='downloaded')
+        self.log.debug('Updating progress page number: {page_no}'.format(page_no=page.page))
+
+    @staticmethod
+    def _put(queue, item, stop):
+        """
+        Put an item on a bounded queue, giving up if the pipeline is being stopped
+        :type  queue: Queue
+        :type  stop: threading.Event
+
+        :return: True if the item was queued, otherwise False
+        :rtype : bool
+        """
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def _end_downloads(self, resolved, stop):
+        """
+        Let each of the download workers know there's nothing more to come
+        :type  resolved: Queue
+        :type  stop: threading.Event
+        """
+        for _ in range(self.workers):
+            self._put(resolved, None, stop)
+
+    def _resolve_pages(self, pending, resolved, finished, stop, series_path, resolving):
+        """
+        Resolve the image of queued pages until none are left, handing them on to the download workers
+        :param pending: (page, page_path) pairs left to resolve, shared by every resolver
+        :type  pending: Queue
+
+        :param resolved: Bounded queue of (page, page_path, image) tuples ready to be downloaded
+        :type  resolved: Queue
+
+        :param finished: Queue that failures are reported to
+        :type  finished: Queue
+
+        :param stop: Set when the pipeline is being stopped
+        :type  stop: threading.Event
+
+        :param series_path: Filesystem path to the local series, for recording the resolved images
+        :type  series_path: str
+
+        :param resolving: Counts down the resolvers still running
+        :type  resolving: ResolverCountdown
+        """
+        try:
+            while not stop.is_set():
                 try:
-                    request.urlretrieve(image.url, page_path)
-                except ContentTooShortError:
-                    # If we've already tried this download several times, give up
-                    if failures >= 5:
-                        self.log.error('Unable to download a page after several attempts were made, giving up')
-                        raise
-
-                    # Increase our failure count and throttle, then try again
-                    failures += 1
-                    sleep(retry_throttle)
-                    retry_throttle *= 2
-                    self.log.warn('Page download failed partway through, waiting a couple seconds then trying again')
-                break
-
-            self.log.debug('Updating progress page number: {page_no}'.format(page_no=page.page))
-            progress_bar.update(index)
-            sleep(self.throttle)
-        puts()
+                    page, page_path = pending.get_nowait()
+                except Empty:
+                    break
+                with self.host_limiter.slot(page.url):
+                    image = page.image
+                if not image:
+                    self.log.warning('Page found but it has no image resource available')
+                    raise ImageResourceUnavailableError
+                self.jobs.record_image(series_path, page)
+
+                if not self._put(resolved, (page, page_path, image), stop):
+                    return
+        except BaseException as e:
+            finished.put(e)
+            return
+
+        # Once the last resolver is done, the download workers are told there's nothing more to come
+        resolving.done()
+
+    def _download_pages(self, resolved, finished, stop, series_path):
+        """
+        Download resolved pages until the resolver runs out of them
+        :param resolved: Bounded queue of (page, page_path, image) tuples ready to be downloaded
+        :type  resolved: Queue
+
+        :param finished: Queue that completed pages and failures are reported to
+        :type  finished: Queue
+
+        :param stop: Set when the pipeline is being stopped
+        :type  stop: threading.Event
+
+        :param series_path: Filesystem path to the local series, for recording re-resolved images
+        :type  series_path: str
+        """
+        while not stop.is_set():
+            try:
+                item = resolved.get(timeout=0.1)
+            except Empty:
+                continue
+            if item is None:
+                return
+
+            page, page_path, image = item
+            try:
+                self._download_page(page, page_path, image, series_path)
+            except BaseException as e:
+                finished.put(e)
+                return
+            finished.put(page)
+
+    def _download_page(self, page, page_path, image, series_path):
+        """
+        Download a resolved page, resolving its image again if the image host refuses the link we have for it
+        Image links are often signed or expire, so a link recorded by an earlier run (or resolved a while ago) may
+        no longer be valid
+        :param page: The page being downloaded
+        :type  page: MangaScraper.PageMeta
+
+        :param page_path: Filesystem path to save the page image to
+        :type  page_path: str
+
+        :param image: The resolved page image
+        :type  image: MangaScraper.ImageMeta
+
+        :param series_path: Filesystem path to the local series
+        :type  series_path: str
+        """
+        from requests import HTTPError
+
+        try:
+            self._download_image(image, page_path)
+            return
+        except HTTPError as e:
+            status = self._refused_status(e)
+            if status is None:
+                raise
+            self.log.warning('The image link of page {page} was refused ({status}), resolving it again'
+                             .format(page=page.page, status=status))
+
+        self.jobs.clear_image(series_path, page)
+        page.forget_image()
+        metrics.RETRIES.inc(stage='resolve')
+        with self.host_limiter.slot(page.url):
+            image = page.image
+        if not image:
+            self.log.warning('Page found but it has no image resource available')
+            raise ImageResourceUnavailableError
+        self.jobs.record_image(series_path, page)
+        self._download_image(image, page_path)
+
+    async def _download_page_async(self, engine, page, page_path, series_path):
+        """
+        Resolve and download a page on the async engine, resolving its image again if the image host refuses the
+        link we have for it
+        :param engine: The engine driving the event loop
+        :type  engine: mangadl.scrapers.AsyncEngine
+
+        :param page: The page being downloaded
+        :type  page: MangaScraper.PageMeta
+
+        :param page_path: Filesystem path to save the page image to
+        :type  page_path: str
+
+        :param series_path: Filesystem path to the local series
+        :type  series_path: str
+
+        :return: The downloaded page
+        :rtype : MangaScraper.PageMeta
+        """
+        image = await page.fetch_image()
+        if not image:
+            self.log.warning('Page found but it has no image resource available')
+            raise ImageResourceUnavailableError
+        self.jobs.record_image(series_path, page)
+
+        try:
+            await self._download_image_async(engine, image, page_path)
+            return page
+        except Exception as e:
+            status = self._refused_status(e)
+            if status is None:
+                raise
+            self.log.warning('The image link of page {page} was refused ({status}), resolving it again'
+                             .format(page=page.page, status=status))
+
+        self.jobs.clear_image(series_path, page)
+        page.forget_image()
+        metrics.RETRIES.inc(stage='resolve')
+        image = await page.fetch_image()
+        if not image:
+            self.log.warning('Page found but it has no image resource available')
+            raise ImageResourceUnavailableError
+        self.jobs.record_image(series_path, page)
+        await self._download_image_async(engine, image, page_path)
+        return page
+
+    @staticmethod
+    def _refused_status(error):
+        """
+        Return the status of an image request the image host refused with a client error (other than a 429)
+        :param error: An HTTP error, either from requests (HTTPError) or from aiohttp (ClientResponseError)
+        :type  error: Exception
+
+        :return: The refusing status, or None if the error was anything else
+        :rtype : int or None
+        """
+        status = getattr(getattr(error, 'response', None), 'status_code', None) or getattr(error, 'status', None)
+        if not isinstance(status, int) or not 400 <= status < 500 or status == 429:
+            return None
+        return status
+
+    def _download_image(self, image, page_path):
+        """
+        Download and save a single page image, resuming partial transfers
+        :param image: The page image to download
+        :type  image: MangaScraper.ImageMeta
+
+        :param page_path: Filesystem path to save the page image to
+        :type  page_path: str
+        """
+        # The HTTP stack is only imported once something is actually downloaded
+        from mangadl import transport
+
+        failures = 0
+        retry_throttle = 2
+        while True:
+            try:
+                with self.host_limiter.slot(image.url):
+                    # Pacing is left to the transport's adaptive per-host rate limiter
+                    transport.download(image.url, page_path)
+                if self.blob_store and self.storage != 'packed':
+                    with metrics.STAGE_SECONDS.time(stage='store'):
+                        self.blob_store.add(page_path)
+            except transport.TRANSIENT_ERRORS:
+                # If we've already tried this download several times, give up
+                if failures >= 5:
+                    self.log.error('Unable to download a page after several attempts were made, giving up')
+                    raise
+
+                # Increase our failure count and throttle, then try again
+                failures += 1
+                metrics.RETRIES.inc(stage='transfer')
+                sleep(retry_throttle)
+                retry_throttle *= 2
+                self.log.warning('Page download failed partway through, waiting a couple seconds then resuming')
+                continue
+            break
+
+    async def _download_image_async(self, engine, image, page_path):
+        """
+        Download and save a single page image on the async engine, resuming partial transfers
+        :param engine: The engine driving the event loop
+        :type  engine: mangadl.scrapers.AsyncEngine
+
+        :param image: The page image to download
+        :type  image: MangaScraper.ImageMeta
+
+        :param page_path: Filesystem path to save the page image to
+        :type  page_path: str
+        """
+        import asyncio
+
+        failures = 0
+        retry_throttle = 2
+        while True:
+            try:
+                # Pacing and the per-host limit are left to the engine
+                await engine.download(image.url, page_path)
+                if self.blob_store and self.storage != 'packed':
+                    with metrics.STAGE_SECONDS.time(stage='store'):
+                        self.blob_store.add(page_path)
+            except engine.transient_errors:
+                # If we've already tried this download several times, give up
+                if failures >= 5:
+                    self.log.error('Unable to download a page after several attempts were made, giving up')
+                    raise
+
+                # Increase our failure count and throttle, then try again
+                failures += 1
+                metrics.RETRIES.inc(stage='transfer')
+                await asyncio.sleep(retry_throttle)
+                retry_throttle *= 2
+                self.log.warning('Page download failed partway through, waiting a couple seconds then resuming')
+                continue
+            break
 
     def update(self, chapter, manga, checking_pages=True):
         """
@@ -217,13 +870,16 @@ class Manga:
 
         :param manga: The local Manga series being updated
         :type  manga: SeriesMeta
+
+        :return: The number of pages downloaded
+        :rtype : int
         """
         # If we don't have this chapter yet, download_chapter it
         if chapter.chapter in manga.chapters and not checking_pages:
             self.log.info('Skipping existing chapter: ({no}) {title}'.format(no=chapter.chapter, title=chapter.title))
-            return
+            return 0
 
-        self.download_chapter(chapter, manga, overwriting=False)
+        return self.download_chapter(chapter, manga, overwriting=False)
 
     def get(self, chapter):
         """
@@ -243,14 +899,12 @@ class Manga:
         :return: List of MangaMeta instances
         :rtype : list of SeriesMeta
         """
-        manga_list = []
-        manga_paths = self.natural_sort(os.listdir(self.config.get('Paths', 'manga_dir')))
-        for path_item in manga_paths:
-            try:
-                manga_list.append(SeriesMeta(path_item))
-            except MangaNotSavedError:
-                continue
-        return manga_list
+        self.library.reconcile()
+
+        # Hand the already resolved series straight to their loaders
+        series_rows = {row['name']: row for row in self.library.series()}
+        return [SeriesMeta(name, refresh=False, series=series_rows[name])
+                for name in self.natural_sort(list(series_rows))]
 
 
 # noinspection PyTypeChecker
@@ -258,23 +912,37 @@ class SeriesMeta:
     """
     Manga Metadata
     """
-    def __init__(self, title):
+    def __init__(self, title, refresh=True, series=None):
         """
         Initialize a new Manga Meta instance
 
         :param title: The title of the Manga series to load
         :type  title: str
+
+        :param refresh: Reconcile the library index against the filesystem before loading
+        :type  refresh: bool
+
+        :param series: The already resolved library index entry of the series, if available
+        :type  series: sqlite3.Row or None
         """
         self.log = logging.getLogger('manga-dl.manga-meta')
         self.title = title.strip()
         self.config = Config().app_config()
         self.manga_path = self.config.get('Paths', 'manga_dir')
+        self.library = LibraryIndex.open(self.manga_path)
+        self.refresh = refresh
+        self._series = series
 
         # Series configuration placeholders
-        self._series_config  = None
+        self.id = None
         self.chapter_pattern = None
         self.page_pattern    = None
 
+        # Where the series was downloaded from, if known
+        self.site = None
+        self.url = None
+        self.alt_titles = []
+
         # Manga metadata placeholders
         self.path = None
         self.chapters = OrderedDict()
@@ -285,58 +953,73 @@ class SeriesMeta:
         """
         Attempt to load the requested Manga title
         """
-        manga_paths = Manga.natural_sort(os.listdir(self.manga_path))
-
-        # Loop through the manga directories and see if we can find a match
-        for path_item in manga_paths:
-            self.path = os.path.join(self.manga_path, path_item)
-            if self.title.lower() == path_item.lower() and os.path.isdir(self.path):
-                self.log.info('Match found: {dir}'.format(dir=path_item))
-                # Series matched, define the path and begin loading
-                self.path = os.path.join(self.manga_path, path_item)
-
-                # Load the series configuration file
-                series_config_path  = os.path.join(self.path, '.' + Config().app_config_file)
-                if not os.path.isfile(series_config_path):
-                    continue
-                self._series_config = ConfigParser()
-                self._series_config.read(series_config_path)
-
-                # Compile the regex patterns
-                self.series_pattern  = re.compile(self._series_config.get('Patterns', 'series_pattern', raw=True))
-                self.chapter_pattern = re.compile(self._series_config.get('Patterns', 'chapter_pattern', raw=True))
-                self.page_pattern    = re.compile(self._series_config.get('Patterns', 'page_pattern', raw=True))
-
-                # Break on match
-                break
-        else:
+        series = self._series or self.library.find_series(self.title)
+        if self.refresh:
+            if series:
+                # Known series, make sure its chapters and pages are current
+                if not self.library.reconcile_series(series['path']):
+                    series = None
+            else:
+                # Possibly a new series, only its own directory needs to be looked at
+                series_dir = self.config.get('Paths', 'series_dir').format(series=self.title)
+                if self.library.reconcile_series(os.path.join(self.manga_path, series_dir)):
+                    series = self.library.find_series(self.title)
+
+        if not series:
             # Title was not found, abort loading
             raise MangaNotSavedError('Manga title "{manga}" could not be loaded from the filesystem'
                                      .format(manga=self.title))
 
+        self.log.info('Match found: {dir}'.format(dir=series['name']))
+        self.id = series['id']
+        self.path = series['path']
+
+        # Compile the regex patterns
+        self.chapter_pattern = re.compile(series['chapter_pattern'])
+        self.page_pattern    = re.compile(series['page_pattern'])
+        self.load_source()
+
         # Successful match if we're still here, load all available chapters
         self._load_chapters()
 
+    def load_source(self):
+        """
+        Load the site and URL the series was downloaded from out of its configuration
+        """
+        config = Config.series_config(self.path)
+        self.site = config.get('Source', 'site', fallback='') or None
+        self.url = config.get('Source', 'url', fallback='') or None
+        alt_titles = config.get('Source', 'alt_titles', fallback='')
+        self.alt_titles = [title.strip() for title in alt_titles.split(';') if title.strip()]
+
     def _load_chapters(self):
         """
         Load all available chapters for the volume
+        Pages aren't loaded until a chapter's pages are first used, page counts come straight from the index
         """
-        series_path = Manga.natural_sort(os.listdir(self.path))
+        chapters = {row['name']: row for row in self.library.chapters(self.id)}
 
-        for path_item in series_path:
-            match = self.chapter_pattern.match(path_item)
-            if match:
-                chapter_path = os.path.join(self.path, path_item)
-                chapter = match.group('chapter')  # chapter number
-                title = match.group('title')  # chapter title
-                self.chapters[chapter] = ChapterMeta(chapter_path, chapter, title, self)
+        for name in Manga.natural_sort(list(chapters)):
+            row = chapters[name]
+            self.chapters[row['chapter']] = ChapterMeta(row['path'], row['chapter'], row['title'], self, row['id'],
+                                                        row['page_count'])
+
+    @property
+    def page_count(self):
+        """
+        The total number of pages in the series
+        :rtype : int
+        """
+        return sum(chapter.page_count for chapter in self.chapters.values())
 
 
 class ChapterMeta:
     """
     Series Chapter Metadata
     """
-    def __init__(self, path, chapter, title, series):
+    __slots__ = ('id', 'chapter', 'title', 'path', 'series', '_page_count', '_pages')
+
+    def __init__(self, path, chapter, title, series, chapter_id=None, page_count=None):
         """
         Initialize a new Chapter Meta instance
         :param path: Filesystem path to the chapter
@@ -350,36 +1033,106 @@ class ChapterMeta:
 
         :param series: The SeriesMeta instance for this chapter
         :type  series: SeriesMeta
-        """
-        self.log = logging.getLogger('manga-dl.chapter-meta')
 
+        :param chapter_id: The library index ID of the chapter
+        :type  chapter_id: int
+
+        :param page_count: The number of indexed pages in the chapter, if already known
+        :type  page_count: int or None
+        """
         # Chapter metadata
+        self.id      = chapter_id
         self.chapter = chapter
         self.title   = title
         self.path    = path
         self.series  = series
-        self.pages   = OrderedDict()
 
-        self._load_pages()
+        self._page_count = page_count
+        self._pages = None
+
+    @property
+    def pages(self):
+        """
+        The pages of the chapter, loaded from the library index on first use
+        :rtype : PageTable
+        """
+        if self._pages is None:
+            self._pages = PageTable(self, self.series.library.pages(self.id))
+            self._page_count = len(self._pages)
+        return self._pages
 
-    def _load_pages(self):
+    @property
+    def page_count(self):
         """
-        Load all available pages for the chapter
+        The number of pages in the chapter, without loading the pages themselves
+        :rtype : int
         """
-        chapter_paths = Manga.natural_sort(os.listdir(self.path))
+        if self._page_count is None:
+            return len(self.pages)
+        return self._page_count
 
-        for path_item in chapter_paths:
-            match = self.series.page_pattern.match(path_item)
-            if match:
-                page_path = os.path.join(self.path, path_item)
-                page = match.group('page')  # page number
-                self.pages[page] = PageMeta(page_path, page, self)
+
+class PageTable(Mapping):
+    """
+    Read-only, naturally ordered mapping of page numbers to the pages of a chapter
+    Pages are kept as plain tuples of numbers and chapter relative paths, PageMeta instances are only created when
+    asked for
+    """
+    __slots__ = ('chapter', '_pages', '_names')
+
+    def __init__(self, chapter, rows):
+        """
+        Initialize a new Page Table instance
+        :param chapter: The ChapterMeta instance the pages belong to
+        :type  chapter: ChapterMeta
+
+        :param rows: The indexed pages of the chapter
+        :type  rows: list of sqlite3.Row
+        """
+        rows = sorted(rows, key=lambda row: Manga.natural_sort_key(row['name']))
+        prefix = os.path.join(chapter.path, '')
+        self.chapter = chapter
+        # Page numbers and filenames repeat from one chapter to the next, so interning shares them library-wide
+        self._pages = tuple(intern(row['page']) for row in rows)
+
+        # Pages normally live under the chapter directory, anything else is kept as is (os.path.join leaves absolute
+        # paths alone)
+        self._names = tuple(intern(row['path'][len(prefix):]) if row['path'].startswith(prefix) else row['path']
+                            for row in rows)
+
+    def __getitem__(self, page):
+        try:
+            index = self._pages.index(page)
+        except ValueError:
+            raise KeyError(page)
+        return PageMeta(os.path.join(self.chapter.path, self._names[index]), page, self.chapter)
+
+    def __iter__(self):
+        return iter(self._pages)
+
+    def __len__(self):
+        return len(self._pages)
+
+    def values(self):
+        return [PageMeta(path, page, self.chapter) for page, path in zip(self._pages, self.paths())]
+
+    def items(self):
+        return [(page, PageMeta(path, page, self.chapter)) for page, path in zip(self._pages, self.paths())]
+
+    def paths(self):
+        """
+        Return the paths to every page, in order
+        :rtype : list of str
+        """
+        return [os.path.join(self.chapter.path, name) for name in self._names]
 
 
 class PageMeta:
     """
     Chapter Page Metadata
     """
+    __slots__ = ('page', 'chapter', 'path')
+
     def __init__(self, path, page, chapter):
         """
         Initialize a new Page Meta instance
@@ -392,16 +1145,92 @@ class PageMeta:
         :param chapter: The ChapterMeta instance for this page
         :type  chapter: ChapterMeta
         """
-        self.log = logging.getLogger('manga-dl.page-meta')
         self.page = page
         self.chapter = chapter
         self.path = path
 
 
+class ResolverCountdown:
+    """
+    Counts down the page resolvers of a chapter, running a callback once the last of them is done
+    """
+    def __init__(self, count, callback):
+        """
+        Initialize a new Resolver Countdown instance
+        :param count: The number of resolvers
+        :type  count: int
+
+        :param callback: Called once every resolver is done
+        :type  callback: callable
+        """
+        self.count = count
+        self.callback = callback
+        self._lock = threading.Lock()
+
+    def done(self):
+        """
+        Report a resolver as done
+        """
+        with self._lock:
+            self.count -= 1
+            last = self.count == 0
+        if last:
+            self.callback()
+
+
+class NullProgressBar:
+    """
+    Stand-in for a progress bar when running quietly
+    """
+    def start(self):
+        pass
+
+    def update(self, value):
+        pass
+
+    def finish(self):
+        pass
+
+
+class HostLimiter:
+    """
+    Caps the number of simultaneous requests made against any single host
+    """
+    def __init__(self, limit):
+        """
+        Initialize a new Host Limiter instance
+        :param limit: Maximum number of concurrent requests per host
+        :type  limit: int
+        """
+        self.limit = max(1, limit)
+        self._lock = threading.Lock()
+        self._slots = {}
+
+    @contextmanager
+    def slot(self, url):
+        """
+        Hold one of the request slots for the host of the given URL
+        :param url: The URL about to be requested
+        :type  url: str
+        """
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._slots:
+                self._slots[host] = threading.BoundedSemaphore(self.limit)
+            semaphore = self._slots[host]
+
+        with semaphore:
+            yield
+
+
 class NoSearchResultsError(Exception):
     pass
 
 
+class SeriesNotFoundError(Exception):
+    pass
+
+
 class ImageResourceUnavailableError(Exception):
     pass
 
@@ -1,13 +1,15 @@
 #!/bin/env python3.4
 
+import sys
 import logging
 from mangadl.config import Config
 from mangadl.cli import CLI
+from mangadl.batch import BatchCLI
 
 
 def main():
-    config = Config().app_config() if Config().app_config_exists() else None
-    cli = CLI()
+    app_config = Config()
+    config = app_config.app_config() if app_config.app_config_exists() else None
 
     # Set up logging
     log = logging.getLogger('manga-dl')
@@ -24,6 +26,12 @@ def main():
     console_logger.setFormatter(log_formatter)
     log.addHandler(console_logger)
 
+    # Run non-interactively when given a command
+    if len(sys.argv) > 1:
+        sys.exit(BatchCLI().run(sys.argv[1:]))
+
+    cli = CLI()
+
     # If this is our first time running the application, run setup first
     try:
         if not config:
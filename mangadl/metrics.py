@@ -0,0 +1,316 @@
+import os
+import json
+import threading
+from time import perf_counter
+from abc import ABCMeta, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from collections import OrderedDict
+
+# Upper bounds of the default latency histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float('inf'))
+
+# Every metric defined, in the order they are exported
+REGISTRY = []
+
+
+class Metric(metaclass=ABCMeta):
+    """
+    Base class of a labelled, thread safe metric
+    """
+    TYPE = None
+
+    def __init__(self, name, description, labels=()):
+        """
+        Initialize a new Metric instance
+        :param name: Name of the metric, as exported
+        :type  name: str
+
+        :param description: Help text of the metric
+        :type  description: str
+
+        :param labels: Names of the labels every sample carries
+        :type  labels: tuple of str
+        """
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = OrderedDict()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        """
+        Return the label values of a sample, in label order
+        :rtype : tuple of str
+        """
+        if set(labels) != set(self.labels):
+            raise ValueError('{name} takes the labels {labels}'.format(name=self.name, labels=', '.join(self.labels)))
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def _label_string(self, key, extra=None):
+        """
+        Format label values in the Prometheus exposition format
+        :rtype : str
+        """
+        pairs = list(zip(self.labels, key)) + list(extra or [])
+        if not pairs:
+            return ''
+        return '{' + ','.join('{name}="{value}"'.format(
+            name=name, value=value.replace('\\', '\\\\').replace('"', '\\"')) for name, value in pairs) + '}'
+
+    def reset(self):
+        """
+        Discard every recorded sample
+        """
+        with self._lock:
+            self._values.clear()
+
+    @abstractmethod
+    def summary(self):
+        """
+        Return the recorded samples, keyed by their label values
+        :rtype : dict
+        """
+        pass
+
+    @abstractmethod
+    def exposition(self):
+        """
+        Return the samples in the Prometheus text exposition format
+        :rtype : list of str
+        """
+        pass
+
+
+class Counter(Metric):
+    """
+    A monotonically increasing count
+    """
+    TYPE = 'counter'
+
+    def inc(self, amount=1, **labels):
+        """
+        Increase the count
+        :param amount: Amount to increase the count by
+        :type  amount: int or float
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """
+        Return the current count
+        :rtype : int or float
+        """
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def summary(self):
+        with self._lock:
+            return OrderedDict((','.join(key), value) for key, value in self._values.items())
+
+    def exposition(self):
+        with self._lock:
+            return ['{name}{labels} {value}'.format(name=self.name, labels=self._label_string(key), value=value)
+                    for key, value in self._values.items()]
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values (usually latencies) over fixed buckets
+    """
+    TYPE = 'histogram'
+
+    def __init__(self, name, description, labels=(), buckets=DEFAULT_BUCKETS):
+        """
+        Initialize a new Histogram instance
+        :param buckets: Upper bounds of the buckets, in ascending order and ending with infinity
+        :type  buckets: tuple of float
+        """
+        super().__init__(name, description, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        """
+        Record an observation
+        :param value: The observed value
+        :type  value: float
+        """
+        key = self._key(labels)
+        with self._lock:
+            sample = self._values.get(key)
+            if sample is None:
+                sample = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0, 'max': value}
+                self._values[key] = sample
+            sample['counts'][bisect_left(self.buckets, value)] += 1
+            sample['sum'] += value
+            sample['count'] += 1
+            sample['max'] = max(sample['max'], value)
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observe the number of seconds the block takes
+        """
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        """
+        Return the number of observations
+        :rtype : int
+        """
+        with self._lock:
+            sample = self._values.get(self._key(labels))
+            return sample['count'] if sample else 0
+
+    def _percentile(self, sample, percent):
+        """
+        Estimate a percentile from the bucket counts, interpolating linearly within the bucket it falls in (and never
+        beyond the largest observation)
+        :rtype : float
+        """
+        if not sample['count']:
+            return 0.0
+
+        rank = percent / 100 * sample['count']
+        seen = 0
+        lower = 0.0
+        for upper, count in zip(self.buckets, sample['counts']):
+            if count and seen + count >= rank:
+                upper = min(upper, sample['max'])
+                return lower + max(0.0, upper - lower) * (rank - seen) / count
+            seen += count
+            lower = upper
+        return lower
+
+    def percentile(self, percent, **labels):
+        """
+        Estimate a percentile of the observations
+        :param percent: The percentile, 0 - 100
+        :type  percent: float
+
+        :rtype : float
+        """
+        with self._lock:
+            sample = self._values.get(self._key(labels))
+            return self._percentile(sample, percent) if sample else 0.0
+
+    def summary(self):
+        with self._lock:
+            return OrderedDict((','.join(key), {
+                'count': sample['count'],
+                'sum': sample['sum'],
+                'mean': sample['sum'] / sample['count'],
+                'max': sample['max'],
+                'p50': self._percentile(sample, 50),
+                'p90': self._percentile(sample, 90),
+                'p99': self._percentile(sample, 99),
+            }) for key, sample in self._values.items())
+
+    def exposition(self):
+        lines = []
+        with self._lock:
+            for key, sample in self._values.items():
+                cumulative = 0
+                for upper, count in zip(self.buckets, sample['counts']):
+                    cumulative += count
+                    bound = '+Inf' if upper == float('inf') else repr(float(upper))
+                    lines.append('{name}_bucket{labels} {value}'.format(
+                        name=self.name, labels=self._label_string(key, [('le', bound)]), value=cumulative))
+                lines.append('{name}_sum{labels} {value}'.format(
+                    name=self.name, labels=self._label_string(key), value=sample['sum']))
+                lines.append('{name}_count{labels} {value}'.format(
+                    name=self.name, labels=self._label_string(key), value=sample['count']))
+        return lines
+
+
+# Metrics recorded across a run
+STAGE_SECONDS = Histogram('mangadl_stage_seconds', 'Time spent in each stage of a run', ('stage',))
+BYTES = Counter('mangadl_bytes_total', 'Bytes transferred', ('kind',))
+PAGES = Counter('mangadl_pages_total', 'Pages handled, by outcome', ('result',))
+RETRIES = Counter('mangadl_retries_total', 'Retried attempts, by stage', ('stage',))
+CACHE_REQUESTS = Counter('mangadl_cache_requests_total', 'HTTP cache lookups, by result', ('result',))
+METADATA_REQUESTS = Counter('mangadl_metadata_cache_requests_total', 'Scraped metadata cache lookups, by level and '
+                            'result', ('level', 'result'))
+
+
+def summary():
+    """
+    Return every recorded metric as a JSON serializable summary
+    :rtype : dict
+    """
+    return OrderedDict((metric.name, metric.summary()) for metric in REGISTRY)
+
+
+def exposition():
+    """
+    Return every recorded metric in the Prometheus text exposition format
+    :rtype : str
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.append('# HELP {name} {description}'.format(name=metric.name, description=metric.description))
+        lines.append('# TYPE {name} {type}'.format(name=metric.name, type=metric.TYPE))
+        lines += metric.exposition()
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    """
+    Discard everything recorded so far
+    """
+    for metric in REGISTRY:
+        metric.reset()
+
+
+def _write(path, data):
+    """
+    Atomically write a file, so that collectors never read a partial export
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory, 0o755)
+
+    temp_path = '{path}.{pid}.tmp'.format(path=path, pid=os.getpid())
+    with open(temp_path, 'w') as file:
+        file.write(data)
+    os.replace(temp_path, path)
+
+
+def write_json(path):
+    """
+    Write the JSON summary of the recorded metrics
+    :param path: Filesystem path to write the summary to
+    :type  path: str
+    """
+    _write(path, json.dumps(summary(), indent=2) + '\n')
+
+
+def write_textfile(path):
+    """
+    Write the recorded metrics as a Prometheus textfile (for the node_exporter textfile collector)
+    :param path: Filesystem path to write the metrics to, should end in .prom
+    :type  path: str
+    """
+    _write(path, exposition())
+
+
+def export(config):
+    """
+    Write the recorded metrics to the files set in the Metrics configuration section
+    :param config: The application configuration
+    :type  config: ConfigParser
+    """
+    json_path = config.get('Metrics', 'json_path', fallback='')
+    if json_path:
+        write_json(os.path.expanduser(json_path))
+
+    textfile_path = config.get('Metrics', 'textfile_path', fallback='')
+    if textfile_path:
+        write_textfile(os.path.expanduser(textfile_path))
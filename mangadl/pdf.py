@@ -0,0 +1,321 @@
+import os
+import zlib
+import struct
+import shutil
+import logging
+from time import perf_counter
+from mangadl import metrics
+from mangadl.archive import open_page
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Resolution assumed for images that don't specify one
+DEFAULT_DPI = 96
+
+# JPEG start of frame markers (baseline, progressive, lossless, etc.)
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+COLOR_SPACES = {1: '/DeviceGray', 3: '/DeviceRGB', 4: '/DeviceCMYK'}
+
+
+class PDFWriter:
+    """
+    Streaming PDF writer that embeds one image per page
+
+    Each image is copied to the output file as soon as it is added, and the cross-reference table is written when
+    the document is closed, so memory use stays at about one page no matter how many pages are written.
+    JPEG images are embedded as-is, anything else is decoded with Pillow and stored losslessly.
+    """
+    def __init__(self, path):
+        """
+        Initialize a new PDF Writer instance
+        :param path: Filesystem path to write the PDF to
+        :type  path: str
+        """
+        self.log = logging.getLogger('manga-dl.pdf')
+        self.path = path
+        self.page_count = 0
+
+        # The document is only moved into place once it has been completely written
+        self._temp_path = path + '.part'
+        self._file = open(self._temp_path, 'wb')
+        self._offsets = {}
+        self._kids = []
+        self._next_id = 3  # 1 and 2 are reserved for the catalog and the page tree
+
+        self._file.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        self._begin_object(1)
+        self._file.write(b'<< /Type /Catalog /Pages 2 0 R >>\nendobj\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _allocate(self):
+        """
+        Reserve the next object number
+        :rtype : int
+        """
+        object_id = self._next_id
+        self._next_id += 1
+        return object_id
+
+    def _begin_object(self, object_id):
+        """
+        Record the offset of and open a new object
+        :type  object_id: int
+        """
+        self._offsets[object_id] = self._file.tell()
+        self._file.write('{id} 0 obj\n'.format(id=object_id).encode('ascii'))
+
+    def _write_object(self, object_id, body):
+        """
+        Write a complete (non-stream) object
+        :type  object_id: int
+        :type  body: str
+        """
+        self._begin_object(object_id)
+        self._file.write(body.encode('ascii'))
+        self._file.write(b'\nendobj\n')
+
+    def _write_stream(self, object_id, dictionary, length, source):
+        """
+        Write a stream object, copying its data from a file object or bytes
+        :type  object_id: int
+        :type  dictionary: str
+        :type  length: int
+        :type  source: file or bytes
+        """
+        self._begin_object(object_id)
+        self._file.write('<< {dict} /Length {length} >>\nstream\n'.format(dict=dictionary, length=length)
+                         .encode('ascii'))
+        if isinstance(source, bytes):
+            self._file.write(source)
+        else:
+            shutil.copyfileobj(source, self._file)
+        self._file.write(b'\nendstream\nendobj\n')
+
+    def add_page(self, image_path):
+        """
+        Add an image to the document as a new page
+        :param image_path: Filesystem path to the image (loose or packed)
+        :type  image_path: str
+        """
+        image_id = self._allocate()
+        with open_page(image_path) as image_file:
+            info = read_jpeg_info(image_file)
+            if info:
+                width, height, components, dpi = info
+                dictionary = '/Type /XObject /Subtype /Image /Width {w} /Height {h} /ColorSpace {cs} ' \
+                             '/BitsPerComponent 8 /Filter /DCTDecode' \
+                    .format(w=width, h=height, cs=COLOR_SPACES.get(components, '/DeviceRGB'))
+                if components == 4:
+                    # CMYK JPEGs are almost always written with Adobe's inverted convention
+                    dictionary += ' /Decode [1 0 1 0 1 0 1 0]'
+                length = image_file.seek(0, os.SEEK_END)
+                image_file.seek(0)
+                self._write_stream(image_id, dictionary, length, image_file)
+            else:
+                # Anything that isn't a well formed JPEG is left to Pillow, which gives up on truly broken images
+                try:
+                    image_file.seek(0)
+                    width, height, dpi, dictionary, data = self._decode_image(image_file)
+                except (OSError, SyntaxError, ValueError) as e:
+                    raise InvalidImageError('Unable to read the page image {path}: {error}'
+                                            .format(path=image_path, error=e)) from e
+                self._write_stream(image_id, dictionary, len(data), data)
+
+        # Scale the page to the physical size of the image
+        page_width = width * 72.0 / dpi[0]
+        page_height = height * 72.0 / dpi[1]
+
+        content = 'q {w:.4f} 0 0 {h:.4f} 0 0 cm /Im0 Do Q'.format(w=page_width, h=page_height).encode('ascii')
+        content_id = self._allocate()
+        self._write_stream(content_id, '', len(content), content)
+
+        page_id = self._allocate()
+        self._write_object(page_id, '<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {w:.4f} {h:.4f}] '
+                                    '/Resources << /XObject << /Im0 {image} 0 R >> >> /Contents {content} 0 R >>'
+                           .format(w=page_width, h=page_height, image=image_id, content=content_id))
+        self._kids.append(page_id)
+        self.page_count += 1
+
+    @staticmethod
+    def _decode_image(image_file):
+        """
+        Decode a non-JPEG image into a losslessly compressed image stream
+        :type  image_file: file
+
+        :return: The width, height, resolution, stream dictionary and stream data of the image
+        :rtype : tuple
+        """
+        from PIL import Image
+
+        image = Image.open(image_file)
+        dpi = image.info.get('dpi') or (DEFAULT_DPI, DEFAULT_DPI)
+        if image.mode not in ('L', 'RGB'):
+            image = image.convert('RGB')
+
+        dictionary = '/Type /XObject /Subtype /Image /Width {w} /Height {h} /ColorSpace {cs} ' \
+                     '/BitsPerComponent 8 /Filter /FlateDecode' \
+            .format(w=image.width, h=image.height, cs=COLOR_SPACES[len(image.mode)])
+        return image.width, image.height, dpi, dictionary, zlib.compress(image.tobytes())
+
+    def close(self):
+        """
+        Write the page tree and cross-reference table, then move the finished document into place
+        """
+        if not self._kids:
+            self.abort()
+            raise EmptyDocumentError('A PDF needs at least one page')
+
+        kids = ' '.join('{id} 0 R'.format(id=kid) for kid in self._kids)
+        self._write_object(2, '<< /Type /Pages /Kids [{kids}] /Count {count} >>'
+                           .format(kids=kids, count=len(self._kids)))
+
+        xref_offset = self._file.tell()
+        size = self._next_id
+        self._file.write('xref\n0 {size}\n0000000000 65535 f \n'.format(size=size).encode('ascii'))
+        for object_id in range(1, size):
+            self._file.write('{offset:010d} 00000 n \n'.format(offset=self._offsets[object_id]).encode('ascii'))
+        self._file.write('trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{offset}\n%%EOF\n'
+                         .format(size=size, offset=xref_offset).encode('ascii'))
+
+        self._file.close()
+        os.replace(self._temp_path, self.path)
+        self.log.info('PDF with {count} pages written to {path}'.format(count=self.page_count, path=self.path))
+
+    def abort(self):
+        """
+        Discard the partially written document
+        """
+        self._file.close()
+        try:
+            os.remove(self._temp_path)
+        except OSError:
+            pass
+
+
+def read_jpeg_info(image_file):
+    """
+    Read the dimensions, component count and resolution from a JPEG header
+    :param image_file: The image file, positioned at its start
+    :type  image_file: file
+
+    :return: The width, height, component count and (x, y) DPI, or None if this isn't a JPEG image (or its headers
+             are truncated)
+    :rtype : tuple or None
+    """
+    if image_file.read(2) != b'\xff\xd8':
+        return None
+
+    try:
+        return _read_jpeg_segments(image_file)
+    except struct.error:
+        return None
+
+
+def _read_jpeg_segments(image_file):
+    """
+    Walk the segments of a JPEG image up to its frame header
+    :type  image_file: file
+    :rtype : tuple or None
+
+    :raises: struct.error if a segment is cut short
+    """
+    dpi = (DEFAULT_DPI, DEFAULT_DPI)
+    while True:
+        marker = image_file.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+
+        # Skip fill bytes and standalone markers
+        if marker[1] == 0xFF:
+            image_file.seek(-1, os.SEEK_CUR)
+            continue
+        if marker[1] == 0x01 or 0xD0 <= marker[1] <= 0xD7:
+            continue
+
+        length = struct.unpack('>H', image_file.read(2))[0]
+        segment = image_file.read(length - 2)
+
+        if marker[1] == 0xE0 and segment[:5] == b'JFIF\x00' and len(segment) >= 12:
+            units, x_density, y_density = struct.unpack('>BHH', segment[7:12])
+            if x_density and y_density:
+                if units == 1:
+                    dpi = (x_density, y_density)
+                elif units == 2:
+                    dpi = (x_density * 2.54, y_density * 2.54)
+        elif marker[1] in SOF_MARKERS:
+            height, width, components = struct.unpack('>HHB', segment[1:6])
+            return width, height, components, dpi
+
+
+def create_pdf(page_paths, pdf_path):
+    """
+    Write a PDF with one page per image
+    :param page_paths: Filesystem paths to the page images, in order
+    :type  page_paths: iterable of str
+
+    :param pdf_path: Filesystem path to write the PDF to
+    :type  pdf_path: str
+
+    :return: The number of pages written
+    :rtype : int
+    """
+    page_count, seconds = _build_pdf(page_paths, pdf_path)
+    _record(page_count, seconds)
+    return page_count
+
+
+def _build_pdf(page_paths, pdf_path):
+    """
+    Write a PDF, timing how long it takes
+    Runs in the pool workers, which hand the timings back so they're recorded in the parent process
+    :return: The number of pages written and the seconds it took
+    :rtype : tuple of (int, float)
+    """
+    start = perf_counter()
+    with PDFWriter(pdf_path) as writer:
+        for page_path in page_paths:
+            writer.add_page(page_path)
+    return writer.page_count, perf_counter() - start
+
+
+def _record(page_count, seconds):
+    metrics.STAGE_SECONDS.observe(seconds, stage='pdf')
+    metrics.PAGES.inc(page_count, result='pdf')
+
+
+def create_pdfs(pdf_jobs, processes):
+    """
+    Write several PDFs in parallel across a process pool
+    :param pdf_jobs: (page_paths, pdf_path) pairs to pass on to create_pdf
+    :type  pdf_jobs: list of (list of str, str)
+
+    :param processes: Maximum number of PDFs to build at once
+    :type  processes: int
+
+    :return: Yields the index of each job as it finishes, along with the exception it raised, if any
+    :rtype : generator of (int, Exception or None)
+    """
+    with ProcessPoolExecutor(max_workers=max(1, processes)) as executor:
+        futures = {executor.submit(_build_pdf, page_paths, pdf_path): index
+                   for index, (page_paths, pdf_path) in enumerate(pdf_jobs)}
+        for future in as_completed(futures):
+            error = future.exception()
+            if not error:
+                _record(*future.result())
+            yield futures[future], error
+
+
+class EmptyDocumentError(Exception):
+    pass
+
+
+class InvalidImageError(Exception):
+    pass
@@ -0,0 +1,252 @@
+import logging
+import threading
+from time import monotonic, sleep
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+
+# Default request rates in requests per second per host, and the number of requests that may be sent back to back
+DEFAULT_MIN_RATE = 0.2
+DEFAULT_MAX_RATE = 10.0
+DEFAULT_BURST = 4
+
+# Rate added after every successful request, and the factor the rate is cut by when a host is struggling
+ADDITIVE_INCREASE = 0.05
+MULTIPLICATIVE_DECREASE = 0.5
+
+# A response this many times slower than the host's smoothed latency counts as a latency spike
+LATENCY_SPIKE_FACTOR = 3.0
+LATENCY_SMOOTHING = 0.2
+LATENCY_WARMUP = 5
+
+# Minimum number of seconds between two rate cuts for the same host, so one bad moment isn't punished repeatedly
+DECREASE_COOLDOWN = 1.0
+
+# Response statuses that mean the host wants us to slow down
+BACKOFF_STATUSES = {429, 500, 502, 503, 504}
+
+# Longest Retry-After pause we're willing to honour, in seconds
+MAX_RETRY_AFTER = 600
+
+
+class TokenBucket:
+    """
+    Adaptive token bucket for a single host
+    """
+    def __init__(self, rate, min_rate, max_rate, burst):
+        """
+        Initialize a new Token Bucket instance
+        :param rate: Initial rate, in requests per second
+        :type  rate: float
+
+        :param min_rate: Lowest rate the bucket may back off to
+        :type  min_rate: float
+
+        :param max_rate: Highest rate the bucket may grow to
+        :type  max_rate: float
+
+        :param burst: Number of requests that may be sent back to back
+        :type  burst: int
+        """
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+
+        self.tokens = 1.0
+        self.latency = None
+        self.samples = 0
+        self.blocked_until = 0.0
+        self._updated = monotonic()
+        self._last_decrease = float('-inf')
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def take(self, now):
+        """
+        Take a token if one is available
+        :return: 0 if a token was taken, otherwise the number of seconds to wait before trying again
+        :rtype : float
+        """
+        if now < self.blocked_until:
+            return self.blocked_until - now
+
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def increase(self):
+        """
+        Additively raise the rate after a successful request
+        """
+        self.rate = min(self.max_rate, self.rate + ADDITIVE_INCREASE)
+
+    def decrease(self, now):
+        """
+        Multiplicatively cut the rate, at most once per cooldown period
+        :return: True if the rate was cut
+        :rtype : bool
+        """
+        if now - self._last_decrease < DECREASE_COOLDOWN:
+            return False
+        self._refill(now)
+        self.rate = max(self.min_rate, self.rate * MULTIPLICATIVE_DECREASE)
+        self._last_decrease = now
+        return True
+
+    def observe_latency(self, latency):
+        """
+        Fold a response time into the smoothed latency
+        :return: True if the response was a latency spike
+        :rtype : bool
+        """
+        self.samples += 1
+        if self.latency is None:
+            self.latency = latency
+            return False
+
+        spike = self.samples > LATENCY_WARMUP and latency > self.latency * LATENCY_SPIKE_FACTOR
+        self.latency += (latency - self.latency) * LATENCY_SMOOTHING
+        return spike
+
+
+class AdaptiveRateLimiter:
+    """
+    Per-host request rate limiter, shared by every worker
+
+    Each host gets a token bucket whose rate grows additively while requests succeed, and is cut multiplicatively
+    when the host answers with 429 / 5xx statuses, drops connections or responds far slower than usual (AIMD).
+    Retry-After headers pause the host for as long as requested.
+    """
+    def __init__(self, rate=DEFAULT_MAX_RATE, min_rate=DEFAULT_MIN_RATE, max_rate=DEFAULT_MAX_RATE,
+                 burst=DEFAULT_BURST):
+        """
+        Initialize a new Adaptive Rate Limiter instance
+        :param rate: Initial rate of every host, in requests per second
+        :type  rate: float
+
+        :param min_rate: Lowest rate a host may be backed off to
+        :type  min_rate: float
+
+        :param max_rate: Highest rate a host may grow to
+        :type  max_rate: float
+
+        :param burst: Number of requests that may be sent to a host back to back
+        :type  burst: int
+        """
+        self.log = logging.getLogger('manga-dl.rate-limiter')
+        self.min_rate = max(0.01, min_rate)
+        self.max_rate = max(self.min_rate, max_rate)
+        self.rate = min(self.max_rate, max(self.min_rate, rate))
+        self.burst = max(1, burst)
+
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def _bucket(self, host):
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = self._buckets[host] = TokenBucket(self.rate, self.min_rate, self.max_rate, self.burst)
+        return bucket
+
+    def rate_of(self, host):
+        """
+        Return the current rate of a host
+        :rtype : float
+        """
+        with self._lock:
+            return self._bucket(host).rate
+
+    def reserve(self, host):
+        """
+        Take the next request slot of a host if it's free, without waiting for it
+        :param host: The host name
+        :type  host: str
+
+        :return: 0 if a request may be sent now, otherwise the number of seconds to wait before trying again
+        :rtype : float
+        """
+        with self._lock:
+            return self._bucket(host).take(monotonic())
+
+    def acquire(self, host):
+        """
+        Wait until a request may be sent to a host
+        :param host: The host name
+        :type  host: str
+
+        :return: The number of seconds spent waiting
+        :rtype : float
+        """
+        waited = 0.0
+        while True:
+            delay = self.reserve(host)
+            if not delay:
+                return waited
+            sleep(delay)
+            waited += delay
+
+    def success(self, host, latency):
+        """
+        Record a successful response
+        :param host: The host name
+        :type  host: str
+
+        :param latency: Seconds the response took to arrive
+        :type  latency: float
+        """
+        with self._lock:
+            bucket = self._bucket(host)
+            if bucket.observe_latency(latency):
+                if bucket.decrease(monotonic()):
+                    self.log.info('Latency spike from {host} ({latency:.2f}s), slowing down to {rate:.2f} req/s'
+                                  .format(host=host, latency=latency, rate=bucket.rate))
+                return
+            bucket.increase()
+
+    def failure(self, host, retry_after=None):
+        """
+        Record a response (or dropped connection) asking us to back off
+        :param host: The host name
+        :type  host: str
+
+        :param retry_after: Seconds the host asked us to wait before trying again
+        :type  retry_after: float or None
+        """
+        with self._lock:
+            bucket = self._bucket(host)
+            now = monotonic()
+            if bucket.decrease(now):
+                self.log.info('{host} is struggling, slowing down to {rate:.2f} req/s'.format(host=host,
+                                                                                           rate=bucket.rate))
+            if retry_after:
+                retry_after = min(retry_after, MAX_RETRY_AFTER)
+                bucket.blocked_until = max(bucket.blocked_until, now + retry_after)
+                bucket.tokens = 0.0
+
+
+def parse_retry_after(value):
+    """
+    Parse a Retry-After header, given either in seconds or as an HTTP date
+    :param value: The header value
+    :type  value: str or None
+
+    :return: Seconds to wait, or None if the header is missing or invalid
+    :rtype : float or None
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
@@ -0,0 +1,259 @@
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from mangadl.manga import NoSearchResultsError, ImageResourceUnavailableError
+
+# Default number of jobs run at once, overall and per site
+DEFAULT_JOBS = 4
+DEFAULT_SITE_JOBS = 2
+
+
+class UpdateScheduler:
+    """
+    Updates many series at once through a shared work queue
+
+    Every series is searched for, then each of its chapters becomes a job. Jobs are handed out round-robin across
+    the series, one per series per turn, so a long backfill can't hold up the series queued behind it. The number of
+    jobs running at once is capped overall and per site.
+    """
+    def __init__(self, manga, jobs=DEFAULT_JOBS, site_jobs=DEFAULT_SITE_JOBS, site_limits=None, checking_pages=True,
+                 chapter_filter=None):
+        """
+        Initialize a new Update Scheduler instance
+        :param manga: The Manga instance used to search and download
+        :type  manga: mangadl.manga.Manga
+
+        :param jobs: Maximum number of jobs to run at once
+        :type  jobs: int
+
+        :param site_jobs: Maximum number of chapter jobs to run at once against a single site
+        :type  site_jobs: int
+
+        :param site_limits: Per-site overrides of site_jobs, keyed by (case insensitive) site name
+        :type  site_limits: dict of (str, int) or None
+
+        :param checking_pages: Check existing chapters for missing pages, rather than skipping them
+        :type  checking_pages: bool
+
+        :param chapter_filter: Only update chapters this returns True for, given the chapter number
+        :type  chapter_filter: callable or None
+        """
+        self.log = logging.getLogger('manga-dl.scheduler')
+        self.manga = manga
+        self.jobs = max(1, jobs)
+        self.site_jobs = max(1, site_jobs)
+        self.site_limits = {site.lower(): max(1, limit) for site, limit in (site_limits or {}).items()}
+        self.checking_pages = checking_pages
+        self.chapter_filter = chapter_filter
+
+    @classmethod
+    def from_config(cls, manga, config, **kwargs):
+        """
+        Create a scheduler using the limits from the Scheduler configuration section
+        Per-site limits are read from "<site>_jobs" settings, e.g. "mangahere_jobs = 1"
+        :param manga: The Manga instance used to search and download
+        :type  manga: mangadl.manga.Manga
+
+        :param config: The application configuration
+        :type  config: ConfigParser
+
+        :rtype : UpdateScheduler
+        """
+        if kwargs.get('jobs') is None:
+            kwargs['jobs'] = config.getint('Scheduler', 'jobs', fallback=DEFAULT_JOBS)
+        if kwargs.get('site_jobs') is None:
+            kwargs['site_jobs'] = config.getint('Scheduler', 'site_jobs', fallback=DEFAULT_SITE_JOBS)
+
+        site_limits = {}
+        if config.has_section('Scheduler'):
+            for key, value in config.items('Scheduler'):
+                if key.endswith('_jobs') and key != 'site_jobs' and value:
+                    site_limits[key[:-len('_jobs')]] = int(value)
+        kwargs.setdefault('site_limits', site_limits)
+        return cls(manga, **kwargs)
+
+    def site_limit(self, site):
+        """
+        Return the maximum number of chapter jobs to run at once against a site
+        :param site: The site name
+        :type  site: str
+
+        :rtype : int
+        """
+        return self.site_limits.get(site.lower(), self.site_jobs)
+
+    def run(self, series_list, on_chapter=None):
+        """
+        Update a list of saved series
+        :param series_list: The saved series to update
+        :type  series_list: list of mangadl.manga.SeriesMeta
+
+        :param on_chapter: Called with the series and the chapter result whenever a chapter job finishes
+        :type  on_chapter: callable or None
+
+        :return: A result for each series, in the order given
+        :rtype : list of dict
+        """
+        updates = [SeriesUpdate(series) for series in series_list]
+        rotation = deque(updates)
+        running = {}
+        site_running = {}
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            while rotation or running:
+                # Hand out jobs, one per series per turn, until we hit the caps or run out of jobs
+                dispatched = True
+                while dispatched and len(running) < self.jobs:
+                    dispatched = False
+                    for update in list(rotation):
+                        if len(running) >= self.jobs:
+                            break
+
+                        # Series that had their turn go to the back, those held up by a cap keep their place
+                        job = self._next_job(update, site_running)
+                        if job:
+                            running[executor.submit(*job[1:])] = (update, job[0])
+                            rotation.remove(update)
+                            rotation.append(update)
+                            dispatched = True
+
+                    # Series without anything left to do drop out of the rotation
+                    for update in [update for update in rotation if update.done]:
+                        rotation.remove(update)
+
+                if not running:
+                    continue
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    update, chapter_result = running.pop(future)
+                    update.running -= 1
+                    if chapter_result is None:
+                        self._searched(update, future)
+                    else:
+                        site_running[update.site] -= 1
+                        self._updated(update, chapter_result, future)
+                        if on_chapter:
+                            on_chapter(update.local, chapter_result)
+
+                    # Every chapter made it, so there's nothing left to resume. Otherwise the job is kept, so the
+                    # chapters that failed are picked up again by the next run
+                    if update.done and update.remote and update.succeeded:
+                        self.manga.finish(update.local)
+
+        return [update.result for update in updates]
+
+    def _next_job(self, update, site_running):
+        """
+        Return the next job of a series that may run now
+        :return: The chapter result the job reports to (None for the search) and the callable with its arguments
+        :rtype : tuple or None
+        """
+        if not update.searched:
+            if update.running:
+                return None
+            update.running += 1
+            return None, self._search, update.local
+
+        if not update.chapters or site_running.get(update.site, 0) >= self.site_limit(update.site):
+            return None
+
+        chapter = update.chapters.popleft()
+        chapter_result = {'chapter': chapter.chapter, 'title': chapter.title, 'status': 'ok', 'pages': 0}
+        update.result['chapters'].append(chapter_result)
+        update.running += 1
+        site_running[update.site] = site_running.get(update.site, 0) + 1
+        return chapter_result, self.manga.update, chapter, update.local, self.checking_pages
+
+    def _search(self, local):
+        """
+        Find a series and load its table of contents, off the dispatching thread
+        :param local: The saved series
+        :type  local: mangadl.manga.SeriesMeta
+
+        :rtype : mangadl.scrapers.MangaScraper.SeriesMeta
+        """
+        return self.manga.resolve(local)
+
+    def _searched(self, update, future):
+        """
+        Queue up the chapters of a series once it has been found
+        """
+        update.searched = True
+        try:
+            remote_series = future.result()
+        except NoSearchResultsError:
+            self.log.warning('No search results returned for {title}'.format(title=update.local.title))
+            update.result['status'] = 'not_found'
+            return
+        except Exception as e:
+            self.log.error('Uncaught exception thrown searching for {title}'.format(title=update.local.title),
+                           exc_info=e)
+            update.result['status'] = 'error'
+            update.result['error'] = str(e)
+            return
+
+        update.remote = remote_series
+        update.site = getattr(remote_series, 'site', None) or ''
+        update.result['site'] = update.site
+        for chapter in list(remote_series.chapters.values()):
+            if self.chapter_filter and not self.chapter_filter(chapter.chapter):
+                continue
+            update.chapters.append(chapter)
+        self.log.info('{title}: {count} chapters queued'.format(title=update.local.title, count=len(update.chapters)))
+
+    def _updated(self, update, chapter_result, future):
+        """
+        Record the outcome of a chapter job
+        """
+        try:
+            chapter_result['pages'] = future.result()
+        except ImageResourceUnavailableError:
+            # The series was most likely licensed and removed, the remaining chapters won't fare any better
+            self.log.warning('{title}: no image resources available'.format(title=update.local.title))
+            chapter_result['status'] = update.result['status'] = 'unavailable'
+            update.chapters.clear()
+        except AttributeError as e:
+            self.log.warning('An exception was raised downloading this chapter', exc_info=e)
+            chapter_result['status'] = 'skipped'
+        except Exception as e:
+            self.log.error('Uncaught exception thrown', exc_info=e)
+            chapter_result['status'] = 'error'
+            chapter_result['error'] = str(e)
+            if update.result['status'] == 'ok':
+                update.result['status'] = 'error'
+
+
+class SeriesUpdate:
+    """
+    Progress of a single series through the scheduler
+    """
+    def __init__(self, local):
+        """
+        Initialize a new Series Update instance
+        :param local: The saved series
+        :type  local: mangadl.manga.SeriesMeta
+        """
+        self.local = local
+        self.site = None
+        self.remote = None
+        self.searched = False
+        self.chapters = deque()
+        self.running = 0
+        self.result = {'title': local.title, 'status': 'ok', 'chapters': []}
+
+    @property
+    def done(self):
+        """
+        Whether the series has no jobs running or left to run
+        :rtype : bool
+        """
+        return self.searched and not self.chapters and not self.running
+
+    @property
+    def succeeded(self):
+        """
+        Whether every chapter job of the series has succeeded
+        :rtype : bool
+        """
+        return self.result['status'] == 'ok' and all(chapter['status'] == 'ok' for chapter in self.result['chapters'])
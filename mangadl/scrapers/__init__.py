@@ -1 +1,2 @@
-from .scraper import ScraperManager, MangaScraper
\ No newline at end of file
+from .scraper import ScraperManager, ScraperRegistry, MangaScraper
+from .engine import AsyncEngine
\ No newline at end of file
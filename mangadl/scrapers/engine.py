@@ -0,0 +1,410 @@
+import asyncio
+import logging
+from time import perf_counter
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from contextlib import asynccontextmanager
+from urllib.error import ContentTooShortError
+from urllib.parse import urlparse
+from mangadl import metrics
+from mangadl.ratelimit import BACKOFF_STATUSES, parse_retry_after
+
+# The engine currently driving the event loop
+_engine = ContextVar('mangadl_async_engine', default=None)
+
+
+async def fetch(url, ttl=None, params=None):
+    """
+    Asynchronously send a GET request through the engine driving the event loop
+    Outside of an engine, the request goes through the shared transport session in the default executor
+    :param url: The URL to request
+    :type  url: str
+
+    :param ttl: Serve the response through the HTTP cache, using it without revalidation for this many seconds
+    :type  ttl: int or None
+
+    :param params: Optional query string parameters
+    :type  params: dict or None
+
+    :rtype : EngineResponse or requests.Response or mangadl.cache.CachedResponse
+    """
+    engine = _engine.get()
+    if engine is None:
+        from mangadl import transport
+        return await asyncio.get_running_loop().run_in_executor(None, partial(transport.get, url, ttl,
+                                                                              params=params))
+    return await engine.fetch(url, ttl, params)
+
+
+class AsyncEngine:
+    """
+    Event loop driver for the asynchronous scraper hooks and page downloads
+
+    Requests share the transport's adaptive per-host rate limiter, HTTP cache and resumable .part downloads with the
+    synchronous code, and are capped per host like the thread pool pipeline is. aiohttp is optional, without it
+    requests are handed to the transport in a thread pool as wide as the engine's concurrency.
+    """
+    def __init__(self, concurrency=100, host_limit=None):
+        """
+        Initialize a new Async Engine instance
+        :param concurrency: Maximum number of requests in flight at once
+        :type  concurrency: int
+
+        :param host_limit: Maximum number of requests in flight to a single host, None for no limit of its own
+        :type  host_limit: int or None
+        """
+        self.log = logging.getLogger('manga-dl.async-engine')
+        self.concurrency = max(1, concurrency)
+        self.host_limit = max(1, host_limit) if host_limit else self.concurrency
+
+        # Set while running
+        self.session = None
+        self.transient_errors = ()
+        self._host_slots = {}
+
+    def run(self, coro):
+        """
+        Run a coroutine to completion on a fresh event loop
+        :param coro: The coroutine to run
+
+        :return: The result of the coroutine
+        """
+        return asyncio.run(self._run(coro))
+
+    async def _run(self, coro):
+        """
+        Run a coroutine with the engine bound to its context, and an HTTP session if aiohttp is available
+        :param coro: The coroutine to run
+        """
+        # Imported here rather than up front, as the HTTP stack is slow to import and not every run needs it
+        from mangadl import transport
+        self._host_slots = {}
+        token = _engine.set(self)
+        try:
+            try:
+                import aiohttp
+            except ImportError:
+                self.log.info('aiohttp is not installed, falling back to executor backed requests')
+                asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(self.concurrency))
+                self.transient_errors = transport.TRANSIENT_ERRORS
+                return await coro
+
+            self.transient_errors = transport.TRANSIENT_ERRORS + (aiohttp.ClientConnectionError,
+                                                                  aiohttp.ClientPayloadError, asyncio.TimeoutError)
+            connect_timeout, read_timeout = transport.session().timeout
+            connector = aiohttp.TCPConnector(limit=self.concurrency)
+            timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+            async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                             headers=transport.DEFAULT_HEADERS) as session:
+                self.session = session
+                try:
+                    return await coro
+                finally:
+                    self.session = None
+        finally:
+            _engine.reset(token)
+
+    def _host_slot(self, url):
+        """
+        Return the semaphore capping the requests in flight to the host of a URL
+        :rtype : asyncio.Semaphore
+        """
+        host = urlparse(url).netloc
+        slot = self._host_slots.get(host)
+        if slot is None:
+            slot = self._host_slots[host] = asyncio.Semaphore(self.host_limit)
+        return slot
+
+    async def _in_executor(self, url, func, *args, **kwargs):
+        """
+        Run a synchronous transport call in the default executor, within the host's slot
+        """
+        async with self._host_slot(url):
+            return await asyncio.get_running_loop().run_in_executor(None, partial(func, *args, **kwargs))
+
+    @staticmethod
+    async def _acquire(limiter, host):
+        """
+        Wait for a host's turn with the rate limiter, without blocking the event loop
+        :type  limiter: mangadl.ratelimit.AdaptiveRateLimiter
+        :type  host: str
+        """
+        waited = 0.0
+        while True:
+            delay = limiter.reserve(host)
+            if not delay:
+                break
+            await asyncio.sleep(delay)
+            waited += delay
+        if waited:
+            metrics.STAGE_SECONDS.observe(waited, stage='throttle')
+
+    @asynccontextmanager
+    async def _get(self, url, headers=None, params=None):
+        """
+        Send a GET request, waiting for the host's turn and retrying if the host asks us to back off
+        The host's slot is held until the response has been consumed
+        :param url: The URL to request
+        :type  url: str
+
+        :param headers: Additional request headers
+        :type  headers: dict or None
+
+        :param params: Optional query string parameters
+        :type  params: dict or None
+
+        :rtype : aiohttp.ClientResponse
+        """
+        import aiohttp
+        from mangadl import transport
+        limiter = transport.session().limiter
+        host = urlparse(url).netloc
+
+        async with self._host_slot(url):
+            attempt = 0
+            while True:
+                if limiter:
+                    await self._acquire(limiter, host)
+
+                start = perf_counter()
+                try:
+                    response = await self.session.get(url, headers=headers, params=params)
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                    if limiter:
+                        limiter.failure(host)
+                    raise
+
+                if response.status not in BACKOFF_STATUSES:
+                    if limiter:
+                        limiter.success(host, perf_counter() - start)
+                    break
+
+                if limiter:
+                    limiter.failure(host, parse_retry_after(response.headers.get('Retry-After')))
+                if attempt >= transport.BACKOFF_RETRIES:
+                    break
+
+                attempt += 1
+                metrics.RETRIES.inc(stage='http')
+                response.release()
+
+            try:
+                yield response
+            finally:
+                response.release()
+
+    async def fetch(self, url, ttl=None, params=None):
+        """
+        Asynchronously send a GET request, reading the response in full
+        :param url: The URL to request
+        :type  url: str
+
+        :param ttl: Serve the response through the HTTP cache, using it without revalidation for this many seconds
+        :type  ttl: int or None
+
+        :param params: Optional query string parameters
+        :type  params: dict or None
+
+        :rtype : EngineResponse or requests.Response or mangadl.cache.CachedResponse
+        """
+        from mangadl import transport
+        if self.session is None:
+            return await self._in_executor(url, transport.get, url, ttl, params=params)
+
+        # Cached responses are only used for plain URLs, like the transport's HTTP cache
+        cache = transport.http_cache() if ttl is not None and not params else None
+        headers = {}
+        if cache:
+            cached, headers = cache.lookup(url, ttl)
+            if cached:
+                return cached
+
+        async with self._get(url, headers, params) as response:
+            response = EngineResponse(str(response.url), response.status, response.headers, await response.read())
+        metrics.BYTES.inc(len(response.content), kind='html')
+
+        if cache and response.status_code == 304:
+            return cache.revalidated(url) or response
+        if cache and response.status_code == 200:
+            cache.store(url, response.headers, response.content)
+        return response
+
+    async def download(self, url, path, chunk_size=64 * 1024):
+        """
+        Asynchronously download a remote resource to the filesystem
+        Like transport.download(), the transfer goes to a .part file that is resumed if the resource hasn't changed
+        :param url: The URL to download
+        :type  url: str
+
+        :param path: Filesystem path to save the resource to
+        :type  path: str
+
+        :param chunk_size: Number of bytes to read and write at a time
+        :type  chunk_size: int
+
+        :return: The number of bytes written during this attempt
+        :rtype : int
+
+        :raises: ContentTooShortError
+        """
+        from mangadl import transport
+        if self.session is None:
+            return await self._in_executor(url, transport.download, url, path, chunk_size)
+
+        import aiohttp
+
+        start = perf_counter()
+        write_seconds = 0.0
+        while True:
+            offset, headers = transport.resume_request(url, path)
+            async with self._get(url, headers) as response:
+                # The partial file is no use to us (likely complete already, or the resource changed), start over
+                if offset and response.status == 416:
+                    transport.discard_part(path)
+                    continue
+                response.raise_for_status()
+
+                # Only append when the server actually continued the same resource, otherwise the full body is coming
+                if transport.resumes(url, path, offset, response.status, response.headers):
+                    mode = 'ab'
+                else:
+                    offset = 0
+                    mode = 'wb'
+
+                expected = -1
+                if 'Content-Length' in response.headers:
+                    expected = offset + int(response.headers['Content-Length'])
+
+                written = 0
+                try:
+                    with open(path + '.part', mode) as file:
+                        try:
+                            async for chunk in response.content.iter_chunked(chunk_size):
+                                write_start = perf_counter()
+                                file.write(chunk)
+                                write_seconds += perf_counter() - write_start
+                                written += len(chunk)
+                        except aiohttp.ClientPayloadError:
+                            # Keep whatever arrived before a dropped connection, we check the length ourselves
+                            if expected < 0:
+                                raise
+                finally:
+                    metrics.BYTES.inc(written, kind='image')
+                    metrics.STAGE_SECONDS.observe(perf_counter() - start - write_seconds, stage='transfer')
+                    metrics.STAGE_SECONDS.observe(write_seconds, stage='disk_write')
+            break
+
+        if 0 <= expected and offset + written < expected:
+            # A dropped connection is as good a sign of a struggling host as an error status
+            limiter = transport.session().limiter
+            if limiter:
+                limiter.failure(urlparse(url).netloc)
+            raise ContentTooShortError('retrieval incomplete: got only {written} out of {expected} bytes'
+                                       .format(written=offset + written, expected=expected), None)
+
+        # Commit the finished download
+        transport.commit_part(path)
+        return written
+
+    async def gather(self, func, items):
+        """
+        Apply a coroutine function to every item, keeping at most `concurrency` calls in flight
+        :param func: Coroutine function taking a single item
+        :param items: The items to process
+        :type  items: list
+
+        :return: The results, in the same order as the items
+        :rtype : list
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def bounded(item):
+            async with semaphore:
+                return await func(item)
+
+        return await asyncio.gather(*[bounded(item) for item in items])
+
+    async def as_completed(self, func, items):
+        """
+        Apply a coroutine function to every item, keeping at most `concurrency` calls in flight, and yield the
+        results as they come in. Once a call fails the rest are cancelled, and its error is raised
+        :param func: Coroutine function taking a single item
+        :param items: The items to process
+        :type  items: list
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def bounded(item):
+            async with semaphore:
+                return await func(item)
+
+        tasks = [asyncio.ensure_future(bounded(item)) for item in items]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            # Don't leave anything running once one of the calls has failed (or we've been interrupted)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def load_chapters(self, series_list):
+        """
+        Load the chapters of several series at once
+        :param series_list: Scraped series to load
+        :type  series_list: list of MangaScraper.SeriesMeta
+
+        :return: The chapters of each series, in the order given
+        :rtype : list of OrderedDict
+        """
+        return self.run(self.gather(lambda series: series.fetch_chapters(), series_list))
+
+    def load_pages(self, chapters):
+        """
+        Load the pages of several chapters at once
+        :param chapters: Scraped chapters to load
+        :type  chapters: list of MangaScraper.ChapterMeta
+
+        :return: The pages of each chapter, in the order given
+        :rtype : list of OrderedDict
+        """
+        return self.run(self.gather(lambda chapter: chapter.fetch_pages(), chapters))
+
+    def load_images(self, pages):
+        """
+        Resolve the images of several pages at once
+        :param pages: Scraped pages to resolve
+        :type  pages: list of MangaScraper.PageMeta
+
+        :return: The image of each page, in the order given
+        :rtype : list of MangaScraper.ImageMeta
+        """
+        return self.run(self.gather(lambda page: page.fetch_image(), pages))
+
+
+class EngineResponse:
+    """
+    A response read in full by the async engine, with the parts of requests.Response that scrapers rely on
+    """
+    from_cache = False
+
+    def __init__(self, url, status_code, headers, content):
+        """
+        Initialize a new Engine Response instance
+        :param url: The final URL of the response
+        :type  url: str
+
+        :param status_code: The response status
+        :type  status_code: int
+
+        :param headers: The response headers
+        :type  headers: collections.abc.Mapping
+
+        :param content: The response body
+        :type  content: bytes
+        """
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
@@ -0,0 +1,86 @@
+import re
+import logging
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.builder import builder_registry
+from mangadl.config import Config
+
+# Parser backends in order of preference when none is configured
+PREFERRED_PARSERS = ('lxml', 'html.parser')
+
+log = logging.getLogger('manga-dl.parsing')
+
+_parser = None
+_restricted = True
+
+
+def available_parsers():
+    """
+    Return the names of the installed BeautifulSoup parser backends
+    :rtype : list of str
+    """
+    return [name for name in ('lxml', 'html5lib', 'html.parser') if builder_registry.lookup(name)]
+
+
+def parser():
+    """
+    Return the name of the parser backend to use, from Common.parser or the fastest one installed
+    :rtype : str
+    """
+    global _parser
+    if _parser is None:
+        config = Config()
+        name = None
+        if config.app_config_exists():
+            name = config.app_config().get('Common', 'parser', fallback=None)
+
+        if name and not builder_registry.lookup(name):
+            log.warning('Configured HTML parser "{name}" is not installed, falling back'.format(name=name))
+            name = None
+        _parser = name or next(name for name in PREFERRED_PARSERS if builder_registry.lookup(name))
+        log.info('Using HTML parser: {name}'.format(name=_parser))
+    return _parser
+
+
+def configure(parser_name=None, restricted=True):
+    """
+    Override the parser backend and whether parsing is restricted to the wanted subtrees
+    :param parser_name: The parser backend to use, or None to pick one automatically
+    :type  parser_name: str or None
+
+    :param restricted: Only build the subtrees the scrapers ask for
+    :type  restricted: bool
+    """
+    global _parser, _restricted
+    _parser = parser_name
+    _restricted = restricted
+
+
+def is_restricted():
+    """
+    Check whether parsing is restricted to the wanted subtrees (and scrapers may use their fast paths)
+    :rtype : bool
+    """
+    return _restricted
+
+
+def soup(content, name=None, attrs=None, **kwargs):
+    """
+    Parse a document, only building the subtrees matching the given filter
+    :param content: The document to parse
+    :type  content: bytes or str
+
+    :param name: Tag name of the subtrees to keep
+    :type  name: str or None
+
+    :param attrs: Attributes (or a CSS class string) the subtrees must have
+    :type  attrs: dict or str or None
+
+    :rtype : BeautifulSoup
+    """
+    parse_only = None
+    if _restricted and (name or attrs or kwargs):
+        # While parsing, class attributes haven't been split into their individual classes yet
+        if isinstance(attrs, str):
+            attrs = {'class': re.compile(r'(^|\s){css_class}(\s|$)'.format(css_class=re.escape(attrs)))}
+        parse_only = SoupStrainer(name, attrs or {}, **kwargs)
+    return BeautifulSoup(content, parser(), parse_only=parse_only)
@@ -1,36 +1,339 @@
 import os
+import json
+import zlib
+import sqlite3
+import asyncio
+import logging
+import threading
+from time import time
 from importlib import import_module
 from collections import OrderedDict
+from collections.abc import Mapping
 from abc import ABCMeta, abstractmethod
+from mangadl import metrics
+from mangadl.config import Config
 
 
 class ScraperManager:
     """
-    Loads and contains all available site scraper classes
+    Registry of all available site scrapers
+
+    Scrapers are discovered through the "mangadl.scrapers" entry point group and the bundled sites package, and the
+    result is kept in a cached manifest, so the available sites are known without importing any of them. Scraper
+    classes (along with their HTTP and parsing dependencies) are only imported once their site is first used.
     """
+    ENTRY_POINT_GROUP = 'mangadl.scrapers'
+    MANIFEST_VERSION = 1
+
+    # The manifest is shared by every manager in the process
+    _manifest = None
+    _manifest_lock = threading.Lock()
+
     def __init__(self):
         """
         Initialize a new Scraper Manager instance
         """
-        self.scrapers = {}
-        self._load_all()
+        self.log = logging.getLogger('manga-dl.scrapers')
+        self.scrapers = ScraperRegistry(self._load_all())
 
     def _load_all(self):
         """
-        Load all available scraper sites
+        Load the manifest of all available scraper sites, rebuilding it if the installed scrapers have changed
+        :return: Import specs ("module:attribute") keyed by site name
+        :rtype : OrderedDict
+        """
+        with self._manifest_lock:
+            if ScraperManager._manifest is not None:
+                return ScraperManager._manifest
+
+            entry_points = self._entry_points()
+            signature = [self.MANIFEST_VERSION, self._sites_signature(), sorted(entry_points.items())]
+            manifest_path = os.path.join(Config().dirs.user_cache_dir, 'scrapers.json')
+
+            manifest = None
+            try:
+                with open(manifest_path) as manifest_file:
+                    cached = json.load(manifest_file)
+                if cached.get('signature') == json.loads(json.dumps(signature)):
+                    manifest = cached['scrapers']
+            except (OSError, ValueError, AttributeError, KeyError):
+                pass
+
+            if manifest is None:
+                self.log.info('Rebuilding the scraper manifest')
+                manifest = self._discover_sites()
+                manifest.update(entry_points)
+                try:
+                    self._write_manifest(manifest_path, {'signature': signature, 'scrapers': manifest})
+                except OSError as e:
+                    self.log.warning('Unable to save the scraper manifest', exc_info=e)
+
+            ScraperManager._manifest = OrderedDict(sorted(manifest.items()))
+            return ScraperManager._manifest
+
+    @staticmethod
+    def _sites_path():
+        return os.path.join(os.path.dirname(os.path.realpath(__file__)), 'sites')
+
+    @classmethod
+    def _site_modules(cls):
+        """
+        Return the names of the bundled scraper modules
+        :rtype : list of str
         """
-        base_dir = os.path.dirname(os.path.realpath(__file__))
-        sites_path = os.path.join(base_dir, 'sites')
-        contents = os.listdir(sites_path)
-        imps = [p.rstrip('.py') for p in contents if not p.startswith('_') and p.endswith('.py')]
+        modules = []
+        for filename in sorted(os.listdir(cls._sites_path())):
+            module, ext = os.path.splitext(filename)
+            if ext == '.py' and not module.startswith('_'):
+                modules.append(module)
+        return modules
+
+    @classmethod
+    def _sites_signature(cls):
+        """
+        Return a signature of the bundled scraper modules that changes whenever one is added, removed or edited
+        :rtype : list
+        """
+        sites_path = cls._sites_path()
+        return [[module, os.stat(os.path.join(sites_path, module + '.py')).st_mtime_ns]
+                for module in cls._site_modules()]
 
-        for imp in imps:
+    def _discover_sites(self):
+        """
+        Import the bundled scraper modules to find the sites they provide
+        :return: Import specs keyed by site name
+        :rtype : dict of (str, str)
+        """
+        manifest = {}
+        for module_name in self._site_modules():
+            module_path = 'mangadl.scrapers.sites.{name}'.format(name=module_name)
             try:
-                module = import_module('mangadl.scrapers.sites.{name}'.format(name=imp))
-                name, scraper_class = module.Scraper
-                self.scrapers[name] = scraper_class
-            except ImportError:
+                name, scraper_class = import_module(module_path).Scraper
+            except (ImportError, AttributeError) as e:
+                self.log.warning('Unable to load the {module} scraper'.format(module=module_name), exc_info=e)
                 continue
+            manifest[name] = '{module}:{attr}'.format(module=module_path, attr=scraper_class.__name__)
+        return manifest
+
+    def _entry_points(self):
+        """
+        Return the scrapers registered by installed packages
+        :return: Import specs keyed by site name
+        :rtype : dict of (str, str)
+        """
+        try:
+            from importlib.metadata import entry_points
+        except ImportError:
+            return {}
+
+        found = entry_points()
+        if hasattr(found, 'select'):
+            found = found.select(group=self.ENTRY_POINT_GROUP)
+        else:
+            found = found.get(self.ENTRY_POINT_GROUP, [])
+        return {entry_point.name: entry_point.value for entry_point in found}
+
+    @staticmethod
+    def _write_manifest(path, manifest):
+        """
+        Atomically write the scraper manifest
+        :param path: Filesystem path to the manifest
+        :type  path: str
+
+        :param manifest: The manifest data
+        :type  manifest: dict
+        """
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory, 0o750)
+
+        temp_path = '{path}.{pid}.tmp'.format(path=path, pid=os.getpid())
+        with open(temp_path, 'w') as manifest_file:
+            json.dump(manifest, manifest_file)
+        os.replace(temp_path, path)
+
+
+class ScraperRegistry(Mapping):
+    """
+    Read-only mapping of site names to scraper classes, importing each class on first access
+    Sites whose scraper can't be imported are treated as missing
+    """
+    def __init__(self, manifest):
+        """
+        Initialize a new Scraper Registry instance
+        :param manifest: Import specs ("module:attribute") keyed by site name
+        :type  manifest: dict of (str, str)
+        """
+        self.log = logging.getLogger('manga-dl.scrapers')
+        self._specs = manifest
+        self._classes = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        spec = self._specs[name]
+        with self._lock:
+            if name not in self._classes:
+                module, _, attr = spec.partition(':')
+                try:
+                    self._classes[name] = getattr(import_module(module), attr)
+                except (ImportError, AttributeError) as e:
+                    self.log.warning('Unable to load the {site} scraper'.format(site=name), exc_info=e)
+                    raise KeyError(name)
+            return self._classes[name]
+
+    def __contains__(self, name):
+        return name in self._specs
+
+    def __iter__(self):
+        return iter(self._specs)
+
+    def __len__(self):
+        return len(self._specs)
+
+
+class MetadataCache:
+    """
+    Persistent cache of scraped metadata, shared by every site scraper
+
+    Chapter lists, page lists and page image links are kept as compressed JSON in SQLite, each level with its own TTL
+    (Cache.toc_ttl, Cache.chapter_ttl and Cache.image_ttl). Table of contents go stale quickly, while the page list of
+    a released chapter practically never changes. A TTL of 0 disables caching that level.
+
+    This is the only layer that decides freshness. Scrapers fetch the pages behind expired entries through the HTTP
+    cache with a TTL of 0, so it never answers on its own and only saves the transfer when the site confirms the
+    page hasn't changed.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS metadata (
+            level  TEXT NOT NULL,
+            url    TEXT NOT NULL,
+            stored REAL NOT NULL,
+            data   BLOB NOT NULL,
+            PRIMARY KEY (level, url)
+        );
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, db_path):
+        """
+        Initialize a new Metadata Cache instance
+        :param db_path: Filesystem path to the cache database
+        :type  db_path: str
+        """
+        self.log = logging.getLogger('manga-dl.metadata-cache')
+        self.db_path = db_path
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode = WAL')
+        self._db.execute('PRAGMA synchronous = NORMAL')
+        self._db.executescript(self.SCHEMA)
+
+    @classmethod
+    def open(cls):
+        """
+        Return the shared metadata cache, creating it on first use
+        :rtype : MetadataCache
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                cache_dir = Config().dirs.user_cache_dir
+                if not os.path.isdir(cache_dir):
+                    os.makedirs(cache_dir, 0o750)
+                cls._instance = cls(os.path.join(cache_dir, 'metadata.db'))
+            return cls._instance
+
+    @staticmethod
+    def ttl(level):
+        """
+        Return the configured TTL of a metadata level
+        :param level: The metadata level, one of "toc", "chapter" or "image"
+        :type  level: str
+
+        :rtype : int
+        """
+        # The transport is only imported once a site is actually being scraped
+        from mangadl import transport
+        return transport.cache_ttl(level)
+
+    def get(self, level, url):
+        """
+        Return cached metadata, if it hasn't expired
+        :param level: The metadata level
+        :type  level: str
+
+        :param url: The URL the metadata was scraped from
+        :type  url: str
+
+        :rtype : dict or None
+        """
+        ttl = self.ttl(level)
+        if ttl <= 0:
+            return None
+
+        with self._lock:
+            row = self._db.execute('SELECT stored, data FROM metadata WHERE level = ? AND url = ?',
+                                   (level, url)).fetchone()
+        if not row or time() - row[0] > ttl:
+            metrics.METADATA_REQUESTS.inc(level=level, result='miss')
+            return None
+
+        metrics.METADATA_REQUESTS.inc(level=level, result='hit')
+        return json.loads(zlib.decompress(row[1]).decode('utf-8'))
+
+    def delete(self, level, url):
+        """
+        Remove cached metadata, e.g. once the site has rejected it
+        :param level: The metadata level
+        :type  level: str
+
+        :param url: The URL the metadata was scraped from
+        :type  url: str
+        """
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM metadata WHERE level = ? AND url = ?', (level, url))
+
+    def set(self, level, url, data):
+        """
+        Cache metadata
+        :param level: The metadata level
+        :type  level: str
+
+        :param url: The URL the metadata was scraped from
+        :type  url: str
+
+        :param data: The metadata, it must be JSON serializable
+        :type  data: dict
+        """
+        if self.ttl(level) <= 0:
+            return
+
+        blob = zlib.compress(json.dumps(data, separators=(',', ':')).encode('utf-8'))
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO metadata (level, url, stored, data) VALUES (?, ?, ?, ?)',
+                             (level, url, time(), blob))
+
+
+def _class_spec(cls):
+    """
+    Return the import spec ("module:qualified name") of a class
+    :rtype : str
+    """
+    return '{module}:{name}'.format(module=cls.__module__, name=cls.__qualname__)
+
+
+def _spec_class(spec):
+    """
+    Import a class by its import spec
+    :rtype : type
+    """
+    module, _, name = spec.partition(':')
+    obj = import_module(module)
+    for attr in name.split('.'):
+        obj = getattr(obj, attr)
+    return obj
 
 
 class MangaScraper(metaclass=ABCMeta):
@@ -47,6 +350,9 @@ class MangaScraper(metaclass=ABCMeta):
         self.search_url = search_url
         self._series = NotImplemented
 
+        # Seconds a search request may take, None for the transport's default
+        self.search_timeout = None
+
     @property
     def series(self):
         return self._series
@@ -82,6 +388,7 @@ class MangaScraper(metaclass=ABCMeta):
             self.title = title
             self.alt_titles = alt_titles
             self.chapter_count = chapter_count
+            self.site = None
             self._chapters = OrderedDict()
 
         @abstractmethod
@@ -96,14 +403,73 @@ class MangaScraper(metaclass=ABCMeta):
             """
             Chapters property
             """
-            if self._chapters:
+            if self._chapters or self._restore_cached_chapters():
                 return self._chapters
 
-            self._load_chapters()
+            with metrics.STAGE_SECONDS.time(stage='toc'):
+                self._load_chapters()
             # Chapters are inserted in backwards order, so we need to reverse the dictionary
             self._chapters = OrderedDict(reversed(list(self._chapters.items())))
+            self._cache_chapters()
+            return self._chapters
+
+        async def _load_chapters_async(self):
+            """
+            Asynchronously load and parse all available chapters for the series
+            Scrapers without a native implementation run the synchronous loader in an executor
+            """
+            await asyncio.get_running_loop().run_in_executor(None, self._load_chapters)
+
+        async def fetch_chapters(self):
+            """
+            Asynchronous counterpart of the chapters property
+            :rtype : OrderedDict
+            """
+            if self._chapters or self._restore_cached_chapters():
+                return self._chapters
+
+            with metrics.STAGE_SECONDS.time(stage='toc'):
+                await self._load_chapters_async()
+            self._chapters = OrderedDict(reversed(list(self._chapters.items())))
+            self._cache_chapters()
             return self._chapters
 
+        def _restore_cached_chapters(self):
+            """
+            Restore the chapters from the metadata cache
+            :return: True if the chapters were restored
+            :rtype : bool
+            """
+            cached = MetadataCache.open().get('toc', self.url)
+            if not cached:
+                return False
+            try:
+                chapter_class = _spec_class(cached['class'])
+                self.restore_chapters([chapter_class(url, title, chapter, self)
+                                       for url, title, chapter in cached['chapters']])
+            except (ImportError, AttributeError, KeyError, TypeError, ValueError):
+                return False
+            return True
+
+        def _cache_chapters(self):
+            """
+            Save the chapters to the metadata cache
+            """
+            chapters = list(self._chapters.values())
+            if chapters:
+                MetadataCache.open().set('toc', self.url, {
+                    'class': _class_spec(type(chapters[0])),
+                    'chapters': [[chapter.url, chapter.title, chapter.chapter] for chapter in chapters]
+                })
+
+        def restore_chapters(self, chapters):
+            """
+            Restore previously loaded chapters, in place of loading them from the site
+            :param chapters: The chapters, in the order the chapters property returns them
+            :type  chapters: list of MangaScraper.ChapterMeta
+            """
+            self._chapters = OrderedDict((chapter.chapter, chapter) for chapter in chapters)
+
     class ChapterMeta(metaclass=ABCMeta):
         """
         Chapter metadata base class
@@ -139,12 +505,69 @@ class MangaScraper(metaclass=ABCMeta):
             """
             Chapters property
             """
-            if self._pages:
+            if self._pages or self._restore_cached_pages():
+                return self._pages
+
+            with metrics.STAGE_SECONDS.time(stage='chapter'):
+                self._load_pages()
+            self._cache_pages()
+            return self._pages
+
+        async def _load_pages_async(self):
+            """
+            Asynchronously load and parse all available pages for the chapter
+            Scrapers without a native implementation run the synchronous loader in an executor
+            """
+            await asyncio.get_running_loop().run_in_executor(None, self._load_pages)
+
+        async def fetch_pages(self):
+            """
+            Asynchronous counterpart of the pages property
+            :rtype : OrderedDict
+            """
+            if self._pages or self._restore_cached_pages():
                 return self._pages
 
-            self._load_pages()
+            with metrics.STAGE_SECONDS.time(stage='chapter'):
+                await self._load_pages_async()
+            self._cache_pages()
             return self._pages
 
+        def _restore_cached_pages(self):
+            """
+            Restore the pages from the metadata cache
+            :return: True if the pages were restored
+            :rtype : bool
+            """
+            cached = MetadataCache.open().get('chapter', self.url)
+            if not cached:
+                return False
+            try:
+                page_class = _spec_class(cached['class'])
+                self.restore_pages([page_class(url, page_no, self) for url, page_no in cached['pages']])
+            except (ImportError, AttributeError, KeyError, TypeError, ValueError):
+                return False
+            return True
+
+        def _cache_pages(self):
+            """
+            Save the pages to the metadata cache
+            """
+            pages = list(self._pages.values())
+            if pages:
+                MetadataCache.open().set('chapter', self.url, {
+                    'class': _class_spec(type(pages[0])),
+                    'pages': [[page.url, page.page] for page in pages]
+                })
+
+        def restore_pages(self, pages):
+            """
+            Restore previously loaded pages, in place of loading them from the site
+            :param pages: The pages, in order
+            :type  pages: list of MangaScraper.PageMeta
+            """
+            self._pages = OrderedDict((page.page, page) for page in pages)
+
     class PageMeta(metaclass=ABCMeta):
         """
         Page metadata base class
@@ -176,12 +599,72 @@ class MangaScraper(metaclass=ABCMeta):
             """
             Image property
             """
-            if self._image:
+            if self._image or self._restore_cached_image():
+                return self._image
+
+            with metrics.STAGE_SECONDS.time(stage='page'):
+                self._load_image()
+            self._cache_image()
+            return self._image
+
+        async def _load_image_async(self):
+            """
+            Asynchronously load and parse a pages image
+            Scrapers without a native implementation run the synchronous loader in an executor
+            """
+            await asyncio.get_running_loop().run_in_executor(None, self._load_image)
+
+        async def fetch_image(self):
+            """
+            Asynchronous counterpart of the image property
+            :rtype : MangaScraper.ImageMeta
+            """
+            if self._image or self._restore_cached_image():
                 return self._image
 
-            self._load_image()
+            with metrics.STAGE_SECONDS.time(stage='page'):
+                await self._load_image_async()
+            self._cache_image()
             return self._image
 
+        def _restore_cached_image(self):
+            """
+            Restore the image from the metadata cache
+            :return: True if the image was restored
+            :rtype : bool
+            """
+            cached = MetadataCache.open().get('image', self.url)
+            if not cached:
+                return False
+            try:
+                self.restore_image(_spec_class(cached['class'])(cached['url'], self))
+            except (ImportError, AttributeError, KeyError, TypeError, ValueError):
+                return False
+            return True
+
+        def _cache_image(self):
+            """
+            Save the image to the metadata cache
+            """
+            if self._image:
+                MetadataCache.open().set('image', self.url, {'class': _class_spec(type(self._image)),
+                                                             'url': self._image.url})
+
+        def restore_image(self, image):
+            """
+            Restore a previously resolved image, in place of loading it from the site
+            :param image: The page image
+            :type  image: MangaScraper.ImageMeta
+            """
+            self._image = image
+
+        def forget_image(self):
+            """
+            Drop the resolved image, so the next access resolves it from the site again (e.g. after its link expired)
+            """
+            self._image = None
+            MetadataCache.open().delete('image', self.url)
+
     class ImageMeta:
         """
         Image metadata base class
@@ -1,15 +1,28 @@
-import requests
-from bs4 import BeautifulSoup
+import re
+from html import unescape
+from mangadl import transport
 from mangadl.scrapers import MangaScraper
-from mangadl.manga import NoSearchResultsError
+from mangadl.scrapers.engine import fetch
+from mangadl.scrapers.parsing import soup, is_restricted
+from mangadl.manga import NoSearchResultsError, SeriesNotFoundError
 
 
 class MangaHere(MangaScraper):
+    # Where search queries are submitted, may be pointed elsewhere (e.g. a local stand-in for benchmarking)
+    SEARCH_URL = 'http://www.mangahere.co/search.php'
+
+    # Fast path for pulling the page image out of the page without building a tree. Like the tree based parser it
+    # only looks inside the read_img section, and attribute names must stand on their own (id, not data-id)
+    READ_IMG_PATTERN = re.compile(rb'<section\b[^>]*?(?<![\w-])class\s*=\s*["\']?[^"\'>]*?(?<![\w-])read_img(?![\w-])'
+                                  rb'[^>]*>', re.IGNORECASE)
+    IMAGE_TAG_PATTERN = re.compile(rb'<img\b[^>]*?(?<![\w-])id\s*=\s*["\']?image(?=["\'\s/>])[^>]*>', re.IGNORECASE)
+    IMAGE_SRC_PATTERN = re.compile(rb'(?<![\w-])src\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))', re.IGNORECASE)
+
     def __init__(self):
         """
         Initialize a new MangaHere scraper instance
         """
-        super().__init__('http://www.mangahere.co/search.php')
+        super().__init__(self.SEARCH_URL)
 
     @MangaScraper.series.setter
     def series(self, title):
@@ -18,8 +31,22 @@ class MangaHere(MangaScraper):
         :param title: Title of the manga series
         :type  title: str
         """
-        search_request = requests.get(self.search_url, params={'name': title})
-        search_soup = BeautifulSoup(search_request.content)
+        search_request = transport.get(self.search_url, params={'name': title},
+                                       timeout=self.search_timeout or transport.DEFAULT_TIMEOUT)
+        self._series = self._parse_search(search_request.content)
+
+    @staticmethod
+    def _parse_search(content):
+        """
+        Parse the first result out of a search results page
+        :param content: The search results page
+        :type  content: bytes
+
+        :rtype : MangaHere.SeriesMeta
+
+        :raises: NoSearchResultsError
+        """
+        search_soup = soup(content, 'div', 'result_search')
 
         # Pull the first listed result
         try:
@@ -46,7 +73,7 @@ class MangaHere(MangaScraper):
             alt_titles = alt_titles.replace('Alternative Name:', '')
             alt_titles = [title.strip() for title in alt_titles.split(';')]
 
-        self._series = MangaHere.SeriesMeta(url, title, alt_titles, chapter_count)
+        return MangaHere.SeriesMeta(url, title, alt_titles, chapter_count)
 
     class SeriesMeta(MangaScraper.SeriesMeta):
         """
@@ -57,8 +84,28 @@ class MangaHere(MangaScraper):
             Load and parse all available chapters for the series
             """
             # Set up and execute the Table of Contents request
-            toc_request = requests.get(self.url)
-            toc_soup = BeautifulSoup(toc_request.content)
+            # Freshness is up to the metadata cache, the HTTP cache only revalidates what it has stored
+            toc_request = transport.get(self.url, ttl=0)
+            if toc_request.status_code == 404:
+                raise SeriesNotFoundError
+            self._parse_chapters(toc_request.content)
+
+        async def _load_chapters_async(self):
+            """
+            Asynchronously load and parse all available chapters for the series
+            """
+            toc_request = await fetch(self.url, ttl=0)
+            if toc_request.status_code == 404:
+                raise SeriesNotFoundError
+            self._parse_chapters(toc_request.content)
+
+        def _parse_chapters(self, content):
+            """
+            Parse the chapters out of the Table of Contents page
+            :param content: The Table of Contents page
+            :type  content: bytes
+            """
+            toc_soup = soup(content, 'div', 'detail_list')
 
             # Get a list of chapters
             detail_list = toc_soup.find('div', 'detail_list').ul
@@ -89,8 +136,23 @@ class MangaHere(MangaScraper):
             Load and parse all available pages for the series
             """
             # Set up and execute the pages request for the chapter
-            pages_request = requests.get(self.url)
-            pages_soup = BeautifulSoup(pages_request.content)
+            pages_request = transport.get(self.url, ttl=0)
+            self._parse_pages(pages_request.content)
+
+        async def _load_pages_async(self):
+            """
+            Asynchronously load and parse all available pages for the series
+            """
+            pages_request = await fetch(self.url, ttl=0)
+            self._parse_pages(pages_request.content)
+
+        def _parse_pages(self, content):
+            """
+            Parse the pages out of the chapter page selector
+            :param content: The first page of the chapter
+            :type  content: bytes
+            """
+            pages_soup = soup(content, 'div', 'go_page')
 
             # Get a list of pages
             go_header = pages_soup.find('div', 'go_page')
@@ -111,8 +173,36 @@ class MangaHere(MangaScraper):
             Load and parse a pages image
             """
             # Set up and execute the page request for the chapter
-            page_request = requests.get(self.url)
-            page_soup = BeautifulSoup(page_request.content)
+            page_request = transport.get(self.url)
+            self._parse_image(page_request.content)
+
+        async def _load_image_async(self):
+            """
+            Asynchronously load and parse a pages image
+            """
+            page_request = await fetch(self.url)
+            self._parse_image(page_request.content)
+
+        def _parse_image(self, content):
+            """
+            Parse the image link out of a page
+            :param content: The page
+            :type  content: bytes
+            """
+            if is_restricted():
+                section = MangaHere.READ_IMG_PATTERN.search(content)
+                tag = None
+                if section:
+                    section_end = content.find(b'</section', section.end())
+                    tag = MangaHere.IMAGE_TAG_PATTERN.search(content, section.end(),
+                                                             section_end if section_end >= 0 else len(content))
+                src = MangaHere.IMAGE_SRC_PATTERN.search(tag.group(0)) if tag else None
+                if src:
+                    url = next(group for group in src.groups() if group is not None)
+                    self._image = MangaScraper.ImageMeta(unescape(url.decode('utf-8')), self)
+                    return
+
+            page_soup = soup(content, 'section', 'read_img')
 
             # Get the page image link
             image = page_soup.find('section', 'read_img').find('img', id='image')
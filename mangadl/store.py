@@ -0,0 +1,192 @@
+import os
+import shutil
+import hashlib
+import logging
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Linux ioctl used to create copy-on-write clones (reflinks) of a file
+FICLONE = 0x40049409
+
+# Suffix of the marker left next to a blob that some page refers to through a reflink or copy rather than a hardlink
+COPIED_SUFFIX = '.copied'
+
+
+class BlobStore:
+    """
+    Content addressed page store
+
+    Every distinct page image is kept once under its SHA-256 hash, and page files in the chapter directories are
+    hardlinks into the store (or reflinks / copies where hardlinks aren't possible).
+    """
+    def __init__(self, path):
+        """
+        Initialize a new Blob Store instance
+        :param path: Directory to keep the blobs in
+        :type  path: str
+        """
+        self.log = logging.getLogger('manga-dl.blob-store')
+        self.path = path
+        self._lock = threading.Lock()
+
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path, 0o755)
+
+    @classmethod
+    def open(cls, manga_path):
+        """
+        Return the page store of a Manga library
+        :param manga_path: The root directory of the Manga library
+        :type  manga_path: str
+
+        :rtype : BlobStore
+        """
+        return cls(os.path.join(manga_path, '.blobs'))
+
+    @staticmethod
+    def hash_file(path, chunk_size=64 * 1024):
+        """
+        Return the SHA-256 hash of a file
+        :param path: Filesystem path to the file
+        :type  path: str
+
+        :rtype : str
+        """
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(chunk_size), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def blob_path(self, digest):
+        """
+        Return the filesystem path of a blob
+        :param digest: The SHA-256 hash of the blob
+        :type  digest: str
+
+        :rtype : str
+        """
+        return os.path.join(self.path, digest[:2], digest[2:])
+
+    def add(self, path):
+        """
+        Move a page into the store, replacing it with a link to its blob
+        If an identical page is already stored, the page is linked to the existing blob and its own copy discarded
+        :param path: Filesystem path to the page
+        :type  path: str
+
+        :return: True if the page was a duplicate of an already stored blob, otherwise False
+        :rtype : bool
+        """
+        blob_path = self.blob_path(self.hash_file(path))
+
+        with self._lock:
+            if not os.path.exists(blob_path):
+                # New content, the page itself becomes the blob
+                os.makedirs(os.path.dirname(blob_path), 0o755, exist_ok=True)
+                try:
+                    os.link(path, blob_path)
+                except OSError:
+                    shutil.copy2(path, blob_path)
+                    self._mark_copied(blob_path)
+                return False
+
+            # Already linked to this blob, nothing to do
+            if os.path.samefile(path, blob_path):
+                return True
+
+            self.log.debug('Deduplicating {path}'.format(path=path))
+            self.link(blob_path, path)
+            return True
+
+    def link(self, blob_path, path):
+        """
+        Atomically replace a file with a hardlink to a blob, falling back to a reflink and then a plain copy
+        :param blob_path: Filesystem path to the blob
+        :type  blob_path: str
+
+        :param path: Filesystem path to replace
+        :type  path: str
+        """
+        temp_path = path + '.link'
+        try:
+            os.link(blob_path, temp_path)
+        except OSError:
+            if not self._reflink(blob_path, temp_path):
+                shutil.copy2(blob_path, temp_path)
+            self._mark_copied(blob_path)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def _mark_copied(blob_path):
+        """
+        Record that a blob is referenced by something its link count doesn't reflect
+        :param blob_path: Filesystem path to the blob
+        :type  blob_path: str
+        """
+        open(blob_path + COPIED_SUFFIX, 'a').close()
+
+    @staticmethod
+    def _reflink(source, destination):
+        """
+        Attempt to create a copy-on-write clone of a file
+        :rtype : bool
+        """
+        if fcntl is None:
+            return False
+
+        with open(source, 'rb') as source_file, open(destination, 'wb') as destination_file:
+            try:
+                fcntl.ioctl(destination_file.fileno(), FICLONE, source_file.fileno())
+                return True
+            except OSError:
+                pass
+        os.remove(destination)
+        return False
+
+    def dedupe(self, paths):
+        """
+        Convert existing pages to links into the store
+        :param paths: Filesystem paths to the pages
+        :type  paths: iterable of str
+
+        :return: The number of duplicate pages found and the number of bytes they freed
+        :rtype : tuple of (int, int)
+        """
+        duplicates = 0
+        freed = 0
+        for path in paths:
+            stat = os.stat(path)
+            # Pages that already share their inode with something have been stored before
+            if stat.st_nlink > 1:
+                continue
+            if self.add(path):
+                duplicates += 1
+                freed += stat.st_size
+        return duplicates, freed
+
+    def prune(self):
+        """
+        Remove blobs that are no longer linked to by any page
+        A blob without other links is only known to be unreferenced if every page using it was hardlinked, so blobs
+        that were ever reflinked or copied (on filesystems without hardlink support) are always kept
+        :return: The number of blobs removed
+        :rtype : int
+        """
+        removed = 0
+        with self._lock:
+            for prefix in os.listdir(self.path):
+                prefix_path = os.path.join(self.path, prefix)
+                names = set(os.listdir(prefix_path))
+                for name in names:
+                    if name.endswith(COPIED_SUFFIX) or name + COPIED_SUFFIX in names:
+                        continue
+                    blob_path = os.path.join(prefix_path, name)
+                    if os.stat(blob_path).st_nlink == 1:
+                        os.remove(blob_path)
+                        removed += 1
+        return removed
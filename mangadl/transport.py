@@ -0,0 +1,387 @@
+import os
+import json
+import threading
+from time import perf_counter
+from urllib.error import ContentTooShortError
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from mangadl import __version__, metrics, ratelimit
+from mangadl.config import Config
+from mangadl.cache import HttpCache
+from mangadl.ratelimit import AdaptiveRateLimiter, BACKOFF_STATUSES, parse_retry_after
+
+# Default (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (10, 30)
+
+# Headers sent with every request
+DEFAULT_HEADERS = {'User-Agent': 'MangaDL/{version}'.format(version=__version__)}
+
+# Default cache size in megabytes and per-resource cache TTLs in seconds
+DEFAULT_CACHE_SIZE = 100
+DEFAULT_CACHE_TTLS = {'toc': 600, 'chapter': 30 * 24 * 60 * 60, 'image': 24 * 60 * 60}
+
+# Number of times a request answered with a back off status (429 / 5xx) is retried
+BACKOFF_RETRIES = 3
+
+# Errors worth retrying a transfer for
+TRANSIENT_ERRORS = (ContentTooShortError, requests.ConnectionError, requests.Timeout,
+                    requests.exceptions.ChunkedEncodingError)
+
+_session = None
+_session_lock = threading.Lock()
+_cache = None
+
+
+class Session(requests.Session):
+    """
+    HTTP session with a keep-alive connection pool, default timeouts and adaptive per-host rate limiting
+    """
+    def __init__(self, pool_size=10, timeout=DEFAULT_TIMEOUT, limiter=None):
+        """
+        Initialize a new Session instance
+        :param pool_size: Number of connections to keep alive per host
+        :type  pool_size: int
+
+        :param timeout: Default (connect, read) timeouts in seconds
+        :type  timeout: tuple of (float, float)
+
+        :param limiter: Rate limiter every request waits on and reports back to
+        :type  limiter: mangadl.ratelimit.AdaptiveRateLimiter or None
+        """
+        super().__init__()
+        self.timeout = timeout
+        self.limiter = limiter
+        self.headers.update(DEFAULT_HEADERS)
+
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    def request(self, method, url, **kwargs):
+        """
+        Send a request, applying the default timeout unless one was given
+        When rate limited, the request waits for its host's turn and is retried if the host asks us to back off
+        :rtype : requests.Response
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        if self.limiter is None:
+            return super().request(method, url, **kwargs)
+
+        host = urlparse(url).netloc
+        attempt = 0
+        while True:
+            waited = self.limiter.acquire(host)
+            if waited:
+                metrics.STAGE_SECONDS.observe(waited, stage='throttle')
+
+            start = perf_counter()
+            try:
+                response = super().request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self.limiter.failure(host)
+                raise
+
+            if response.status_code not in BACKOFF_STATUSES:
+                self.limiter.success(host, perf_counter() - start)
+                return response
+
+            self.limiter.failure(host, parse_retry_after(response.headers.get('Retry-After')))
+            if attempt >= BACKOFF_RETRIES or method.upper() not in ('GET', 'HEAD'):
+                return response
+
+            attempt += 1
+            metrics.RETRIES.inc(stage='http')
+            response.close()
+
+
+def session():
+    """
+    Return the process-wide HTTP session, creating it on first use
+    The pool is sized to the configured worker count
+    :rtype : Session
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            app_config = _app_config()
+            pool_size = 10
+            timeout = DEFAULT_TIMEOUT
+            if app_config:
+                pool_size = max(pool_size, app_config.getint('Common', 'workers', fallback=1))
+                read_timeout = app_config.getfloat('Common', 'timeout', fallback=DEFAULT_TIMEOUT[1])
+                timeout = (DEFAULT_TIMEOUT[0], read_timeout)
+            _session = Session(pool_size, timeout, rate_limiter(app_config))
+        return _session
+
+
+def rate_limiter(app_config):
+    """
+    Create the per-host rate limiter from the RateLimit configuration section
+    The initial rate follows Common.throttle (the delay between requests), or starts at the maximum rate if unset
+    :param app_config: The application configuration, if MangaDL has been set up
+    :type  app_config: ConfigParser or None
+
+    :rtype : AdaptiveRateLimiter
+    """
+    if not app_config:
+        return AdaptiveRateLimiter()
+
+    min_rate = app_config.getfloat('RateLimit', 'min_rate', fallback=ratelimit.DEFAULT_MIN_RATE)
+    max_rate = app_config.getfloat('RateLimit', 'max_rate', fallback=ratelimit.DEFAULT_MAX_RATE)
+    burst = app_config.getint('RateLimit', 'burst', fallback=ratelimit.DEFAULT_BURST)
+    throttle = app_config.getfloat('Common', 'throttle', fallback=0)
+    return AdaptiveRateLimiter(1 / throttle if throttle > 0 else max_rate, min_rate, max_rate, burst)
+
+
+def _app_config():
+    """
+    Return the application configuration, if MangaDL has been set up
+    :rtype : ConfigParser or None
+    """
+    config = Config()
+    return config.app_config() if config.app_config_exists() else None
+
+
+def http_cache():
+    """
+    Return the process-wide HTTP response cache, creating it on first use
+    :rtype : HttpCache
+    """
+    global _cache
+    # Create the session first, outside of the lock it takes itself
+    http_session = session()
+    with _session_lock:
+        if _cache is None:
+            app_config = _app_config()
+            max_size = DEFAULT_CACHE_SIZE
+            if app_config:
+                max_size = app_config.getint('Cache', 'size', fallback=DEFAULT_CACHE_SIZE)
+            path = os.path.join(Config().dirs.user_cache_dir, 'http')
+            _cache = HttpCache(path, max_size * 1024 * 1024, http_session)
+        return _cache
+
+
+def cache_ttl(resource):
+    """
+    Return the configured cache TTL for a type of resource
+    :param resource: The resource type, one of "toc", "chapter" or "image"
+    :type  resource: str
+
+    :return: TTL in seconds
+    :rtype : int
+    """
+    app_config = _app_config()
+    default = DEFAULT_CACHE_TTLS[resource]
+    if not app_config:
+        return default
+    return app_config.getint('Cache', '{resource}_ttl'.format(resource=resource), fallback=default)
+
+
+def get(url, ttl=None, **kwargs):
+    """
+    Send a GET request through the shared session
+    :param url: The URL to request
+    :type  url: str
+
+    :param ttl: Serve the response through the HTTP cache, using it without revalidation for this many seconds
+    :type  ttl: int or None
+
+    :rtype : requests.Response or mangadl.cache.CachedResponse
+    """
+    if ttl is not None:
+        response = http_cache().get(url, ttl, **kwargs)
+    else:
+        response = session().get(url, **kwargs)
+
+    # Streamed bodies are counted by whoever consumes them
+    if not kwargs.get('stream') and not getattr(response, 'from_cache', False):
+        metrics.BYTES.inc(len(response.content), kind='html')
+    return response
+
+
+def resume_request(url, path):
+    """
+    Work out how to resume a download from the .part file left over from an earlier attempt
+
+    A partial transfer is only resumed if it was started from the same URL and the server gave us a validator for
+    it. The validator is sent as If-Range, so the server answers with the rest of the same resource or with all of
+    its current version. Anything else is thrown away and the download starts over.
+    :param url: The URL being downloaded
+    :type  url: str
+
+    :param path: Filesystem path the resource is being saved to
+    :type  path: str
+
+    :return: The offset to resume from and the headers to send
+    :rtype : tuple of (int, dict)
+    """
+    # Ask for the raw bytes, so that lengths and ranges refer to what we write to disk
+    headers = {'Accept-Encoding': 'identity'}
+    try:
+        offset = os.path.getsize(path + '.part')
+    except OSError:
+        offset = 0
+
+    validator = _read_part_validator(path)
+    if_range = None
+    if validator and validator.get('url') == url:
+        etag = validator.get('etag')
+        # Weak entity tags can't be used for range requests
+        if_range = etag if etag and not etag.startswith('W/') else validator.get('last_modified')
+
+    if not offset or not if_range:
+        discard_part(path)
+        return 0, headers
+
+    headers['Range'] = 'bytes={offset}-'.format(offset=offset)
+    headers['If-Range'] = if_range
+    return offset, headers
+
+
+def resumes(url, path, offset, status, headers):
+    """
+    Check whether a response continues the partial transfer we asked to resume
+    Otherwise the full body is coming, and whatever we had is discarded
+    :param url: The URL being downloaded
+    :type  url: str
+
+    :param path: Filesystem path the resource is being saved to
+    :type  path: str
+
+    :param offset: The offset the transfer was resumed from, 0 if it wasn't
+    :type  offset: int
+
+    :param status: The response status
+    :type  status: int
+
+    :param headers: The response headers
+    :type  headers: collections.abc.Mapping
+
+    :rtype : bool
+    """
+    content_range = headers.get('Content-Range', '')
+    if offset and status == 206 and content_range.startswith('bytes {offset}-'.format(offset=offset)):
+        validator = _read_part_validator(path) or {}
+        etag = headers.get('ETag')
+        if not etag or not validator.get('etag') or etag == validator['etag']:
+            return True
+
+    # Start the transfer over, remembering what identifies this version of the resource
+    discard_part(path)
+    _write_part_validator(path, {'url': url, 'etag': headers.get('ETag'),
+                                 'last_modified': headers.get('Last-Modified')})
+    return False
+
+
+def commit_part(path):
+    """
+    Move a finished download into place
+    :param path: Filesystem path the resource was saved to
+    :type  path: str
+    """
+    os.replace(path + '.part', path)
+    _remove(path + '.part.json')
+
+
+def discard_part(path):
+    """
+    Throw away a partial download along with its validator
+    :param path: Filesystem path the resource is being saved to
+    :type  path: str
+    """
+    _remove(path + '.part')
+    _remove(path + '.part.json')
+
+
+def _read_part_validator(path):
+    try:
+        with open(path + '.part.json') as validator_file:
+            return json.load(validator_file)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_part_validator(path, validator):
+    with open(path + '.part.json', 'w') as validator_file:
+        json.dump(validator, validator_file)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def download(url, path, chunk_size=64 * 1024):
+    """
+    Download a remote resource to the filesystem through the shared session
+
+    The transfer goes to a temporary .part file which is renamed into place once complete. If a .part file is
+    left over from an earlier, interrupted attempt, the download resumes from where it stopped when the server
+    supports range requests and the resource hasn't changed since.
+    :param url: The URL to download
+    :type  url: str
+
+    :param path: Filesystem path to save the resource to
+    :type  path: str
+
+    :param chunk_size: Number of bytes to read and write at a time
+    :type  chunk_size: int
+
+    :return: The number of bytes written during this attempt
+    :rtype : int
+
+    :raises: ContentTooShortError
+    """
+    part_path = path + '.part'
+    offset, headers = resume_request(url, path)
+
+    start = perf_counter()
+    write_seconds = 0.0
+    with get(url, stream=True, headers=headers) as response:
+        # The partial file is no use to us (likely complete already, or the resource changed), start over
+        if offset and response.status_code == 416:
+            discard_part(path)
+            return download(url, path, chunk_size)
+        response.raise_for_status()
+
+        # Only append when the server actually continued the same resource, otherwise the full body is coming
+        if resumes(url, path, offset, response.status_code, response.headers):
+            mode = 'ab'
+        else:
+            offset = 0
+            mode = 'wb'
+
+        expected = -1
+        if 'Content-Length' in response.headers:
+            expected = offset + int(response.headers['Content-Length'])
+
+        # Keep whatever arrives before a dropped connection, we check the length ourselves
+        response.raw.enforce_content_length = False
+
+        written = 0
+        try:
+            with open(part_path, mode) as file:
+                for chunk in response.iter_content(chunk_size):
+                    write_start = perf_counter()
+                    file.write(chunk)
+                    write_seconds += perf_counter() - write_start
+                    written += len(chunk)
+        finally:
+            metrics.BYTES.inc(written, kind='image')
+            metrics.STAGE_SECONDS.observe(perf_counter() - start - write_seconds, stage='transfer')
+            metrics.STAGE_SECONDS.observe(write_seconds, stage='disk_write')
+
+    if 0 <= expected and offset + written < expected:
+        # A dropped connection is as good a sign of a struggling host as an error status
+        limiter = session().limiter
+        if limiter:
+            limiter.failure(urlparse(url).netloc)
+        raise ContentTooShortError('retrieval incomplete: got only {written} out of {expected} bytes'
+                                   .format(written=offset + written, expected=expected), None)
+
+    # Commit the finished download
+    commit_part(path)
+    return written
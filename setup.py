@@ -1,4 +1,4 @@
-#!/usr/bin/env python3.4
+#!/usr/bin/env python3
 
 from setuptools import setup, find_packages
 from mangadl import __version__
@@ -15,9 +15,13 @@ setup(name='MangaDL',
       author_email='makoto@makoto.io',
 
       packages=find_packages(),
+      python_requires='>=3.7',
       entry_points={
           'console_scripts': [
               'manga-dl = mangadl.manga_dl:main',
+          ],
+          'mangadl.scrapers': [
+              'MangaHere = mangadl.scrapers.sites.mangahere:MangaHere',
           ]
       },
 
@@ -27,16 +31,20 @@ setup(name='MangaDL',
           'Intended Audience :: End Users/Desktop',
           'License :: OSI Approved :: MIT License',
           'Natural Language :: English',
-          'Programming Language :: Python :: 3.4',
+          'Programming Language :: Python :: 3',
+          'Programming Language :: Python :: 3 :: Only',
           'Topic :: Internet :: WWW/HTTP :: Indexing/Search'
       ],
 
       install_requires=[
-          'requests~=2.6',
-          'img2pdf~=0.1.5',
+          'requests>=2.18',
+          'Pillow>=2.8',
           'clint~=0.4.1',
           'appdirs~=1.4',
           'progressbar33~=2.4',
           'beautifulsoup4~=4.3.2'
       ],
+      extras_require={
+          'async': ['aiohttp~=3.8']
+      },
       )
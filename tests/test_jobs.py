@@ -0,0 +1,150 @@
+import os
+import shutil
+import tempfile
+import unittest
+from mangadl.jobs import JobQueue
+from mangadl.scrapers import MangaScraper
+
+
+class StubSite(MangaScraper):
+    """
+    Scraper whose metadata is only ever restored, never loaded from a site
+    """
+    @MangaScraper.series.setter
+    def series(self, title):
+        pass
+
+    class SeriesMeta(MangaScraper.SeriesMeta):
+        def _load_chapters(self):
+            raise AssertionError('Restored series should not be loaded from the site')
+
+    class ChapterMeta(MangaScraper.ChapterMeta):
+        def _load_pages(self):
+            raise AssertionError('Restored chapters should not be loaded from the site')
+
+    class PageMeta(MangaScraper.PageMeta):
+        def _load_image(self):
+            raise AssertionError('Restored pages should not be loaded from the site')
+
+
+class JobQueueTestCase(unittest.TestCase):
+    SERIES_PATH = '/library/Test Series'
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'jobs.db')
+        self.jobs = JobQueue(self.db_path)
+
+    def tearDown(self):
+        self.jobs._db.close()
+        shutil.rmtree(self.temp_dir)
+
+    @staticmethod
+    def remote_series(chapter_count=2, page_count=3):
+        """
+        Build a remote series with its chapters and pages already loaded
+        :rtype : StubSite.SeriesMeta
+        """
+        series = StubSite.SeriesMeta('http://example.com/test/', 'Test Series', ['Test Alt'])
+        series.site = 'Stub'
+        chapters = []
+        for chapter_no in range(1, chapter_count + 1):
+            chapter = StubSite.ChapterMeta('http://example.com/test/c{no}/'.format(no=chapter_no),
+                                           'Chapter {no}'.format(no=chapter_no), str(chapter_no), series)
+            chapter.restore_pages([StubSite.PageMeta('{url}{no}.html'.format(url=chapter.url, no=page_no),
+                                                     str(page_no), chapter)
+                                   for page_no in range(1, page_count + 1)])
+            chapters.append(chapter)
+        series.restore_chapters(chapters)
+        return series
+
+    def reopen(self):
+        """
+        Open the job database again, as a resumed run in another process would
+        :rtype : JobQueue
+        """
+        self.jobs._db.close()
+        self.jobs = JobQueue(self.db_path)
+        return self.jobs
+
+    def start_chapter(self, series, chapter_no, resolved, completed):
+        """
+        Record a chapter as started, with some of its pages resolved and some of those completed
+        """
+        chapter = series.chapters[chapter_no]
+        self.jobs.record_pages(self.SERIES_PATH, chapter)
+        for page in list(chapter.pages.values())[:resolved]:
+            page.restore_image(MangaScraper.ImageMeta('http://img.example.com/{no}.jpg'.format(no=page.page), page))
+            self.jobs.record_image(self.SERIES_PATH, page)
+        for page in list(chapter.pages.values())[:completed]:
+            self.jobs.complete_page(self.SERIES_PATH, page)
+
+    def test_resume_after_partial_chapter(self):
+        series = self.remote_series()
+        self.jobs.track(self.SERIES_PATH, series)
+        self.start_chapter(series, '1', resolved=2, completed=1)
+
+        jobs = self.reopen()
+        restored = jobs.restore(self.SERIES_PATH, {'Stub': StubSite})
+        self.assertIsNotNone(restored)
+        self.assertEqual(restored.title, 'Test Series')
+        self.assertEqual(restored.alt_titles, ['Test Alt'])
+        self.assertEqual(list(restored.chapters), ['1', '2'])
+
+        # The started chapter keeps its page list and resolved images, only the unfinished pages are left to do
+        self.assertFalse(jobs.chapter_done(self.SERIES_PATH, '1'))
+        self.assertEqual(jobs.done_pages(self.SERIES_PATH, '1'), {'1'})
+        pages = restored.chapters['1'].pages
+        self.assertEqual(list(pages), ['1', '2', '3'])
+        self.assertEqual(pages['2']._image.url, 'http://img.example.com/2.jpg')
+        self.assertIsNone(pages['3']._image)
+
+        # The chapter that wasn't started yet has no pages recorded
+        self.assertEqual(jobs.done_pages(self.SERIES_PATH, '2'), set())
+
+    def test_completed_chapters_are_skipped(self):
+        series = self.remote_series()
+        self.jobs.track(self.SERIES_PATH, series)
+        self.start_chapter(series, '1', resolved=3, completed=3)
+        self.jobs.complete_chapter(self.SERIES_PATH, '1')
+
+        jobs = self.reopen()
+        self.assertTrue(jobs.chapter_done(self.SERIES_PATH, '1'))
+        self.assertFalse(jobs.chapter_done(self.SERIES_PATH, '2'))
+
+    def test_tracking_again_keeps_progress(self):
+        series = self.remote_series()
+        self.jobs.track(self.SERIES_PATH, series)
+        self.start_chapter(series, '1', resolved=2, completed=2)
+        self.jobs.complete_chapter(self.SERIES_PATH, '2')
+
+        # Another run tracks the same series, with a chapter added since
+        self.reopen().track(self.SERIES_PATH, self.remote_series(chapter_count=3))
+
+        self.assertEqual(self.jobs.done_pages(self.SERIES_PATH, '1'), {'1', '2'})
+        self.assertTrue(self.jobs.chapter_done(self.SERIES_PATH, '2'))
+        restored = self.jobs.restore(self.SERIES_PATH, {'Stub': StubSite})
+        self.assertEqual(list(restored.chapters), ['1', '2', '3'])
+
+    def test_cleared_image_is_resolved_again(self):
+        series = self.remote_series()
+        self.jobs.track(self.SERIES_PATH, series)
+        self.start_chapter(series, '1', resolved=2, completed=0)
+        self.jobs.clear_image(self.SERIES_PATH, series.chapters['1'].pages['1'])
+
+        restored = self.reopen().restore(self.SERIES_PATH, {'Stub': StubSite})
+        pages = restored.chapters['1'].pages
+        self.assertIsNone(pages['1']._image)
+        self.assertEqual(pages['2']._image.url, 'http://img.example.com/2.jpg')
+
+    def test_finished_jobs_are_not_resumed(self):
+        self.jobs.track(self.SERIES_PATH, self.remote_series())
+        self.jobs.finish(self.SERIES_PATH)
+
+        self.assertIsNone(self.reopen().restore(self.SERIES_PATH, {'Stub': StubSite}))
+        self.assertFalse(self.jobs.chapter_done(self.SERIES_PATH, '1'))
+
+    def test_unavailable_site_is_not_resumed(self):
+        self.jobs.track(self.SERIES_PATH, self.remote_series())
+
+        self.assertIsNone(self.jobs.restore(self.SERIES_PATH, {}))
@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+import unittest
+from configparser import ConfigParser
+from mangadl.config import Config
+from mangadl.library import LibraryIndex
+
+
+class LibraryIndexTestCase(unittest.TestCase):
+    CHAPTER_PATTERN = r'^\[Chapter (?P<chapter>\d+(\.\d)?)\] - (?P<title>.+)$'
+    PAGE_PATTERN = r'^page-(?P<page>\d+(\.\d)?)\.\w{3,4}$'
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'library.db')
+        self.root_a = os.path.join(self.temp_dir, 'Manga A')
+        self.root_b = os.path.join(self.temp_dir, 'Manga B')
+        os.makedirs(self.root_a)
+        os.makedirs(self.root_b)
+
+        # Every library root shares the one index database
+        self.index_a = LibraryIndex(self.root_a, self.db_path)
+        self.index_b = LibraryIndex(self.root_b, self.db_path)
+
+    def tearDown(self):
+        self.index_a._db.close()
+        self.index_b._db.close()
+        shutil.rmtree(self.temp_dir)
+
+    def create_series(self, root, title, chapters=1, pages=2):
+        """
+        Create a saved series on the filesystem
+        :return: Filesystem path to the series
+        :rtype : str
+        """
+        series_path = os.path.join(root, title)
+        os.makedirs(series_path)
+
+        config = ConfigParser(interpolation=None)
+        config.add_section('Patterns')
+        config.set('Patterns', 'chapter_pattern', self.CHAPTER_PATTERN)
+        config.set('Patterns', 'page_pattern', self.PAGE_PATTERN)
+        with open(Config.series_config_path(series_path), 'w') as config_file:
+            config.write(config_file)
+
+        for chapter_no in range(1, chapters + 1):
+            chapter_path = os.path.join(series_path, '[Chapter {no}] - Untitled'.format(no=chapter_no))
+            os.makedirs(chapter_path)
+            for page_no in range(1, pages + 1):
+                with open(os.path.join(chapter_path, 'page-{no}.jpg'.format(no=page_no)), 'wb') as page_file:
+                    page_file.write(b'\xff\xd8\xff\xd9')
+        return series_path
+
+    @staticmethod
+    def series_paths(index):
+        return sorted(row['path'] for row in index.series())
+
+    def test_reconcile_keeps_other_roots(self):
+        series_a = self.create_series(self.root_a, 'Alpha')
+        series_b = self.create_series(self.root_b, 'Beta')
+
+        self.index_a.reconcile()
+        self.index_b.reconcile()
+        self.index_a.reconcile()
+
+        self.assertEqual(self.series_paths(self.index_a), [series_a])
+        self.assertEqual(self.series_paths(self.index_b), [series_b])
+
+    def test_reconcile_removes_only_missing_series_of_its_root(self):
+        series_a = self.create_series(self.root_a, 'Alpha')
+        series_b = self.create_series(self.root_b, 'Beta')
+        self.create_series(self.root_b, 'Gamma')
+        self.index_a.reconcile()
+        self.index_b.reconcile()
+
+        shutil.rmtree(os.path.join(self.root_b, 'Gamma'))
+        self.index_b.reconcile()
+
+        self.assertEqual(self.series_paths(self.index_b), [series_b])
+        self.assertEqual(self.series_paths(self.index_a), [series_a])
+
+    def test_find_series_is_scoped_to_its_root(self):
+        series_a = self.create_series(self.root_a, 'Alpha')
+        series_b = self.create_series(self.root_b, 'Alpha')
+        self.index_a.reconcile()
+        self.index_b.reconcile()
+
+        self.assertEqual(self.index_a.find_series('alpha')['path'], series_a)
+        self.assertEqual(self.index_b.find_series('ALPHA')['path'], series_b)
+        self.assertIsNone(self.index_a.find_series('Beta'))
+
+    def test_reconcile_indexes_chapters_and_pages(self):
+        self.create_series(self.root_a, 'Alpha', chapters=2, pages=3)
+        self.index_a.reconcile()
+
+        series = self.index_a.find_series('Alpha')
+        chapters = sorted(self.index_a.chapters(series['id']), key=lambda row: row['chapter'])
+        self.assertEqual([row['chapter'] for row in chapters], ['1', '2'])
+        self.assertEqual([row['page_count'] for row in chapters], [3, 3])
+        self.assertEqual(sorted(row['page'] for row in self.index_a.pages(chapters[0]['id'])), ['1', '2', '3'])
+
+    def test_reconcile_series_leaves_the_rest_of_the_index_alone(self):
+        series_a = self.create_series(self.root_a, 'Alpha')
+        series_b = self.create_series(self.root_b, 'Beta')
+        self.index_b.reconcile()
+
+        self.assertTrue(self.index_a.reconcile_series(series_a))
+        self.assertEqual(self.series_paths(self.index_a), [series_a])
+        self.assertEqual(self.series_paths(self.index_b), [series_b])
+
+        # Paths that aren't saved series are dropped from the index instead
+        self.assertFalse(self.index_a.reconcile_series(os.path.join(self.root_a, 'Missing')))